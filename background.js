@@ -7,6 +7,10 @@ let insightsTabId = null;
 // Track whether the extension is active or paused
 let extensionActive = true;
 
+// Identifies this extension instance to the analysis server, which uses it to
+// cancel analyses superseded by newer requests from the same client
+let clientId = null;
+
 console.log("Background script loaded");
 
 // Check if the listening window exists and is still open
@@ -78,7 +82,8 @@ function createListeningWindow() {
             if (latestContent && latestContent.url) {
               chrome.tabs.sendMessage(insightsTabId, {
                 action: 'analyzeUrl',
-                url: latestContent.url
+                url: latestContent.url,
+                ...getPageSignals()
               }).catch(err => {
                 console.log("Error sending initial URL to insights tab:", err);
               });
@@ -119,7 +124,7 @@ function getPageContentScript() {
     url: window.location.href,
     title: document.title,
     text: preview,
-    fullText: text.substring(0, 1000), // Limit to 1000 chars for performance
+    fullText: text.substring(0, 50000), // Long pages are summarized in chunks by the server
     metaDescription: metaDescription,
     mainHeading: mainHeading
   };
@@ -236,6 +241,14 @@ function forceRefresh() {
   return true;
 }
 
+// Cheap page facts the server uses to pick a model for URL research
+function getPageSignals() {
+  return {
+    textLength: latestContent.fullText !== undefined ? latestContent.fullText.length : null,
+    title: latestContent.title || null
+  };
+}
+
 // Trigger Insights analysis for the current URL
 function triggerInsightsAnalysis() {
   console.log("Triggering insights analysis for current URL");
@@ -245,7 +258,8 @@ function triggerInsightsAnalysis() {
     // Send the URL to the Insights tab
     chrome.tabs.sendMessage(insightsTabId, {
       action: 'analyzeUrl',
-      url: latestContent.url
+      url: latestContent.url,
+      ...getPageSignals()
     }).catch(err => {
       console.log("Error sending URL to insights tab:", err);
     });
@@ -416,6 +430,12 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
   if (message.action === 'pageContent') {
     console.log("Content from page:", message.data.url);
     console.log("Text sample:", message.data.text);
+    // Text of the page the user is looking at changed; update its analysis
+    // from the changes rather than from scratch
+    if (extensionActive && sender.tab && sender.tab.active && sender.tab.url === latestContent.url) {
+      updateMonitorTab(message.data);
+      sendPageUpdateToAnalysis(message.data);
+    }
   } else if (message.action === 'getLatestContent') {
     sendResponse(latestContent);
     return true;
@@ -456,7 +476,15 @@ function init() {
   console.log("Initializing extension");
   
   // Check if we previously created a window and get extension active state
-  chrome.storage.local.get(['listeningWindowId', 'extensionActive'], async (data) => {
+  chrome.storage.local.get(['listeningWindowId', 'extensionActive', 'clientId'], async (data) => {
+    // Reuse the stored client ID, or create one the first time
+    if (data.clientId) {
+      clientId = data.clientId;
+    } else {
+      clientId = crypto.randomUUID();
+      chrome.storage.local.set({ 'clientId': clientId });
+    }
+    
     if (data.listeningWindowId) {
       listeningWindowId = data.listeningWindowId;
       console.log("Retrieved stored window ID:", listeningWindowId);
@@ -483,6 +511,40 @@ function init() {
     
     // Start monitoring active tabs regardless
     monitorActiveTabs();
+
+    if (extensionActive) {
+      prefetchOpenTabs();
+    }
+  });
+}
+
+// Ask the server to research all open tabs in the background, so the first
+// visit to the insights tab for each of them is answered from the cache
+function prefetchOpenTabs() {
+  chrome.tabs.query({}, (tabs) => {
+    const urls = tabs
+      .map(tab => tab.url)
+      .filter(url => url && (url.startsWith('http://') || url.startsWith('https://')));
+    if (urls.length === 0) {
+      return;
+    }
+
+    fetch('http://localhost:5000/prefetch', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(clientId ? { 'X-Client-Id': clientId } : {})
+      },
+      // The insights tab renders structured research
+      body: JSON.stringify({ urls: urls.slice(0, 500), format: 'structured' })
+    })
+    .then(response => response.json())
+    .then(data => {
+      console.log(`Prefetching ${data.queued} of ${urls.length} open tabs`);
+    })
+    .catch(error => {
+      console.error('Error prefetching open tabs:', error);
+    });
   });
 }
 
@@ -520,13 +582,20 @@ function sendScreenshotToAnalysis(screenshotData) {
     });
   }
   
-  // Send the screenshot to our Python server
-  fetch('http://localhost:5000/analyze-screenshot', {
+  // Send the page text and screenshot to our Python server, which analyzes
+  // the text first and only falls back to the screenshot when it must
+  fetch('http://localhost:5000/analyze-page', {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
+      ...(clientId ? { 'X-Client-Id': clientId } : {})
     },
     body: JSON.stringify({
+      url: latestContent.url,
+      title: latestContent.title,
+      metaDescription: latestContent.metaDescription,
+      mainHeading: latestContent.mainHeading,
+      fullText: latestContent.fullText,
       screenshot: screenshotData
     })
   })
@@ -537,7 +606,13 @@ function sendScreenshotToAnalysis(screenshotData) {
     return response.json();
   })
   .then(data => {
-    console.log('Image analysis received (full response):', JSON.stringify(data));
+    // A newer request for this page replaced this one; its result will follow
+    if (data.superseded) {
+      console.log('Page analysis superseded by a newer request for this page');
+      return;
+    }
+    
+    console.log(`Page analysis received (${data.mode || 'unknown'} mode):`, JSON.stringify(data));
     
     // Send the analysis results to the analysis tab
     if (analysisTabId) {
@@ -563,6 +638,49 @@ function sendScreenshotToAnalysis(screenshotData) {
   });
 }
 
+// Function to send changed page text to the analysis server, which analyzes
+// only the difference to the text it analyzed last for this page
+function sendPageUpdateToAnalysis(content) {
+  fetch('http://localhost:5000/analyze-page-update', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(clientId ? { 'X-Client-Id': clientId } : {})
+    },
+    body: JSON.stringify({
+      url: content.url,
+      title: content.title,
+      metaDescription: latestContent.metaDescription,
+      mainHeading: latestContent.mainHeading,
+      fullText: content.fullText
+    })
+  })
+  .then(response => {
+    if (!response.ok) {
+      throw new Error(`Server responded with status: ${response.status}`);
+    }
+    return response.json();
+  })
+  .then(data => {
+    // Nothing new to show, or a newer request replaced this one
+    if (data.superseded || data.mode === 'unchanged' || !data.success) {
+      return;
+    }
+    
+    console.log(`Page update analysis received (${data.mode} mode)`);
+    if (analysisTabId) {
+      chrome.tabs.sendMessage(analysisTabId, {
+        action: 'updateAnalysisResult',
+        status: 'complete',
+        result: data.analysis || "No analysis provided"
+      });
+    }
+  })
+  .catch(error => {
+    console.error('Error updating page analysis:', error);
+  });
+}
+
 // Create a context menu option to generate insights
 chrome.runtime.onInstalled.addListener(() => {
   chrome.contextMenus.create({
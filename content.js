@@ -10,7 +10,7 @@ function extractPageContent() {
     url: window.location.href,
     title: document.title,
     text: limitedText,
-    fullText: textContent.substring(0, 1000) // Limit to 1000 chars for performance
+    fullText: textContent.substring(0, 50000) // Long pages are summarized in chunks by the server
   };
 }
 
@@ -31,7 +31,7 @@ window.addEventListener('load', () => {
 // Also send content when page updates significantly
 let lastContent = '';
 setInterval(() => {
-  const currentContent = document.body ? document.body.innerText.substring(0, 1000) : '';
+  const currentContent = document.body ? document.body.innerText.substring(0, 50000) : '';
   if (currentContent !== lastContent) {
     lastContent = currentContent;
     sendContentToBackground();
@@ -13,6 +13,13 @@ document.addEventListener('DOMContentLoaded', function() {
     // Keep track of the last analyzed URL to prevent re-analyzing the same URL
     let lastAnalyzedUrl = '';
     
+    // Client ID created by the background script, sent so the server can
+    // cancel research superseded by a newer request
+    let clientId = null;
+    chrome.storage.local.get('clientId', (data) => {
+      clientId = data.clientId || null;
+    });
+    
     // Function to format time
     function formatTime(date) {
       const hours = date.getHours().toString().padStart(2, '0');
@@ -38,6 +45,165 @@ document.addEventListener('DOMContentLoaded', function() {
       updateTimeElement.textContent = formatTime(new Date());
     }
     
+    // Escape text from the analysis before putting it into HTML
+    function escapeHtml(text) {
+      return String(text)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;');
+    }
+    
+    // Format a structured analysis, already parsed and validated by the server
+    function formatStructuredResults(analysis, url) {
+      const entityName = escapeHtml(analysis.entity);
+      const searchName = encodeURIComponent(analysis.entity);
+      let html = `<div class="company-header">${entityName}</div>`;
+      
+      html += `<div class="section-header">Overview</div>
+      <table>
+        <tr>
+          <th>Website</th>
+          <td><a href="${url}" target="_blank">${url}</a></td>
+        </tr>`;
+      
+      if (analysis.type === 'public_company') {
+        const tickerSymbol = escapeHtml(analysis.ticker || 'N/A');
+        html += `
+        <tr>
+          <th>Type</th>
+          <td>Publicly Traded Company</td>
+        </tr>
+        <tr>
+          <th>Ticker</th>
+          <td>${tickerSymbol}</td>
+        </tr>
+        <tr>
+          <th>Exchange</th>
+          <td>${escapeHtml(analysis.exchange || 'N/A')}</td>
+        </tr>
+        </table>`;
+        
+        html += `<div class="section-header">SEC Filings</div>
+        <table>
+          <tr>
+            <th>Form</th>
+            <th>Date Filed</th>
+            <th>Description</th>
+            <th>Link</th>
+          </tr>`;
+        (analysis.filings || []).forEach(filing => {
+          html += `
+            <tr>
+              <td>${escapeHtml(filing.form)}</td>
+              <td>${escapeHtml(filing.date || 'Recent')}</td>
+              <td>${escapeHtml(filing.description || '')}</td>
+              <td><a href="https://www.sec.gov/edgar/search/#/entityName=${searchName}" target="_blank">View</a></td>
+            </tr>`;
+        });
+        html += `</table>`;
+        
+        if (analysis.segments && analysis.segments.length > 0) {
+          html += `<div class="section-header">Business Segments</div>
+          <table>`;
+          analysis.segments.forEach(segment => {
+            html += `
+            <tr>
+              <td>${escapeHtml(segment)}</td>
+            </tr>`;
+          });
+          html += `</table>`;
+        }
+        
+        html += `
+          <div class="section-header">External Resources</div>
+          <table>
+            <tr>
+              <th>Resource</th>
+              <th>Link</th>
+            </tr>
+            <tr>
+              <td>SEC EDGAR Database</td>
+              <td><a href="https://www.sec.gov/edgar/searchedgar/companysearch" target="_blank">Search for ${entityName}</a></td>
+            </tr>
+            <tr>
+              <td>Yahoo Finance</td>
+              <td><a href="https://finance.yahoo.com/quote/${tickerSymbol}" target="_blank">${tickerSymbol} Quote</a></td>
+            </tr>
+            <tr>
+              <td>Company IR Page</td>
+              <td><a href="${url.split('/').slice(0, 3).join('/')}/investors" target="_blank">Investor Relations</a></td>
+            </tr>
+          </table>`;
+      } else {
+        html += `
+        <tr>
+          <th>Type</th>
+          <td>${escapeHtml(analysis.type.replace(/_/g, ' '))}</td>
+        </tr>
+        </table>`;
+        
+        const rows = [
+          ['Overview', analysis.overview],
+          ['Research Papers', analysis.research_papers],
+          ['Documentation', analysis.documentation],
+          ['Community', analysis.community],
+          ['Competitors', (analysis.competitors || []).join(', ')],
+          ['Target Market', analysis.market_focus]
+        ].filter(row => row[1]);
+        
+        html += `<div class="section-header">Key Research & Resources</div>
+        <table>
+          <tr>
+            <th>Category</th>
+            <th>Details</th>
+          </tr>`;
+        rows.forEach(([category, details]) => {
+          html += `
+            <tr>
+              <td>${category}</td>
+              <td>${escapeHtml(details)}</td>
+            </tr>`;
+        });
+        html += `</table>`;
+        
+        html += `
+          <div class="section-header">External Resources</div>
+          <table>
+            <tr>
+              <th>Platform</th>
+              <th>Link</th>
+            </tr>
+            <tr>
+              <td>Reddit</td>
+              <td><a href="https://www.reddit.com/search/?q=${searchName}" target="_blank">Reddit discussions</a></td>
+            </tr>
+            <tr>
+              <td>Twitter/X</td>
+              <td><a href="https://twitter.com/search?q=${searchName}" target="_blank">Twitter mentions</a></td>
+            </tr>
+            <tr>
+              <td>Quora</td>
+              <td><a href="https://www.quora.com/search?q=${searchName}" target="_blank">Quora questions</a></td>
+            </tr>
+            <tr>
+              <td>Official Website</td>
+              <td><a href="${url}" target="_blank">${url}</a></td>
+            </tr>
+          </table>`;
+      }
+      
+      return html;
+    }
+    
+    // Render a cached or fresh result: structured objects come from the
+    // server, markdown strings from the offline mock below
+    function renderResults(result, url) {
+      return typeof result === 'object' ?
+        formatStructuredResults(result, url) :
+        formatResearchResults(result, url);
+    }
+    
     // Function to format the research results into a nicely structured HTML output
     function formatResearchResults(data, url) {
       try {
@@ -337,7 +503,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Function to perform research on a URL
-    function performResearch(url) {
+    function performResearch(url, pageSignals = {}) {
       // If URL is not valid, don't proceed
       if (!url || url === 'unknown' || url === 'Waiting for URL...') {
         console.log("Invalid URL, not performing research:", url);
@@ -361,7 +527,7 @@ document.addEventListener('DOMContentLoaded', function() {
       // Check if we've already analyzed this URL
       if (analyzedUrls[url]) {
         console.log("Using cached results for:", url);
-        researchResultsElement.innerHTML = formatResearchResults(analyzedUrls[url], url);
+        researchResultsElement.innerHTML = renderResults(analyzedUrls[url], url);
         updateResearchStatus('complete', 'Analysis complete (from cache)');
         return;
       }
@@ -371,9 +537,13 @@ document.addEventListener('DOMContentLoaded', function() {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(clientId ? { 'X-Client-Id': clientId } : {})
         },
         body: JSON.stringify({
-          url: url
+          url: url,
+          format: 'structured',
+          textLength: pageSignals.textLength,
+          title: pageSignals.title
         })
       })
       .then(response => {
@@ -383,10 +553,23 @@ document.addEventListener('DOMContentLoaded', function() {
         return response.json();
       })
       .then(data => {
+        // A newer research request replaced this one; leave the UI to it
+        if (data.superseded) {
+          console.log('Research superseded by a newer request:', url);
+          return;
+        }
+        
         console.log('Research response:', data);
         
-        // Extract and display the answer
-        let answer = data.analysis || 'No analysis provided';
+        // Show errors as they are, without caching them
+        if (!data.success || !data.structured) {
+          researchResultsElement.innerHTML = `<pre>${escapeHtml(data.analysis || 'No analysis provided')}</pre>`;
+          updateResearchStatus('error', 'Analysis failed');
+          return;
+        }
+        
+        // Structured analysis, parsed once on the server
+        const answer = data.structured;
         
         // Save to cache
         analyzedUrls[url] = answer;
@@ -395,7 +578,7 @@ document.addEventListener('DOMContentLoaded', function() {
         chrome.storage.local.set({ 'analyzedUrlsCache': analyzedUrls });
         
         // Update UI with result
-        researchResultsElement.innerHTML = formatResearchResults(answer, url);
+        researchResultsElement.innerHTML = formatStructuredResults(answer, url);
         updateResearchStatus('complete', 'Analysis complete');
       })
       .catch(error => {
@@ -442,7 +625,10 @@ document.addEventListener('DOMContentLoaded', function() {
     chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
       if (message.action === 'analyzeUrl') {
         if (message.url) {
-          performResearch(message.url);
+          performResearch(message.url, {
+            textLength: message.textLength,
+            title: message.title
+          });
         }
         if (sendResponse) sendResponse({received: true});
         return true;
@@ -0,0 +1,202 @@
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+import base64
+import json
+import os
+import threading
+import urllib.parse
+
+from pytabmonitor.AnalysisStorage.DictionaryCodec import DictionaryCodec, get_value_bytes
+
+# A cached analysis is either markdown text or a structured analysis dict.
+AnalysisValue = Union[str, dict]
+
+# Marks a cache file whose values are encoded with a trained dictionary
+COMPRESSED_ENCODING = "zlib-dictionary"
+
+def get_cache_key(url: str) -> str:
+    """
+    Canonical cache key for a URL: scheme, host and path. Query strings
+    and fragments rarely change what the site is about.
+    """
+    try:
+        parsed_url = urllib.parse.urlparse(url)
+    except ValueError:
+        return url
+    if not parsed_url.scheme or not parsed_url.netloc:
+        return url
+    return f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
+
+def get_key_domain(key: str) -> str:
+    return urllib.parse.urlparse(key).netloc
+
+class AnalysisCache:
+    """
+    URL analyses kept in memory and persisted as one JSON object mapping
+    cache key to value, the format url_analysis_cache.json has always had.
+    Writes go to a temporary file that then replaces the old one, so a
+    crash mid-write cannot corrupt the cache.
+
+    With compress, values are saved deflated with a dictionary trained on
+    the cached values, which mostly share headings and templates. The file
+    then holds {"encoding", "dictionaries", "entries"}, each entry a base64
+    value that starts with the version of the dictionary it was encoded
+    with. A dictionary is trained once min_training_values are cached and
+    retrained every retrain_interval puts; values encoded with a dictionary
+    older than the last max_dictionaries are re-encoded. With
+    compress_in_memory, values are also only kept encoded in memory and
+    decoded on every get. Either kind of file loads whatever the settings.
+    """
+    def __init__(
+            self,
+            path: Union[str, Path] = "url_analysis_cache.json",
+            compress: bool = False,
+            compress_in_memory: bool = False,
+            retrain_interval: int = 256,
+            min_training_values: int = 8,
+            max_training_values: int = 2000,
+            max_dictionaries: int = 4):
+        self.path = Path(path)
+        self.compress = compress or compress_in_memory
+        self.compress_in_memory = compress_in_memory
+        self.retrain_interval = retrain_interval
+        self.min_training_values = min_training_values
+        self.max_training_values = max_training_values
+        self.max_dictionaries = max_dictionaries
+        self.codec = DictionaryCodec()
+        self._entries: Dict[str, AnalysisValue] = {}
+        # Encoded values, when compressing
+        self._encoded: Dict[str, bytes] = {}
+        self._puts_since_training = 0
+        # Domains with at least one cached analysis
+        self.domains = set()
+        self._lock = threading.RLock()
+
+    def _keys(self) -> Dict[str, object]:
+        return self._encoded if self.compress_in_memory else self._entries
+
+    def load(self) -> int:
+        """Load entries from disk, returning how many were loaded."""
+        if not self.path.exists():
+            return 0
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        with self._lock:
+            self._entries = {}
+            self._encoded = {}
+            if data.get("encoding") == COMPRESSED_ENCODING and "entries" in data:
+                for version, dictionary in data["dictionaries"].items():
+                    self.codec.add_dictionary(int(version), base64.b64decode(dictionary))
+                for key, encoded in data["entries"].items():
+                    encoded = base64.b64decode(encoded)
+                    if self.compress:
+                        self._encoded[key] = encoded
+                    if not self.compress_in_memory:
+                        self._entries[key] = self.codec.decode(encoded)
+            else:
+                self._entries = data
+                if self.compress:
+                    # Saved before compression was enabled
+                    self._encoded = {
+                        key: self.codec.encode(value) for key, value in data.items()}
+                    if self.compress_in_memory:
+                        self._entries = {}
+                    self.retrain()
+            self.domains = {get_key_domain(key) for key in self._keys()}
+            return len(self._keys())
+
+    def save(self):
+        with self._lock:
+            temporary_path = self.path.with_name(self.path.name + ".tmp")
+            with open(temporary_path, "w") as f:
+                if self.compress:
+                    self.codec.prune(
+                        self.codec.get_version(encoded) for encoded in self._encoded.values())
+                    json.dump({
+                        "encoding": COMPRESSED_ENCODING,
+                        "dictionaries": {
+                            str(version): base64.b64encode(dictionary).decode("ascii")
+                            for version, dictionary in self.codec.dictionaries.items()},
+                        "entries": {
+                            key: base64.b64encode(encoded).decode("ascii")
+                            for key, encoded in self._encoded.items()}
+                    }, f)
+                else:
+                    json.dump(self._entries, f)
+            os.replace(temporary_path, self.path)
+
+    def retrain(self):
+        """Train a new dictionary on the most recently cached values."""
+        with self._lock:
+            items = self.items()
+            if len(items) < self.min_training_values:
+                return
+            self.codec.train(value for _, value in items[-self.max_training_values:])
+            self._puts_since_training = 0
+            # Also re-encode values encoded without a dictionary (version 0)
+            oldest_version = max(self.codec.version - self.max_dictionaries, 0)
+            for key, value in items:
+                encoded = self._encoded.get(key)
+                if encoded is None or self.codec.get_version(encoded) <= oldest_version:
+                    self._encoded[key] = self.codec.encode(value)
+
+    def get(self, key: str) -> Optional[AnalysisValue]:
+        if self.compress_in_memory:
+            encoded = self._encoded.get(key)
+            return self.codec.decode(encoded) if encoded is not None else None
+        return self._entries.get(key)
+
+    def put(self, key: str, value: AnalysisValue, persist: bool = True):
+        with self._lock:
+            if not self.compress_in_memory:
+                self._entries[key] = value
+            if self.compress:
+                self._encoded[key] = self.codec.encode(value)
+                self._puts_since_training += 1
+                if self._puts_since_training >= self.retrain_interval or (
+                        self.codec.version == 0 and
+                        len(self._keys()) >= self.min_training_values):
+                    self.retrain()
+            self.domains.add(get_key_domain(key))
+            if persist:
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"Error saving cache: {str(e)}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys()
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self._keys()))
+
+    def items(self):
+        with self._lock:
+            if self.compress_in_memory:
+                return [
+                    (key, self.codec.decode(encoded))
+                    for key, encoded in self._encoded.items()]
+            return list(self._entries.items())
+
+    def report(self) -> dict:
+        with self._lock:
+            report = {"entries": len(self._keys()), "compressed": self.compress}
+            if not self.compress:
+                return report
+            value_bytes = sum(len(get_value_bytes(value)[1]) for _, value in self.items())
+            encoded_bytes = sum(len(encoded) for encoded in self._encoded.values())
+            report.update({
+                "in_memory": self.compress_in_memory,
+                "dictionary_version": self.codec.version,
+                "dictionaries": len(self.codec.dictionaries),
+                "dictionary_bytes": sum(
+                    len(dictionary) for dictionary in self.codec.dictionaries.values()),
+                "value_bytes": value_bytes,
+                "encoded_bytes": encoded_bytes,
+                "compression_ratio": round(
+                    value_bytes / encoded_bytes, 1) if encoded_bytes else None
+            })
+            return report
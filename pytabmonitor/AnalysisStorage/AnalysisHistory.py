@@ -0,0 +1,472 @@
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Columns stored as dictionary codes into a per-partition list of values
+STRING_COLUMNS = ("url", "domain", "kind", "model")
+NUMERIC_COLUMNS = {
+    "timestamp": np.float64,
+    "latency_seconds": np.float32,
+    "prompt_tokens": np.int32,
+    "completion_tokens": np.int32,
+    "cached": np.bool_,
+}
+
+AGGREGATE_BY = ("domain", "kind", "model")
+
+DAY_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def get_day(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+@dataclass
+class HistoryEvent:
+    """One analysis served, whether by a model or from a cache."""
+    url: str
+    domain: str
+    kind: str
+    model: str = ""
+    latency_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Served from a cache or index rather than by a model call
+    cached: bool = False
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+@dataclass
+class HistoryAggregate:
+    key: str
+    events: int = 0
+    model_calls: int = 0
+    latency_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "events": self.events,
+            "model_calls": self.model_calls,
+            "average_latency_seconds": round(
+                self.latency_seconds / self.model_calls, 3) if self.model_calls else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+class SealedPartition:
+    """
+    One past day of events in columns: numbers as arrays, strings as
+    dictionary codes, so filters and aggregations are vector operations.
+    merged_logs names the sealing logs whose events are in the columns.
+    """
+    def __init__(
+            self,
+            columns: Dict[str, np.ndarray],
+            values: Dict[str, List[str]],
+            merged_logs: Optional[List[str]] = None):
+        self.columns = columns
+        self.values = values
+        self.merged_logs = merged_logs or []
+
+    @classmethod
+    def from_events(
+            cls,
+            events: List[HistoryEvent],
+            merged_logs: Optional[List[str]] = None) -> "SealedPartition":
+        events = sorted(events, key=lambda event: event.timestamp)
+        columns = {
+            name: np.array([getattr(event, name) for event in events], dtype=dtype)
+            for name, dtype in NUMERIC_COLUMNS.items()}
+        values = {}
+        for name in STRING_COLUMNS:
+            codes: Dict[str, int] = {}
+            columns[name] = np.array(
+                [codes.setdefault(getattr(event, name), len(codes)) for event in events],
+                dtype=np.int32)
+            values[name] = list(codes)
+        return cls(columns, values, merged_logs)
+
+    @classmethod
+    def load(cls, path: Path) -> "SealedPartition":
+        with np.load(path) as saved:
+            columns = {
+                name: saved[name] for name in (*NUMERIC_COLUMNS, *STRING_COLUMNS)}
+            values = {
+                name: saved[f"{name}_values"].tolist() for name in STRING_COLUMNS}
+            merged_logs = saved["merged_logs"].tolist() \
+                if "merged_logs" in saved.files else []
+        return cls(columns, values, merged_logs)
+
+    def save_temporary(self, path: Path) -> Path:
+        """Write the columns next to path, returning the file to move there."""
+        temporary_path = path.with_name(path.name + ".tmp.npz")
+        np.savez_compressed(
+            temporary_path,
+            **self.columns,
+            merged_logs=np.array(self.merged_logs, dtype=str),
+            **{
+                f"{name}_values": np.array(values, dtype=str)
+                for name, values in self.values.items()})
+        return temporary_path
+
+    def save(self, path: Path):
+        os.replace(self.save_temporary(path), path)
+
+    def mask(
+            self,
+            start: float,
+            end: float,
+            domain: Optional[str],
+            kind: Optional[str]) -> np.ndarray:
+        timestamps = self.columns["timestamp"]
+        # Rows are sorted by time
+        first, last = np.searchsorted(timestamps, (start, end), side="left")
+        mask = np.zeros(len(timestamps), dtype=bool)
+        mask[first:last] = True
+        for name, value in (("domain", domain), ("kind", kind)):
+            if value is not None:
+                if value not in self.values[name]:
+                    return np.zeros(len(timestamps), dtype=bool)
+                mask &= self.columns[name] == self.values[name].index(value)
+        return mask
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def events(self, rows: np.ndarray) -> Iterator[HistoryEvent]:
+        for row in rows.tolist():
+            event = {
+                name: self.columns[name][row].item() for name in NUMERIC_COLUMNS}
+            event.update({
+                name: self.values[name][self.columns[name][row]]
+                for name in STRING_COLUMNS})
+            yield HistoryEvent(**event)
+
+    def aggregate(self, mask: np.ndarray, by: str, aggregates: Dict[str, HistoryAggregate]):
+        codes = self.columns[by][mask]
+        if len(codes) == 0:
+            return
+        size = len(self.values[by])
+        model_calls = ~self.columns["cached"][mask]
+        sums = {
+            "events": np.bincount(codes, minlength=size),
+            "model_calls": np.bincount(codes, weights=model_calls, minlength=size),
+            "latency_seconds": np.bincount(
+                codes, weights=self.columns["latency_seconds"][mask] * model_calls,
+                minlength=size),
+            "prompt_tokens": np.bincount(
+                codes, weights=self.columns["prompt_tokens"][mask], minlength=size),
+            "completion_tokens": np.bincount(
+                codes, weights=self.columns["completion_tokens"][mask], minlength=size),
+        }
+        for code in np.flatnonzero(sums["events"]).tolist():
+            key = self.values[by][code]
+            aggregate = aggregates.setdefault(key, HistoryAggregate(key))
+            aggregate.events += int(sums["events"][code])
+            aggregate.model_calls += int(sums["model_calls"][code])
+            aggregate.latency_seconds += float(sums["latency_seconds"][code])
+            aggregate.prompt_tokens += int(sums["prompt_tokens"][code])
+            aggregate.completion_tokens += int(sums["completion_tokens"][code])
+
+class AnalysisHistory:
+    """
+    Append-only history of analyses, partitioned by UTC day in directory.
+
+    Events are appended to <day>.jsonl as they are recorded and kept in
+    memory, including late ones recorded after the next day was opened.
+    seal_pending() seals past days: their log is renamed to a .sealing
+    file, its events merged into the compressed columns in <day>.npz, which
+    also lists the sealing file, and the file removed, so a crash at any
+    point neither loses nor repeats events. Given maintenance_seconds, a
+    background thread does this at that interval, off the request path;
+    load() does it on start. Queries only open the partitions that exist in
+    their range, keeping the most recently used max_cached_partitions in
+    memory.
+    """
+    def __init__(
+            self,
+            directory: Union[str, Path] = "analysis_history",
+            max_cached_partitions: int = 64,
+            maintenance_seconds: Optional[float] = None):
+        self.directory = Path(directory)
+        self.max_cached_partitions = max_cached_partitions
+        self.maintenance_seconds = maintenance_seconds
+        self._open_day: Optional[str] = None
+        self._open_events: List[HistoryEvent] = []
+        # Events of past days not sealed yet, and the sealing logs they
+        # were read from
+        self._unsealed: Dict[str, List[HistoryEvent]] = {}
+        self._sealing_logs: Dict[str, List[Path]] = {}
+        self._sealed: "OrderedDict[str, SealedPartition]" = OrderedDict()
+        # Days with a <day>.npz, listed once from directory
+        self._sealed_days: Optional[set] = None
+        self._lock = threading.Lock()
+        self._seal_lock = threading.Lock()
+        self.recorded = 0
+        if maintenance_seconds is not None:
+            self._worker = threading.Thread(
+                target=self._run, name="analysis-history", daemon=True)
+            self._worker.start()
+
+    def _log_path(self, day: str) -> Path:
+        return self.directory / f"{day}.jsonl"
+
+    def _sealed_path(self, day: str) -> Path:
+        return self.directory / f"{day}.npz"
+
+    def _read_log(self, path: Path) -> List[HistoryEvent]:
+        events = []
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    events.append(HistoryEvent(**json.loads(line)))
+                except (TypeError, ValueError):
+                    # A write cut short by a crash
+                    continue
+        return events
+
+    def _merge(
+            self,
+            day: str,
+            events: List[HistoryEvent],
+            merged_logs: List[str]) -> Tuple[SealedPartition, Path]:
+        """Day's columns with events added, written to a temporary file."""
+        path = self._sealed_path(day)
+        if path.exists():
+            existing = SealedPartition.load(path)
+            events = list(existing.events(np.arange(len(existing)))) + events
+            # Only logs still on disk could be merged twice
+            merged_logs = [
+                name for name in existing.merged_logs
+                if (self.directory / name).exists()] + merged_logs
+        partition = SealedPartition.from_events(events, merged_logs)
+        return partition, partition.save_temporary(path)
+
+    def _seal_day(self, day: str):
+        with self._lock:
+            events = list(self._unsealed[day])
+            # Events recorded from now on go to a new log
+            log_path = self._log_path(day)
+            if log_path.exists():
+                sealing_path = self.directory / f"{day}.{time.time_ns()}.sealing"
+                os.replace(log_path, sealing_path)
+                self._sealing_logs.setdefault(day, []).append(sealing_path)
+            sealing_paths = list(self._sealing_logs.get(day, ()))
+        # Compressed without holding the lock, so requests go on
+        partition, temporary_path = self._merge(
+            day, events, [path.name for path in sealing_paths])
+        with self._lock:
+            os.replace(temporary_path, self._sealed_path(day))
+            self._cache_partition(day, partition)
+            self._get_sealed_days().add(day)
+            remaining = self._unsealed[day][len(events):]
+            if remaining:
+                self._unsealed[day] = remaining
+            else:
+                del self._unsealed[day]
+            self._sealing_logs.pop(day, None)
+        for path in sealing_paths:
+            path.unlink(missing_ok=True)
+
+    def seal_pending(self) -> int:
+        """Seal the events of past days, returning how many days it sealed."""
+        with self._seal_lock:
+            with self._lock:
+                days = list(self._unsealed)
+            sealed = 0
+            for day in days:
+                try:
+                    self._seal_day(day)
+                    sealed += 1
+                except OSError as e:
+                    print(f"Error sealing history of {day}: {str(e)}")
+            return sealed
+
+    def _run(self):
+        while True:
+            time.sleep(self.maintenance_seconds)
+            try:
+                self.seal_pending()
+            except Exception as e:
+                print(f"Error maintaining analysis history: {str(e)}")
+
+    def load(self) -> int:
+        """Seal logs of past days and reopen today's, returning its events."""
+        if not self.directory.exists():
+            return 0
+        today = get_day(time.time())
+        with self._lock:
+            # Logs a crash left in the middle of sealing
+            for sealing_path in sorted(self.directory.glob("*.sealing")):
+                day = sealing_path.name.split(".")[0]
+                if not DAY_PATTERN.fullmatch(day):
+                    continue
+                partition = self._partition(day)
+                if partition is not None and \
+                        sealing_path.name in partition.merged_logs:
+                    sealing_path.unlink(missing_ok=True)
+                    continue
+                self._unsealed.setdefault(day, []).extend(
+                    self._read_log(sealing_path))
+                self._sealing_logs.setdefault(day, []).append(sealing_path)
+            for log_path in sorted(self.directory.glob("*.jsonl")):
+                day = log_path.stem
+                events = self._read_log(log_path)
+                if day == today:
+                    self._open_day, self._open_events = day, events
+                else:
+                    self._unsealed.setdefault(day, []).extend(events)
+        self.seal_pending()
+        return len(self._open_events)
+
+    def record(self, event: HistoryEvent):
+        day = get_day(event.timestamp)
+        with self._lock:
+            self.recorded += 1
+            if self._open_day is not None and day < self._open_day:
+                # Late; sealed together with the rest of its day
+                self._unsealed.setdefault(day, []).append(event)
+            else:
+                if day != self._open_day:
+                    if self._open_day is not None:
+                        self._unsealed.setdefault(self._open_day, []).extend(
+                            self._open_events)
+                    self._open_day, self._open_events = day, []
+                self._open_events.append(event)
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(self._log_path(day), "a") as f:
+                    f.write(json.dumps(event.to_dict()) + "\n")
+            except OSError as e:
+                print(f"Error saving history event: {str(e)}")
+
+    def _cache_partition(self, day: str, partition: SealedPartition):
+        self._sealed[day] = partition
+        self._sealed.move_to_end(day)
+        while len(self._sealed) > self.max_cached_partitions:
+            self._sealed.popitem(last=False)
+
+    def _partition(self, day: str) -> Optional[SealedPartition]:
+        partition = self._sealed.get(day)
+        if partition is None:
+            path = self._sealed_path(day)
+            if not path.exists():
+                return None
+            partition = SealedPartition.load(path)
+        self._cache_partition(day, partition)
+        return partition
+
+    def _get_sealed_days(self) -> set:
+        if self._sealed_days is None:
+            self._sealed_days = {
+                path.stem for path in self.directory.glob("*.npz")
+                if DAY_PATTERN.fullmatch(path.stem)}
+        return self._sealed_days
+
+    def _days(self, start: float, end: float) -> List[str]:
+        """Days from start to end with events, oldest first."""
+        if end <= start:
+            return []
+        first, last = get_day(start), get_day(end)
+        days = {day for day in self._get_sealed_days() if first <= day <= last}
+        days.update(day for day in self._unsealed if first <= day <= last)
+        if self._open_day is not None and first <= self._open_day <= last:
+            days.add(self._open_day)
+        return sorted(days)
+
+    def _memory_events(self, day: str) -> List[HistoryEvent]:
+        """Events of day that are not sealed yet."""
+        if day == self._open_day:
+            return self._open_events
+        return self._unsealed.get(day, [])
+
+    def _matches(
+            self,
+            event: HistoryEvent,
+            start: float,
+            end: float,
+            domain: Optional[str],
+            kind: Optional[str]) -> bool:
+        return start <= event.timestamp < end and \
+            (domain is None or event.domain == domain) and \
+            (kind is None or event.kind == kind)
+
+    def query(
+            self,
+            start: float,
+            end: float,
+            domain: Optional[str] = None,
+            kind: Optional[str] = None,
+            limit: int = 100) -> List[HistoryEvent]:
+        """Events from start (inclusive) to end (exclusive), newest first."""
+        events: List[HistoryEvent] = []
+        with self._lock:
+            for day in reversed(self._days(start, end)):
+                if len(events) >= limit:
+                    break
+                events.extend(
+                    event for event in reversed(self._memory_events(day))
+                    if self._matches(event, start, end, domain, kind))
+                if day == self._open_day:
+                    continue
+                partition = self._partition(day)
+                if partition is not None:
+                    rows = np.flatnonzero(partition.mask(start, end, domain, kind))
+                    events.extend(partition.events(rows[::-1][:limit]))
+        # Events not sealed yet may have been recorded out of order
+        events.sort(key=lambda event: event.timestamp, reverse=True)
+        return events[:limit]
+
+    def aggregate(
+            self,
+            start: float,
+            end: float,
+            by: str = "domain",
+            domain: Optional[str] = None,
+            kind: Optional[str] = None) -> List[HistoryAggregate]:
+        """Event counts, model latency and tokens per domain, kind or model."""
+        if by not in AGGREGATE_BY:
+            raise ValueError(f"Cannot aggregate by {by}")
+        aggregates: Dict[str, HistoryAggregate] = {}
+        with self._lock:
+            for day in self._days(start, end):
+                for event in self._memory_events(day):
+                    if not self._matches(event, start, end, domain, kind):
+                        continue
+                    key = getattr(event, by)
+                    aggregate = aggregates.setdefault(key, HistoryAggregate(key))
+                    aggregate.events += 1
+                    if not event.cached:
+                        aggregate.model_calls += 1
+                        aggregate.latency_seconds += event.latency_seconds
+                    aggregate.prompt_tokens += event.prompt_tokens
+                    aggregate.completion_tokens += event.completion_tokens
+                if day == self._open_day:
+                    continue
+                partition = self._partition(day)
+                if partition is not None:
+                    partition.aggregate(partition.mask(start, end, domain, kind), by, aggregates)
+        return sorted(aggregates.values(), key=lambda aggregate: -aggregate.events)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "recorded": self.recorded,
+                "open_day": self._open_day,
+                "open_events": len(self._open_events),
+                "unsealed_days": sorted(self._unsealed),
+                "cached_partitions": len(self._sealed)
+            }
@@ -0,0 +1,108 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import json
+import re
+import struct
+import zlib
+
+# Deflate only looks back 32 KB, so a longer dictionary is never used
+MAX_DICTIONARY_BYTES = 32 * 1024
+
+# Each encoded value starts with the version of the dictionary it needs and
+# whether it is markdown text or a JSON dict
+HEADER = struct.Struct(">HB")
+TEXT_VALUE = 0
+JSON_VALUE = 1
+
+# Dictionaries are built from the lines and sentences values share
+SEGMENT_PATTERN = re.compile(rb"(?<=\n)|(?<=[.!?] )")
+
+class DictionaryVersionError(Exception):
+    """A value needs a dictionary version the codec does not have."""
+
+def get_value_bytes(value) -> Tuple[int, bytes]:
+    # One dict field per line, so fields repeated across values are lines
+    # shared between them, like the lines of markdown analyses
+    if isinstance(value, dict):
+        return JSON_VALUE, json.dumps(value, indent=0).encode("utf-8")
+    return TEXT_VALUE, value.encode("utf-8")
+
+def train_dictionary(samples: Iterable[bytes], size: int = MAX_DICTIONARY_BYTES) -> bytes:
+    """
+    A deflate dictionary of the lines and sentences found in more than one
+    sample, those saving the most (samples containing them times their
+    length) last, where back-references to them are cheapest.
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update(set(SEGMENT_PATTERN.split(sample)))
+    segments = [
+        (count * len(segment), segment) for segment, count in counts.items()
+        if count > 1 and len(segment) > 3]
+    segments.sort(reverse=True)
+    chosen: List[bytes] = []
+    total = 0
+    for _, segment in segments:
+        if total + len(segment) > size:
+            continue
+        chosen.append(segment)
+        total += len(segment)
+    return b"".join(reversed(chosen))
+
+class DictionaryCodec:
+    """
+    Encodes analysis values as raw deflate streams primed with a shared
+    trained dictionary, behind a header naming the dictionary version.
+    Values encoded with an older dictionary still decode as long as its
+    version is kept.
+    """
+    def __init__(self, level: int = 9):
+        self.level = level
+        self.dictionaries: Dict[int, bytes] = {}
+        self.version = 0
+
+    def train(self, values: Iterable, size: int = MAX_DICTIONARY_BYTES) -> int:
+        """Train a new dictionary to encode with, returning its version."""
+        dictionary = train_dictionary((get_value_bytes(value)[1] for value in values), size)
+        self.version = max(self.dictionaries, default=0) + 1
+        self.dictionaries[self.version] = dictionary
+        return self.version
+
+    def add_dictionary(self, version: int, dictionary: bytes):
+        self.dictionaries[version] = dictionary
+        self.version = max(self.version, version)
+
+    def encode(self, value) -> bytes:
+        dictionary = self.dictionaries.get(self.version)
+        if dictionary:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        kind, value_bytes = get_value_bytes(value)
+        return HEADER.pack(self.version, kind) + \
+            compressor.compress(value_bytes) + compressor.flush()
+
+    def get_version(self, data: bytes) -> int:
+        return HEADER.unpack_from(data)[0]
+
+    def decode(self, data: bytes):
+        version, kind = HEADER.unpack_from(data)
+        if version == 0:
+            decompressor = zlib.decompressobj(-15)
+        else:
+            dictionary = self.dictionaries.get(version)
+            if dictionary is None:
+                raise DictionaryVersionError(f"No compression dictionary version {version}")
+            decompressor = zlib.decompressobj(-15, zdict=dictionary) \
+                if dictionary else zlib.decompressobj(-15)
+        value_bytes = decompressor.decompress(data[HEADER.size:]) + decompressor.flush()
+        if kind == JSON_VALUE:
+            return json.loads(value_bytes)
+        return value_bytes.decode("utf-8")
+
+    def prune(self, versions_in_use: Iterable[int]):
+        """Forget dictionaries no encoded value needs any more."""
+        keep = set(versions_in_use) | {self.version}
+        for version in list(self.dictionaries):
+            if version not in keep:
+                del self.dictionaries[version]
@@ -0,0 +1,161 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+import json
+import os
+import threading
+import time
+
+from pytabmonitor.AnalysisStorage.AnalysisCache import AnalysisValue
+from pytabmonitor.AnalysisStorage.StructuredAnalysis import (
+    StructuredAnalysisError,
+    validate_structured_analysis)
+
+DEFAULT_ENTITY_TABLE_PATH = Path(__file__).with_name("domain_entities.jsonl")
+
+def normalize_domain(domain: str) -> str:
+    """Lowercase host name without credentials, port or trailing dot."""
+    domain = domain.rpartition("@")[2].lower()
+    if not domain.startswith("["):
+        domain = domain.partition(":")[0]
+    return domain.rstrip(".")
+
+@dataclass
+class DomainEntity:
+    """
+    A known entity and the domains it owns. analysis, if given, is the
+    canned markdown analysis; otherwise one is built from the fields.
+    """
+    domains: List[str]
+    entity: str
+    type: str = "other"
+    ticker: Optional[str] = None
+    exchange: Optional[str] = None
+    analysis: Optional[str] = None
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DomainEntity":
+        data = dict(data)
+        domains = data.pop("domains", None)
+        if not isinstance(domains, list) or not domains:
+            raise ValueError("Entry has no domains")
+        analysis = data.pop("analysis", None)
+        # Validates entity, type, ticker and exchange like a model answer
+        structured = validate_structured_analysis(data)
+        return cls(
+            domains=[normalize_domain(domain) for domain in domains],
+            entity=structured.entity,
+            type=structured.type,
+            ticker=structured.ticker,
+            exchange=structured.exchange,
+            analysis=analysis,
+            fields=structured.to_dict())
+
+    def analysis_value(self) -> AnalysisValue:
+        """The canned markdown analysis, or the structured fields."""
+        return self.analysis or self.fields
+
+class DomainEntityTable:
+    """
+    Known entities by domain, loaded from a JSON Lines file with one entry
+    per line. A domain matches the entry of its longest suffix in the table
+    on label boundaries, so developer.nvidia.com matches nvidia.com but
+    notnvidia.com does not. A lookup is one dictionary probe per label.
+
+    Lookups check the file for changes at most every
+    reload_interval_seconds and reload it when it changed. A table that
+    fails to load leaves the previous one in place.
+    """
+    def __init__(
+            self,
+            path: Union[str, Path] = DEFAULT_ENTITY_TABLE_PATH,
+            reload_interval_seconds: float = 5.0):
+        self.path = Path(path)
+        self.reload_interval_seconds = reload_interval_seconds
+        self._entries: Dict[str, DomainEntity] = {}
+        self._entity_count = 0
+        self._loaded_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.invalid_lines = 0
+        self.loaded_at: Optional[float] = None
+
+    def _read(self) -> Tuple[Dict[str, DomainEntity], int, int]:
+        entries: Dict[str, DomainEntity] = {}
+        entity_count = 0
+        invalid_lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    entity = DomainEntity.from_dict(json.loads(line))
+                except (ValueError, StructuredAnalysisError) as e:
+                    print(f"Skipping entity table line {line_number}: {str(e)}")
+                    invalid_lines += 1
+                    continue
+                entity_count += 1
+                for domain in entity.domains:
+                    entries[domain] = entity
+        return entries, entity_count, invalid_lines
+
+    def load(self) -> int:
+        """(Re)load the table, returning how many entities it has."""
+        mtime = self.path.stat().st_mtime
+        entries, entity_count, invalid_lines = self._read()
+        with self._lock:
+            # Lookups keep using the old dict until this swap
+            self._entries = entries
+            self._entity_count = entity_count
+            self.invalid_lines = invalid_lines
+            self._loaded_mtime = mtime
+            self.loaded_at = time.time()
+        return entity_count
+
+    def maybe_reload(self) -> bool:
+        """Reload if the file changed, at most every reload_interval_seconds."""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval_seconds:
+            return False
+        self._checked_at = now
+        try:
+            if os.stat(self.path).st_mtime == self._loaded_mtime:
+                return False
+            print(f"Entity table changed; loaded {self.load()} entities")
+            return True
+        except Exception as e:
+            print(f"Error reloading entity table: {str(e)}")
+            return False
+
+    def lookup(self, domain: str) -> Optional[DomainEntity]:
+        self.maybe_reload()
+        domain = normalize_domain(domain)
+        entries = self._entries
+        self.lookups += 1
+        position = 0
+        while position != -1:
+            entity = entries.get(domain[position:])
+            if entity is not None:
+                self.hits += 1
+                return entity
+            position = domain.find(".", position)
+            if position != -1:
+                position += 1
+        return None
+
+    def report(self) -> dict:
+        return {
+            "entities": self._entity_count,
+            "domains": len(self._entries),
+            "invalid_lines": self.invalid_lines,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "loaded_at": self.loaded_at
+        }
+
+    def __len__(self) -> int:
+        return self._entity_count
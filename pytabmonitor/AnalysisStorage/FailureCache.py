@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Optional
+import threading
+import time
+
+import groq
+
+from pytabmonitor.AnalysisStorage.StructuredAnalysis import (
+    StructuredAnalysisError)
+
+RATE_LIMITED = "rate_limited"
+INVALID_INPUT = "invalid_input"
+UPSTREAM_ERROR = "upstream_error"
+INVALID_OUTPUT = "invalid_output"
+OTHER_ERROR = "other"
+
+# Seconds a first failure of each class is remembered. Repeated failures of
+# a key double it, up to FailureCachePolicy.max_ttl_seconds.
+DEFAULT_TTL_SECONDS = {
+    RATE_LIMITED: 30.0,
+    INVALID_INPUT: 600.0,
+    UPSTREAM_ERROR: 15.0,
+    INVALID_OUTPUT: 60.0,
+    OTHER_ERROR: 30.0,
+}
+
+def classify_error(error: Exception) -> str:
+    """Map an exception from a model call onto an error class."""
+    if isinstance(error, StructuredAnalysisError):
+        return INVALID_OUTPUT
+    if isinstance(error, (groq.APIConnectionError, groq.APITimeoutError)):
+        return UPSTREAM_ERROR
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code is not None and status_code >= 500:
+        return UPSTREAM_ERROR
+    if status_code is not None and 400 <= status_code < 500:
+        return INVALID_INPUT
+    return OTHER_ERROR
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class FailureCachePolicy:
+    ttl_seconds: Dict[str, float] = field(
+        default_factory=lambda: dict(DEFAULT_TTL_SECONDS))
+    max_ttl_seconds: float = 3600.0
+    max_entries: int = 4096
+
+@dataclass
+class CachedFailure:
+    error_class: str
+    message: str
+    failures: int
+    expires_at: float
+
+    def retry_after_seconds(self) -> float:
+        return max(0.0, self.expires_at - time.time())
+
+class FailureCache:
+    """
+    Recently failed analyses, so that clients polling a URL whose analysis
+    keeps failing get the error back without another model call. Each
+    failure is remembered for a TTL that depends on its error class and
+    doubles with every consecutive failure of the same key; a success
+    clears the key.
+    """
+    def __init__(self, policy: Optional[FailureCachePolicy] = None):
+        self.policy = policy if policy is not None else FailureCachePolicy()
+        self._entries: "OrderedDict[Hashable, CachedFailure]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.recorded: Dict[str, int] = {}
+
+    def get(self, key: Hashable) -> Optional[CachedFailure]:
+        """The failure remembered for key, or None if there is none left."""
+        with self._lock:
+            failure = self._entries.get(key)
+            if failure is None or failure.expires_at <= time.time():
+                # Expired entries stay until the next failure or eviction,
+                # so that their failure count keeps growing the backoff.
+                return None
+            self.hits[failure.error_class] = \
+                self.hits.get(failure.error_class, 0) + 1
+            return failure
+
+    def record(
+            self,
+            key: Hashable,
+            error_class: str,
+            message: str,
+            retry_after_seconds: Optional[float] = None) -> CachedFailure:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            # Consecutive failures of one class back off; a failure long
+            # after the last one expired starts over.
+            failures = previous.failures + 1 \
+                if previous is not None and \
+                previous.error_class == error_class and \
+                time.time() - previous.expires_at < \
+                    self.policy.max_ttl_seconds else 1
+            ttl = min(
+                self.policy.ttl_seconds.get(
+                    error_class, DEFAULT_TTL_SECONDS[OTHER_ERROR]) *
+                    2 ** (failures - 1),
+                self.policy.max_ttl_seconds)
+            if retry_after_seconds is not None:
+                ttl = max(ttl, retry_after_seconds)
+            failure = CachedFailure(
+                error_class, message, failures, time.time() + ttl)
+            self._entries[key] = failure
+            while len(self._entries) > self.policy.max_entries:
+                self._entries.popitem(last=False)
+            self.recorded[error_class] = self.recorded.get(error_class, 0) + 1
+            return failure
+
+    def record_error(self, key: Hashable, error: Exception) -> CachedFailure:
+        return self.record(
+            key, classify_error(error), str(error), get_retry_after(error))
+
+    def clear(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def report(self) -> dict:
+        now = time.time()
+        with self._lock:
+            active = sum(
+                1 for failure in self._entries.values()
+                if failure.expires_at > now)
+        return {
+            "active": active,
+            "tracked": len(self._entries),
+            "recorded": dict(self.recorded),
+            "hits": dict(self.hits)
+        }
@@ -0,0 +1,338 @@
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+import json
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Not worth a postings list: they match nearly every document.
+STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to",
+    "was", "were", "with"))
+
+SNIPPET_WORDS = 30
+
+# Smaller logs are not worth rewriting outside of load()
+MIN_COMPACTION_RECORDS = 1000
+
+def tokenize(text: str) -> List[str]:
+    return [
+        word for word in WORD_PATTERN.findall(text.lower())
+        if word not in STOP_WORDS]
+
+def make_snippet(text: str, terms: List[str], words: int = SNIPPET_WORDS) -> str:
+    """The run of about `words` words of text with the most query terms."""
+    matches = list(WORD_PATTERN.finditer(text))
+    if not matches:
+        return ""
+    wanted = set(terms)
+    best_start, best_count = 0, 0
+    for start, match in enumerate(matches):
+        if match.group().lower() not in wanted:
+            continue
+        count = len({
+            word.group().lower() for word in matches[start:start + words]
+        } & wanted)
+        if count > best_count:
+            best_start, best_count = start, count
+            if count == len(wanted):
+                break
+    # Start a few words before the first match for context
+    best_start = max(0, best_start - 3)
+    end = min(len(matches), best_start + words)
+    snippet = text[matches[best_start].start():matches[end - 1].end()]
+    snippet = " ".join(snippet.split())
+    if best_start > 0:
+        snippet = "…" + snippet
+    if end < len(matches):
+        snippet += "…"
+    return snippet
+
+@dataclass
+class SearchHit:
+    key: str
+    score: float
+    snippet: str
+
+class FullTextIndex:
+    """
+    Inverted index of documents by key, ranked with BM25.
+
+    Postings (term -> document -> term frequency) are kept in memory.
+    Searched terms also get them as arrays, rebuilt only after the term's
+    postings change, so scoring a common term is a few vector operations
+    rather than a loop over every document containing it.
+
+    The documents themselves are appended to a JSON Lines log at path, and
+    only their offsets are kept, so snippets are read from disk for the hits
+    returned. Adding a key again replaces its document. load() replays the
+    log and rewrites it without replaced documents once they are the
+    majority; add() and remove() start that rewrite in a background thread
+    once the log also has MIN_COMPACTION_RECORDS records. Without a path,
+    documents are kept in memory instead.
+
+    Documents are indexed up to max_document_characters.
+    """
+    def __init__(
+            self,
+            path: Optional[Union[str, Path]] = None,
+            k1: float = 1.2,
+            b: float = 0.75,
+            max_document_characters: int = 20000):
+        self.path = Path(path) if path is not None else None
+        self.k1 = k1
+        self.b = b
+        self.max_document_characters = max_document_characters
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_ids: Dict[str, int] = {}
+        # Postings of searched terms as (document ids, term frequencies)
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._keys: List[Optional[str]] = []
+        self._lengths = np.zeros(0, dtype=np.float32)
+        # Log offset (with a path) or text (without) of each document
+        self._locations: List[Union[int, str, None]] = []
+        self._total_length = 0
+        self._log_records = 0
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._compacting = False
+        self.searches = 0
+
+    def _read_text(self, doc_id: int) -> str:
+        location = self._locations[doc_id]
+        if isinstance(location, str):
+            return location
+        with open(self.path, "rb") as f:
+            f.seek(location)
+            return json.loads(f.readline())["text"]
+
+    def _append(self, record: dict) -> Optional[int]:
+        if self.path is None:
+            return None
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(json.dumps(record).encode("utf-8") + b"\n")
+        self._log_records += 1
+        return offset
+
+    def _unindex(self, doc_id: int):
+        for term in set(tokenize(self._read_text(doc_id))):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                self._arrays.pop(term, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= int(self._lengths[doc_id])
+        self._keys[doc_id] = None
+        self._lengths[doc_id] = 0
+        self._locations[doc_id] = None
+
+    def _index(self, key: str, text: str, offset: Optional[int]):
+        doc_id = self._doc_ids.get(key)
+        if doc_id is not None:
+            self._unindex(doc_id)
+        else:
+            doc_id = len(self._keys)
+            self._doc_ids[key] = doc_id
+            self._keys.append(None)
+            self._locations.append(None)
+            if doc_id == len(self._lengths):
+                lengths = np.zeros(max(64, 2 * doc_id), dtype=np.float32)
+                lengths[:doc_id] = self._lengths
+                self._lengths = lengths
+        terms = tokenize(text)
+        for term, count in Counter(terms).items():
+            self._postings.setdefault(term, {})[doc_id] = count
+            self._arrays.pop(term, None)
+        self._keys[doc_id] = key
+        self._lengths[doc_id] = len(terms)
+        self._locations[doc_id] = text if offset is None else offset
+        self._total_length += len(terms)
+
+    def add(self, key: str, text: str):
+        """Index text under key, replacing any document it had."""
+        text = text[:self.max_document_characters]
+        with self._lock:
+            doc_id = self._doc_ids.get(key)
+            if doc_id is not None and self._read_text(doc_id) == text:
+                return
+            offset = self._append({"key": key, "text": text})
+            self._index(key, text, offset)
+            self._start_compaction_if_needed()
+
+    def remove(self, key: str):
+        with self._lock:
+            doc_id = self._doc_ids.pop(key, None)
+            if doc_id is None:
+                return
+            self._unindex(doc_id)
+            self._append({"key": key, "removed": True})
+            self._start_compaction_if_needed()
+
+    def _needs_compaction(self) -> bool:
+        return self._log_records > 2 * len(self._doc_ids)
+
+    def _start_compaction_if_needed(self):
+        # Called with the lock held
+        if self._compacting or self.path is None or \
+                self._log_records < MIN_COMPACTION_RECORDS or \
+                not self._needs_compaction():
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except OSError as e:
+            print(f"Error compacting search index: {str(e)}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            arrays = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings)))
+            self._arrays[term] = arrays
+        return arrays
+
+    def _best(self, scores: np.ndarray, k: int, prefix: str) -> List[int]:
+        """Ids of the k best scored documents whose key has prefix."""
+        candidates = np.flatnonzero(scores)
+        wanted = k if not prefix else 8 * k
+        while True:
+            if wanted < len(candidates):
+                top = candidates[np.argpartition(-scores[candidates], wanted)[:wanted]]
+            else:
+                top = candidates
+            top = top[np.argsort(-scores[top], kind="stable")].tolist()
+            best = [
+                doc_id for doc_id in top
+                if self._keys[doc_id].startswith(prefix)][:k]
+            if len(best) == k or len(top) == len(candidates):
+                return best
+            wanted *= 8
+
+    def search(self, query: str, k: int = 10, prefix: str = "") -> List[SearchHit]:
+        """The k documents best matching query, limited to keys with prefix."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            self.searches += 1
+            documents = len(self._doc_ids)
+            if not terms or documents == 0:
+                return []
+            average_length = self._total_length / documents
+            k1 = self.k1
+            length_weight = k1 * self.b / average_length
+            constant_weight = k1 * (1 - self.b)
+            scores = np.zeros(len(self._keys), dtype=np.float32)
+            for term in terms:
+                if term not in self._postings:
+                    continue
+                doc_ids, counts = self._term_arrays(term)
+                frequency = len(doc_ids)
+                idf = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+                scores[doc_ids] += idf * counts * (k1 + 1) / (
+                    counts + constant_weight + length_weight * self._lengths[doc_ids])
+            return [
+                SearchHit(
+                    self._keys[doc_id],
+                    float(scores[doc_id]),
+                    make_snippet(self._read_text(doc_id), terms))
+                for doc_id in self._best(scores, k, prefix)]
+
+    def load(self) -> int:
+        """Replay the log at path, returning how many documents it holds."""
+        if self.path is None or not self.path.exists():
+            return 0
+        with self._lock:
+            with open(self.path, "rb") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A write cut short by a crash
+                        offset += len(line)
+                        continue
+                    self._log_records += 1
+                    key = record["key"]
+                    if record.get("removed"):
+                        doc_id = self._doc_ids.pop(key, None)
+                        if doc_id is not None:
+                            self._unindex(doc_id)
+                    else:
+                        self._index(key, record["text"], offset)
+                    offset += len(line)
+            needs_compaction = self._needs_compaction()
+        if needs_compaction:
+            self.compact()
+        return len(self._doc_ids)
+
+    def compact(self):
+        """
+        Rewrite the log with only the current document of each key. The
+        documents are copied without holding the lock; only records
+        appended meanwhile are copied under it, before the swap.
+        """
+        if self.path is None:
+            return
+        with self._compaction_lock:
+            with self._lock:
+                if not self.path.exists():
+                    return
+                documents = [
+                    (doc_id, self._locations[doc_id])
+                    for doc_id in self._doc_ids.values()]
+                end = self.path.stat().st_size
+            temporary_path = self.path.with_name(self.path.name + ".tmp")
+            offsets = {}
+            with open(self.path, "rb") as source, \
+                    open(temporary_path, "wb") as f:
+                # The log is only appended to, so the offsets stay valid
+                for doc_id, location in documents:
+                    source.seek(location)
+                    offsets[doc_id] = f.tell()
+                    f.write(source.readline())
+                with self._lock:
+                    source.seek(end)
+                    appended = source.read()
+                    shift = f.tell() - end
+                    f.write(appended)
+                    f.close()
+                    os.replace(temporary_path, self.path)
+                    # Documents added or replaced meanwhile are in the
+                    # copied records; all others were snapshotted
+                    for doc_id in self._doc_ids.values():
+                        location = self._locations[doc_id]
+                        self._locations[doc_id] = location + shift \
+                            if location >= end else offsets[doc_id]
+                    self._log_records = len(offsets) + appended.count(b"\n")
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._doc_ids),
+                "terms": len(self._postings),
+                "log_records": self._log_records,
+                "searches": self.searches
+            }
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._doc_ids
@@ -0,0 +1,66 @@
+from collections import Counter
+from functools import lru_cache
+from typing import List, Protocol, Sequence
+import hashlib
+import math
+import re
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Words too common to say anything about what a text is about.
+STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to",
+    "was", "were", "with", "www", "com", "http", "https"))
+
+class Embedder(Protocol):
+    """Anything that turns texts into fixed-size vectors, one row per text."""
+    dimensions: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+@lru_cache(maxsize=65536)
+def _feature_bucket(feature: str, dimensions: int):
+    value = int.from_bytes(
+        hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(),
+        "big")
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+class HashingEmbedder:
+    """
+    Offline embedder hashing words and word pairs into signed buckets,
+    weighted by log term frequency and normalized to unit length. Texts
+    sharing vocabulary get a high cosine similarity; it knows nothing of
+    synonyms, but needs no model, no network and no training, and gives the
+    same vector for the same text in every process.
+    """
+    def __init__(self, dimensions: int = 1024, bigram_weight: float = 0.5):
+        self.dimensions = dimensions
+        self.bigram_weight = bigram_weight
+
+    def _features(self, text: str) -> Counter:
+        words = [
+            word for word in WORD_PATTERN.findall(text.lower())
+            if word not in STOP_WORDS and len(word) > 1]
+        features = Counter(words)
+        for first, second in zip(words, words[1:]):
+            features[f"{first} {second}"] += self.bigram_weight
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            columns: List[int] = []
+            values: List[float] = []
+            for feature, count in self._features(text).items():
+                column, sign = _feature_bucket(feature, self.dimensions)
+                columns.append(column)
+                values.append(sign * (1.0 + math.log(count) if count > 1 else count))
+            if columns:
+                np.add.at(vectors[row], columns, values)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
@@ -0,0 +1,184 @@
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+import hashlib
+import os
+import re
+import threading
+
+FINGERPRINT_BITS = 64
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Texts shorter than this have too few shingles for a meaningful SimHash.
+MIN_FINGERPRINT_WORDS = 50
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(),
+        "big")
+
+def simhash(text: str, shingle_size: int = 3) -> Optional[int]:
+    """
+    64-bit SimHash of text over word shingles, or None if text is too short
+    to fingerprint. Texts that differ in a few places get fingerprints that
+    differ in a few bits.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < MIN_FINGERPRINT_WORDS:
+        return None
+    shingles = Counter(
+        " ".join(words[index:index + shingle_size])
+        for index in range(len(words) - shingle_size + 1))
+    weights = [0] * FINGERPRINT_BITS
+    for shingle, count in shingles.items():
+        feature = _feature_hash(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            if feature >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+@dataclass
+class NearDuplicate:
+    key: str
+    fingerprint: int
+    distance: int
+
+class NearDuplicateIndex:
+    """
+    SimHash fingerprints of page text by cache key, answering "which
+    indexed page is within max_distance bits of this one".
+
+    The 64 bits are split into max_distance + 1 blocks, and each block has
+    a table from its value to the fingerprints with that value. Two
+    fingerprints within max_distance bits agree exactly on at least one
+    block, so a lookup only compares against the few fingerprints sharing
+    a block value: a constant number of dictionary lookups however many
+    pages are indexed.
+
+    With a path, fingerprints are appended to a tab-separated file as they
+    are added, and load() reads them back, rewriting the file without
+    replaced fingerprints if it has any.
+    """
+    def __init__(
+            self,
+            path: Optional[Union[str, Path]] = None,
+            max_distance: int = 3):
+        self.path = Path(path) if path is not None else None
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        self._block_bits = -(-FINGERPRINT_BITS // blocks)
+        self._block_mask = (1 << self._block_bits) - 1
+        self._tables: List[Dict[int, List[Tuple[int, str]]]] = [
+            {} for _ in range(blocks)]
+        self._fingerprints: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def _blocks(self, fingerprint: int):
+        for index in range(len(self._tables)):
+            yield index, \
+                fingerprint >> (index * self._block_bits) & self._block_mask
+
+    def _insert(self, key: str, fingerprint: int):
+        previous = self._fingerprints.get(key)
+        if previous == fingerprint:
+            return
+        if previous is not None:
+            for index, block in self._blocks(previous):
+                bucket = self._tables[index][block]
+                bucket.remove((previous, key))
+                if not bucket:
+                    del self._tables[index][block]
+        self._fingerprints[key] = fingerprint
+        for index, block in self._blocks(fingerprint):
+            self._tables[index].setdefault(block, []).append((fingerprint, key))
+
+    def add(self, key: str, fingerprint: int, persist: bool = True):
+        with self._lock:
+            if self._fingerprints.get(key) == fingerprint:
+                return
+            self._insert(key, fingerprint)
+            if persist and self.path is not None:
+                try:
+                    with open(self.path, "a") as f:
+                        f.write(f"{key}\t{fingerprint:016x}\n")
+                except OSError as e:
+                    print(f"Error saving fingerprint: {str(e)}")
+
+    def find(
+            self,
+            fingerprint: int,
+            exclude_key: Optional[str] = None) -> Optional[NearDuplicate]:
+        """The closest indexed page within max_distance bits, if any."""
+        best = None
+        with self._lock:
+            for index, block in self._blocks(fingerprint):
+                for candidate, key in self._tables[index].get(block, ()):
+                    if key == exclude_key:
+                        continue
+                    distance = hamming_distance(fingerprint, candidate)
+                    if distance <= self.max_distance and \
+                            (best is None or distance < best.distance):
+                        best = NearDuplicate(key, candidate, distance)
+            self.lookups += 1
+            if best is not None:
+                self.hits += 1
+        return best
+
+    def load(self) -> int:
+        """Read fingerprints saved by add(); later lines win."""
+        if self.path is None or not self.path.exists():
+            return 0
+        with self._lock:
+            lines = 0
+            with open(self.path, "r") as f:
+                for line in f:
+                    lines += 1
+                    key, _, fingerprint = line.rstrip("\n").rpartition("\t")
+                    # Skip lines cut short by a crash
+                    if not key or len(fingerprint) != FINGERPRINT_BITS // 4:
+                        continue
+                    try:
+                        self._insert(key, int(fingerprint, 16))
+                    except ValueError:
+                        continue
+            if lines > len(self._fingerprints):
+                try:
+                    self._compact()
+                except OSError as e:
+                    print(f"Error compacting fingerprints: {str(e)}")
+            return len(self._fingerprints)
+
+    def _compact(self):
+        """Rewrite the file with one line per page."""
+        temporary_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary_path, "w") as f:
+            for key, fingerprint in self._fingerprints.items():
+                f.write(f"{key}\t{fingerprint:016x}\n")
+        os.replace(temporary_path, self.path)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "pages": len(self._fingerprints),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "max_distance": self.max_distance
+            }
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fingerprints
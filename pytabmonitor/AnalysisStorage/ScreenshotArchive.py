@@ -0,0 +1,276 @@
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple, Union
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+from pytabmonitor.AnalysisStorage.NearDuplicateIndex import NearDuplicateIndex
+
+# Pillow is optional: without it frames are only deduplicated exactly and no
+# thumbnails are written.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+THUMBNAIL_SIZE = (320, 200)
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def get_image_extension(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return ".png"
+    if data.startswith(b"\xff\xd8"):
+        return ".jpg"
+    return ".bin"
+
+def difference_hash(image) -> int:
+    """64-bit perceptual hash: brightness gradients of a 9x8 grayscale."""
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    fingerprint = 0
+    for row in range(8):
+        for column in range(8):
+            fingerprint = fingerprint << 1 | (
+                pixels[row * 9 + column] < pixels[row * 9 + column + 1])
+    return fingerprint
+
+@dataclass
+class Capture:
+    """A screenshot received, and the archived frame that holds it."""
+    url: str
+    client: str
+    frame: str
+    # True if the screenshot was not stored itself but resembles frame
+    reference: bool = False
+    distance: int = 0
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+@dataclass
+class ArchiveStatistics:
+    submitted: int = 0
+    # Dropped because the write queue was full
+    dropped: int = 0
+    stored: int = 0
+    duplicates: int = 0
+    near_duplicates: int = 0
+    evicted: int = 0
+    errors: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class ScreenshotArchive:
+    """
+    Screenshots kept on disk by SHA-256 of their bytes, so a frame sent
+    again is stored once. With Pillow installed, a frame whose perceptual
+    hash is within near_duplicate_distance bits of an archived frame is
+    recorded as a reference to it instead of being stored, and every
+    stored frame gets a JPEG thumbnail.
+
+    Frames and thumbnails together are kept under quota_bytes by deleting
+    the least recently received frames. Each capture (time, URL, client,
+    frame) is appended to captures.jsonl.
+
+    submit() only queues the screenshot; a background thread does the
+    hashing, decoding and writing. When the queue is full, screenshots
+    are dropped rather than slowing requests down.
+    """
+    def __init__(
+            self,
+            directory: Union[str, Path],
+            quota_bytes: int = 512 * 1024 * 1024,
+            near_duplicate_distance: int = 4,
+            queue_size: int = 32,
+            max_recent_captures: int = 10000):
+        self.directory = Path(directory)
+        self.quota_bytes = quota_bytes
+        self.statistics = ArchiveStatistics()
+        # Frame digest -> (file name, bytes on disk), least recent first
+        self._frames: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._fingerprints = NearDuplicateIndex(
+            self.directory / "frame_fingerprints.tsv",
+            max_distance=near_duplicate_distance)
+        self._captures: Deque[Capture] = deque(maxlen=max_recent_captures)
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(
+            target=self._run, name="screenshot-archive", daemon=True)
+        self._worker.start()
+
+    def _frame_directory(self, digest: str) -> Path:
+        return self.directory / "frames" / digest[:2]
+
+    def frame_path(self, digest: str) -> Optional[Path]:
+        with self._lock:
+            frame = self._frames.get(digest)
+        if frame is None:
+            return None
+        return self._frame_directory(digest) / frame[0]
+
+    def thumbnail_path(self, digest: str) -> Optional[Path]:
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        path = self.directory / "thumbnails" / f"{digest}.jpg"
+        return path if path.exists() else None
+
+    def submit(self, image: bytes, url: str = "", client: str = "") -> bool:
+        """Queue a screenshot for archiving; False if it was dropped."""
+        self.statistics.submitted += 1
+        try:
+            self._queue.put_nowait((image, url, client, time.time()))
+            return True
+        except queue.Full:
+            self.statistics.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._archive(*item)
+            except Exception as e:
+                self.statistics.errors += 1
+                print(f"Error archiving screenshot: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _record(self, capture: Capture):
+        self._captures.append(capture)
+        with open(self.directory / "captures.jsonl", "a") as f:
+            f.write(json.dumps(capture.to_dict()) + "\n")
+
+    def _touch(self, digest: str):
+        self._frames.move_to_end(digest)
+        os.utime(self._frame_directory(digest) / self._frames[digest][0])
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(path.name + ".tmp")
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+    def _archive(self, image: bytes, url: str, client: str, timestamp: float):
+        digest = hashlib.sha256(image).hexdigest()
+        with self._lock:
+            if digest in self._frames:
+                self._touch(digest)
+                self.statistics.duplicates += 1
+                self._record(Capture(url, client, digest, timestamp=timestamp))
+                return
+
+        fingerprint = None
+        thumbnail = None
+        if Image is not None:
+            with Image.open(io.BytesIO(image)) as decoded:
+                fingerprint = difference_hash(decoded)
+                decoded.thumbnail(THUMBNAIL_SIZE)
+                buffer = io.BytesIO()
+                decoded.convert("RGB").save(buffer, "JPEG", quality=70)
+                thumbnail = buffer.getvalue()
+
+        with self._lock:
+            if fingerprint is not None:
+                duplicate = self._fingerprints.find(fingerprint)
+                if duplicate is not None and duplicate.key in self._frames:
+                    self._touch(duplicate.key)
+                    self.statistics.near_duplicates += 1
+                    self._record(Capture(
+                        url, client, duplicate.key,
+                        reference=True,
+                        distance=duplicate.distance,
+                        timestamp=timestamp))
+                    return
+
+            name = digest + get_image_extension(image)
+            self._write(self._frame_directory(digest) / name, image)
+            size = len(image)
+            if thumbnail is not None:
+                self._write(self.directory / "thumbnails" / f"{digest}.jpg", thumbnail)
+                size += len(thumbnail)
+            self._frames[digest] = (name, size)
+            self._total_bytes += size
+            if fingerprint is not None:
+                self._fingerprints.add(digest, fingerprint)
+            self.statistics.stored += 1
+            self._record(Capture(url, client, digest, timestamp=timestamp))
+            self._enforce_quota()
+
+    def _enforce_quota(self):
+        while self._total_bytes > self.quota_bytes and len(self._frames) > 1:
+            digest, (name, size) = self._frames.popitem(last=False)
+            (self._frame_directory(digest) / name).unlink(missing_ok=True)
+            (self.directory / "thumbnails" / f"{digest}.jpg").unlink(missing_ok=True)
+            self._total_bytes -= size
+            self.statistics.evicted += 1
+
+    def load(self) -> int:
+        """Index archived frames, least recently received first."""
+        frames = []
+        for path in (self.directory / "frames").glob("*/*"):
+            digest = path.name.partition(".")[0]
+            if not DIGEST_PATTERN.match(digest) or path.name.endswith(".tmp"):
+                continue
+            size = path.stat().st_size
+            thumbnail = self.directory / "thumbnails" / f"{digest}.jpg"
+            if thumbnail.exists():
+                size += thumbnail.stat().st_size
+            frames.append((path.stat().st_mtime, digest, path.name, size))
+        captures_path = self.directory / "captures.jsonl"
+        captures = []
+        if captures_path.exists():
+            with open(captures_path, "r") as f:
+                for line in f:
+                    try:
+                        captures.append(Capture(**json.loads(line)))
+                    except (TypeError, ValueError):
+                        continue
+        with self._lock:
+            for _, digest, name, size in sorted(frames):
+                self._frames[digest] = (name, size)
+                self._total_bytes += size
+            self._captures.extend(captures)
+            self._fingerprints.load()
+            self._enforce_quota()
+            return len(self._frames)
+
+    def captures(self, url: Optional[str] = None, limit: int = 100) -> List[Capture]:
+        """Recent captures, newest first, optionally of one URL only."""
+        with self._lock:
+            recent = list(self._captures)
+        matches = []
+        for capture in reversed(recent):
+            if url is None or capture.url == url:
+                matches.append(capture)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def close(self, timeout: Optional[float] = None):
+        """Finish queued writes and stop the background thread."""
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "frames": len(self._frames),
+                "bytes": self._total_bytes,
+                "quota_bytes": self.quota_bytes,
+                "queued": self._queue.qsize(),
+                "thumbnails": Image is not None,
+                **self.statistics.to_dict()
+            }
@@ -0,0 +1,296 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import json
+import re
+
+ENTITY_TYPES = (
+    "public_company",
+    "private_company",
+    "non_profit",
+    "government",
+    "educational",
+    "open_source",
+    "other")
+
+# Free-text entity types mapped onto ENTITY_TYPES, first match wins.
+ENTITY_TYPE_KEYWORDS = (
+    ("public", "public_company"),
+    ("non-profit", "non_profit"),
+    ("nonprofit", "non_profit"),
+    ("non profit", "non_profit"),
+    ("foundation", "non_profit"),
+    ("government", "government"),
+    ("educational", "educational"),
+    ("university", "educational"),
+    ("open source", "open_source"),
+    ("open-source", "open_source"),
+    ("private", "private_company"),
+    ("company", "private_company"),
+)
+
+KNOWN_EXCHANGES = ("NASDAQ", "NYSE", "AMEX", "OTC", "LSE", "TSX", "HKEX")
+TICKER_PATTERN = re.compile(r"^[A-Z][A-Z0-9.\-]{0,6}$")
+
+# Bounds applied during validation so a verbose model cannot bloat the cache.
+MAX_TEXT_LENGTH = 500
+MAX_LIST_ITEMS = 10
+
+class StructuredAnalysisError(ValueError):
+    """Model output does not match the structured analysis schema."""
+    pass
+
+@dataclass
+class Filing:
+    form: str
+    date: Optional[str] = None
+    description: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        filing_dict = {"form": self.form}
+        if self.date:
+            filing_dict["date"] = self.date
+        if self.description:
+            filing_dict["description"] = self.description
+        return filing_dict
+
+@dataclass
+class StructuredAnalysis:
+    """
+    Analysis of a URL in the fixed schema the insights tab renders from.
+    to_dict() omits empty fields to keep cache entries and responses small.
+    """
+    entity: str
+    type: str = "other"
+    ticker: Optional[str] = None
+    exchange: Optional[str] = None
+    industry: Optional[str] = None
+    overview: Optional[str] = None
+    filings: List[Filing] = field(default_factory=list)
+    segments: List[str] = field(default_factory=list)
+    competitors: List[str] = field(default_factory=list)
+    market_focus: Optional[str] = None
+    research_papers: Optional[str] = None
+    documentation: Optional[str] = None
+    community: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        analysis_dict = {"entity": self.entity, "type": self.type}
+        for name in (
+                "ticker", "exchange", "industry", "overview", "market_focus",
+                "research_papers", "documentation", "community"):
+            value = getattr(self, name)
+            if value:
+                analysis_dict[name] = value
+        if self.filings:
+            analysis_dict["filings"] = [
+                filing.to_dict() for filing in self.filings]
+        if self.segments:
+            analysis_dict["segments"] = self.segments
+        if self.competitors:
+            analysis_dict["competitors"] = self.competitors
+        return analysis_dict
+
+    def to_markdown(self) -> str:
+        """Render in the markdown layout the research prompt asks for."""
+        if self.type == "public_company":
+            lines = [f"# {self.ticker or 'N/A'}: {self.entity}", ""]
+            lines += ["## Company Overview", self.overview or "", ""]
+            lines.append(f"**Exchange:** {self.exchange or 'N/A'}")
+            if self.industry:
+                lines.append(f"**Industry:** {self.industry}")
+            lines.append("")
+            if self.filings:
+                lines.append("## Recent SEC Filings")
+                lines += [
+                    f"- {filing.form}: " + ", ".join(
+                        part for part in (filing.date, filing.description)
+                        if part)
+                    for filing in self.filings]
+                lines.append("")
+            if self.segments:
+                lines.append("## Business Segments")
+                lines += [f"- {segment}" for segment in self.segments]
+                lines.append("")
+        else:
+            entity_type = self.type.replace("_", " ").title()
+            lines = [f"# {self.entity}: {entity_type}", ""]
+            lines += ["## Overview", self.overview or "", ""]
+            lines.append("## Key Research & Resources")
+            lines.append(
+                f"- Research Papers: {self.research_papers or 'None found'}")
+            lines.append(
+                f"- Technical Documentation: {self.documentation or 'None found'}")
+            lines.append(
+                f"- Community Insights: {self.community or 'None found'}")
+            lines.append("")
+            lines.append("## Industry Position")
+            lines.append(
+                f"- Competitors: {', '.join(self.competitors) or 'Unknown'}")
+            lines.append(f"- Market Focus: {self.market_focus or 'Unknown'}")
+            lines.append("")
+        return "\n".join(lines).rstrip() + "\n"
+
+def normalize_entity_type(value: Optional[str]) -> str:
+    if not value:
+        return "other"
+    lowered = value.strip().lower()
+    normalized = lowered.replace(" ", "_").replace("-", "_")
+    if normalized in ENTITY_TYPES:
+        return normalized
+    for keyword, entity_type in ENTITY_TYPE_KEYWORDS:
+        if keyword in lowered:
+            return entity_type
+    return "other"
+
+def _clean_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = str(value)
+    value = value.strip()
+    return value[:MAX_TEXT_LENGTH] if value else None
+
+def _clean_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [part for part in value.split(",")]
+    if not isinstance(value, list):
+        raise StructuredAnalysisError(f"Expected a list, got {value!r}")
+    cleaned = [_clean_text(item) for item in value[:MAX_LIST_ITEMS]]
+    return [item for item in cleaned if item]
+
+def validate_structured_analysis(data: Any) -> StructuredAnalysis:
+    """
+    Check and normalize a decoded JSON analysis. Raises
+    StructuredAnalysisError if it cannot be used.
+    """
+    if not isinstance(data, dict):
+        raise StructuredAnalysisError("Analysis must be a JSON object")
+    entity = _clean_text(data.get("entity"))
+    if entity is None:
+        raise StructuredAnalysisError("Analysis has no entity")
+
+    ticker = _clean_text(data.get("ticker"))
+    if ticker is not None:
+        ticker = ticker.upper().lstrip("$")
+        if not TICKER_PATTERN.match(ticker):
+            ticker = None
+    exchange = _clean_text(data.get("exchange"))
+    if exchange is not None:
+        exchange = exchange.upper()
+        known = [name for name in KNOWN_EXCHANGES if name in exchange]
+        exchange = known[0] if known else exchange
+        if exchange in ("N/A", "NONE", "NULL"):
+            exchange = None
+
+    filings = []
+    raw_filings = data.get("filings") or []
+    if not isinstance(raw_filings, list):
+        raise StructuredAnalysisError("filings must be a list")
+    for raw_filing in raw_filings[:MAX_LIST_ITEMS]:
+        if isinstance(raw_filing, dict) and _clean_text(raw_filing.get("form")):
+            filings.append(Filing(
+                form=_clean_text(raw_filing.get("form")).upper(),
+                date=_clean_text(raw_filing.get("date")),
+                description=_clean_text(raw_filing.get("description"))))
+
+    entity_type = normalize_entity_type(_clean_text(data.get("type")))
+    if ticker is not None and entity_type == "other":
+        entity_type = "public_company"
+
+    return StructuredAnalysis(
+        entity=entity,
+        type=entity_type,
+        ticker=ticker,
+        exchange=exchange,
+        industry=_clean_text(data.get("industry")),
+        overview=_clean_text(data.get("overview")),
+        filings=filings,
+        segments=_clean_list(data.get("segments")),
+        competitors=_clean_list(data.get("competitors")),
+        market_focus=_clean_text(data.get("market_focus")),
+        research_papers=_clean_text(data.get("research_papers")),
+        documentation=_clean_text(data.get("documentation")),
+        community=_clean_text(data.get("community")))
+
+def parse_structured_analysis(text: str) -> StructuredAnalysis:
+    """Decode and validate a model's JSON mode output."""
+    try:
+        data = json.loads(text)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise StructuredAnalysisError(f"Analysis is not valid JSON: {str(e)}")
+    return validate_structured_analysis(data)
+
+def _search(pattern: str, text: str, group: int = 1) -> Optional[str]:
+    match = re.search(pattern, text)
+    return match.group(group).strip() if match else None
+
+def _section_lines(text: str, heading: str) -> List[str]:
+    """Bullet lines of the markdown section whose heading contains heading."""
+    match = re.search(
+        r"^#+[^\n]*" + re.escape(heading) + r"[^\n]*\n(.*?)(?=^#|\Z)",
+        text,
+        re.MULTILINE | re.DOTALL)
+    if not match:
+        return []
+    return [
+        line.strip()[2:].strip() for line in match.group(1).splitlines()
+        if line.strip().startswith(("- ", "* "))]
+
+def _section_paragraph(text: str, heading: str) -> Optional[str]:
+    match = re.search(
+        r"^#+\s*" + re.escape(heading) + r"\s*\n+([^\n#][^\n]*)",
+        text,
+        re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+def structured_from_markdown(text: str, domain: str = "") -> StructuredAnalysis:
+    """
+    Best-effort extraction from a markdown analysis (cached entries made
+    before structured mode, and mock responses), so that clients receive
+    the structured form either way. Mirrors what insights.js used to parse
+    on every render.
+    """
+    is_public = "Stock Ticker Symbol" in text or "NASDAQ:" in text or \
+        "NYSE:" in text or \
+        ("Exchange:" in text and "Exchange: N/A" not in text)
+
+    entity = None
+    entity_type = None
+    ticker = _search(r"[Tt]icker(?: [Ss]ymbol)?[^\w]+([A-Z]{1,5})\b", text)
+    header = re.search(r"^# ([^:\n]+):(.*)$", text, re.MULTILINE)
+    if header:
+        first, second = header.group(1).strip(), header.group(2).strip()
+        if is_public and TICKER_PATTERN.match(first):
+            ticker = ticker or first
+            entity = second or first
+        else:
+            entity, entity_type = first, second
+    if not entity:
+        entity = domain[4:] if domain.startswith("www.") else domain
+        entity = entity or "Unknown Entity"
+
+    filings = []
+    for form in ("10-K", "10-Q", "8-K"):
+        if form in text:
+            filings.append(Filing(
+                form=form,
+                date=_search(re.escape(form) + r"[^:\n]*:([^,\n]+)", text)))
+
+    return validate_structured_analysis({
+        "entity": entity,
+        "type": "public_company" if is_public else entity_type,
+        "ticker": ticker,
+        "exchange": _search(
+            r"[Ee]xchange[^\w]+(NASDAQ|NYSE|AMEX|OTC)", text),
+        "industry": _search(r"\*\*Industry:\*\*\s*([^\n]+)", text),
+        "overview": _section_paragraph(text, "Company Overview") or
+            _section_paragraph(text, "Overview"),
+        "filings": [filing.to_dict() for filing in filings],
+        "segments": _section_lines(text, "Business Segments"),
+        "competitors": _search(r"Competitors:([^\n]+)", text),
+        "market_focus": _search(r"Market Focus:([^\n]+)", text),
+        "research_papers": _search(r"Research Papers:([^\n]+)", text),
+        "documentation": _search(r"Technical Documentation:([^\n]+)", text),
+        "community": _search(r"Community Insights:([^\n]+)", text)})
@@ -0,0 +1,171 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, List, Optional, Tuple
+import difflib
+import json
+import threading
+import time
+import zlib
+
+# A delta replaces lines [start, end) of the previous text with new lines.
+Delta = List[Tuple[int, int, List[str]]]
+
+def make_delta(old_lines: List[str], new_lines: List[str]) -> Delta:
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        (old_start, old_end, new_lines[new_start:new_end])
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+        if tag != "equal"]
+
+def apply_delta(old_lines: List[str], delta: Delta) -> List[str]:
+    new_lines = []
+    position = 0
+    for start, end, lines in delta:
+        new_lines.extend(old_lines[position:start])
+        new_lines.extend(lines)
+        position = end
+    new_lines.extend(old_lines[position:])
+    return new_lines
+
+@dataclass
+class Snapshot:
+    timestamp: float
+    # A base holds the whole text; a delta only the change from the one before
+    is_base: bool
+    data: bytes
+
+@dataclass
+class TextTimeline:
+    snapshots: List[Snapshot] = field(default_factory=list)
+    timestamps: List[float] = field(default_factory=list)
+    last_lines: List[str] = field(default_factory=list)
+    deltas_since_base: int = 0
+    delta_bytes_since_base: int = 0
+    base_bytes: int = 0
+
+class TextSnapshotHistory:
+    """
+    Texts of pages over time by key, for example (client id, URL), stored
+    as a zlib-compressed base snapshot followed by compressed line deltas.
+    A new base is written after rebase_interval deltas, or once the deltas
+    since the last base take more than rebase_ratio of its size, so
+    rebuilding the text at any time decompresses one base and applies at
+    most rebase_interval deltas.
+
+    Each key keeps its latest max_snapshots, dropping its oldest base and
+    deltas together, and the least recently updated keys beyond max_keys
+    are dropped.
+    """
+    def __init__(
+            self,
+            rebase_interval: int = 32,
+            rebase_ratio: float = 0.5,
+            max_snapshots: int = 2048,
+            max_keys: int = 256):
+        self.rebase_interval = rebase_interval
+        self.rebase_ratio = rebase_ratio
+        self.max_snapshots = max_snapshots
+        self.max_keys = max_keys
+        self._timelines: "OrderedDict[Hashable, TextTimeline]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def record(self, key: Hashable, text: str, timestamp: Optional[float] = None) -> bool:
+        """Add a snapshot of text; False if it did not change."""
+        if timestamp is None:
+            timestamp = time.time()
+        lines = text.splitlines(keepends=True)
+        with self._lock:
+            timeline = self._timelines.get(key)
+            if timeline is None:
+                timeline = TextTimeline()
+                self._timelines[key] = timeline
+            elif timeline.snapshots and lines == timeline.last_lines:
+                self._timelines.move_to_end(key)
+                return False
+            self._timelines.move_to_end(key)
+
+            snapshot = None
+            if timeline.snapshots and \
+                    timeline.deltas_since_base < self.rebase_interval:
+                data = zlib.compress(json.dumps(
+                    make_delta(timeline.last_lines, lines)).encode("utf-8"))
+                if timeline.delta_bytes_since_base + len(data) <= \
+                        self.rebase_ratio * timeline.base_bytes:
+                    snapshot = Snapshot(timestamp, False, data)
+                    timeline.deltas_since_base += 1
+                    timeline.delta_bytes_since_base += len(data)
+            if snapshot is None:
+                snapshot = Snapshot(timestamp, True, zlib.compress(text.encode("utf-8")))
+                timeline.deltas_since_base = 0
+                timeline.delta_bytes_since_base = 0
+                timeline.base_bytes = len(snapshot.data)
+
+            timeline.snapshots.append(snapshot)
+            timeline.timestamps.append(timestamp)
+            timeline.last_lines = lines
+            self.raw_bytes += len(text.encode("utf-8"))
+            self.stored_bytes += len(snapshot.data)
+            self._trim(timeline)
+            while len(self._timelines) > self.max_keys:
+                _, dropped = self._timelines.popitem(last=False)
+                self.stored_bytes -= sum(len(old.data) for old in dropped.snapshots)
+            return True
+
+    def _trim(self, timeline: TextTimeline):
+        while len(timeline.snapshots) > self.max_snapshots:
+            # Drop the oldest base with its deltas, keeping a base first
+            end = 1
+            while end < len(timeline.snapshots) and not timeline.snapshots[end].is_base:
+                end += 1
+            if end == len(timeline.snapshots):
+                return
+            self.stored_bytes -= sum(len(old.data) for old in timeline.snapshots[:end])
+            del timeline.snapshots[:end]
+            del timeline.timestamps[:end]
+
+    def text_at(self, key: Hashable, timestamp: Optional[float] = None) -> Optional[str]:
+        """The text as of timestamp (latest if None), or None if unknown."""
+        with self._lock:
+            timeline = self._timelines.get(key)
+            if timeline is None:
+                return None
+            if timestamp is None:
+                return "".join(timeline.last_lines)
+            index = bisect_right(timeline.timestamps, timestamp) - 1
+            if index < 0:
+                return None
+            base = index
+            while not timeline.snapshots[base].is_base:
+                base -= 1
+            chain = timeline.snapshots[base:index + 1]
+        lines = zlib.decompress(chain[0].data).decode("utf-8").splitlines(keepends=True)
+        for snapshot in chain[1:]:
+            lines = apply_delta(lines, json.loads(zlib.decompress(snapshot.data)))
+        return "".join(lines)
+
+    def timeline(self, key: Hashable) -> List[dict]:
+        with self._lock:
+            timeline = self._timelines.get(key)
+            snapshots = list(timeline.snapshots) if timeline else []
+        return [
+            {
+                "timestamp": snapshot.timestamp,
+                "base": snapshot.is_base,
+                "bytes": len(snapshot.data)
+            }
+            for snapshot in snapshots]
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "keys": len(self._timelines),
+                "snapshots": sum(
+                    len(timeline.snapshots) for timeline in self._timelines.values()),
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "compression_ratio": round(
+                    self.raw_bytes / self.stored_bytes, 1) if self.stored_bytes else None
+            }
@@ -0,0 +1,263 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Union
+import os
+import threading
+import time
+
+import numpy as np
+
+# k-means centroids are fitted on at most this many vectors per cluster.
+TRAINING_SAMPLES_PER_CLUSTER = 32
+
+@dataclass
+class VectorMatch:
+    key: str
+    score: float
+
+class VectorIndex:
+    """
+    Unit vectors by key, searched by cosine similarity (a dot product).
+
+    Search is a brute-force matrix product over every vector, which is
+    exact and fast enough for tens of thousands of vectors. From
+    ivf_min_vectors on, an inverted file index can be trained: the vectors
+    are clustered with k-means, and a search only scores the vectors of
+    the n_probe clusters closest to the query. Searches never train; until
+    train() is called they score every vector.
+
+    With a path, save() writes the vectors to a .npz file (as float16) and
+    load() reads them back.
+
+    Given maintenance_seconds, a background thread does both off the
+    request path at that interval: it saves the vectors if they changed
+    and trains the index once it has reached ivf_min_vectors and doubled
+    since it was last trained.
+    """
+    def __init__(
+            self,
+            dimensions: int,
+            path: Optional[Union[str, Path]] = None,
+            ivf_min_vectors: Optional[int] = 50000,
+            n_probe: int = 8,
+            maintenance_seconds: Optional[float] = None):
+        self.dimensions = dimensions
+        self.path = Path(path) if path is not None else None
+        self.ivf_min_vectors = ivf_min_vectors
+        self.n_probe = n_probe
+        self.maintenance_seconds = maintenance_seconds
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        # Inverted file index: cluster centroids and the rows of each cluster
+        self._centroids: Optional[np.ndarray] = None
+        self._clusters: List[List[int]] = []
+        self._row_clusters: List[int] = []
+        self._trained_size = 0
+        # Rows added or replaced while train() clusters a snapshot
+        self._changed_rows: Optional[Set[int]] = None
+        # Vectors changed since the last save
+        self._unsaved = False
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self.searches = 0
+        if maintenance_seconds is not None:
+            self._worker = threading.Thread(
+                target=self._run, name="vector-index", daemon=True)
+            self._worker.start()
+
+    def _grow(self, size: int):
+        if size <= len(self._vectors):
+            return
+        capacity = max(size, 2 * len(self._vectors), 64)
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        vectors[:len(self._keys)] = self._vectors[:len(self._keys)]
+        self._vectors = vectors
+
+    def _assign(self, row: int):
+        cluster = int(np.argmax(self._centroids @ self._vectors[row]))
+        if row < len(self._row_clusters):
+            self._clusters[self._row_clusters[row]].remove(row)
+            self._row_clusters[row] = cluster
+        else:
+            self._row_clusters.append(cluster)
+        self._clusters[cluster].append(row)
+
+    def add(self, key: str, vector: np.ndarray):
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self._keys)
+                self._grow(row + 1)
+                self._keys.append(key)
+                self._rows[key] = row
+            self._vectors[row] = vector
+            self._unsaved = True
+            if self._centroids is not None:
+                self._assign(row)
+            if self._changed_rows is not None:
+                self._changed_rows.add(row)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(key)
+            return None if row is None else self._vectors[row].copy()
+
+    def train(self, n_clusters: Optional[int] = None, iterations: int = 10):
+        """
+        Cluster the vectors for inverted file search (spherical k-means).
+        A snapshot is clustered without holding the lock, so searches and
+        additions go on meanwhile.
+        """
+        with self._lock:
+            if self._changed_rows is not None:
+                # Already training
+                return
+            size = len(self._keys)
+            vectors = self._vectors[:size].copy()
+            self._changed_rows = set()
+        try:
+            if n_clusters is None:
+                n_clusters = max(1, int(np.sqrt(size)))
+            n_clusters = min(n_clusters, size)
+            if n_clusters == 0:
+                return
+            generator = np.random.default_rng(0)
+            # Centroids are fitted on a sample; every vector is assigned after
+            sample = vectors[generator.choice(
+                size, min(size, n_clusters * TRAINING_SAMPLES_PER_CLUSTER),
+                replace=False)]
+            centroids = sample[
+                generator.choice(len(sample), n_clusters, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                # Empty clusters keep their previous centroid
+                centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            clusters: List[List[int]] = [[] for _ in range(n_clusters)]
+            for row, cluster in enumerate(assignments.tolist()):
+                clusters[cluster].append(row)
+            with self._lock:
+                self._centroids = centroids.astype(np.float32)
+                self._clusters = clusters
+                self._row_clusters = assignments.tolist()
+                self._trained_size = size
+                # Rows added or replaced after the snapshot
+                for row in sorted(self._changed_rows | set(range(size, len(self._keys)))):
+                    self._assign(row)
+        finally:
+            with self._lock:
+                self._changed_rows = None
+
+    def needs_training(self) -> bool:
+        with self._lock:
+            size = len(self._keys)
+            return self.ivf_min_vectors is not None and \
+                size >= self.ivf_min_vectors and \
+                (self._centroids is None or size >= 2 * self._trained_size)
+
+    def _candidate_rows(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        """Rows to score, or None to score every row."""
+        size = len(self._keys)
+        if self.ivf_min_vectors is None or size < self.ivf_min_vectors or \
+                self._centroids is None:
+            return None
+        closest = np.argsort(self._centroids @ vector)[::-1][:self.n_probe]
+        return np.fromiter(
+            (row for cluster in closest for row in self._clusters[cluster]),
+            dtype=np.int64)
+
+    def search(
+            self,
+            vector: np.ndarray,
+            k: int = 5,
+            min_score: float = -1.0,
+            exclude_keys: Iterable[str] = ()) -> List[VectorMatch]:
+        """The k vectors most similar to vector, best first."""
+        excluded = set(exclude_keys)
+        with self._lock:
+            self.searches += 1
+            rows = self._candidate_rows(vector)
+            if rows is None:
+                scores = self._vectors[:len(self._keys)] @ vector
+                rows = np.arange(len(scores))
+            else:
+                scores = self._vectors[rows] @ vector
+            wanted = min(k + len(excluded), len(scores))
+            if wanted == 0:
+                return []
+            best = np.argpartition(-scores, wanted - 1)[:wanted]
+            best = best[np.argsort(-scores[best])]
+            matches = []
+            for index in best.tolist():
+                key = self._keys[int(rows[index])]
+                score = float(scores[index])
+                if score < min_score or len(matches) == k:
+                    break
+                if key not in excluded:
+                    matches.append(VectorMatch(key, score))
+            return matches
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                keys = np.array(self._keys, dtype=str)
+                vectors = self._vectors[:len(self._keys)].astype(np.float16)
+                self._unsaved = False
+            # Written without holding the lock, so searches go on
+            temporary_path = self.path.with_name(self.path.name + ".tmp.npz")
+            try:
+                np.savez(temporary_path, keys=keys, vectors=vectors)
+                os.replace(temporary_path, self.path)
+            except Exception:
+                self._unsaved = True
+                raise
+
+    def save_if_changed(self) -> bool:
+        """Save if vectors changed since the last save; whether it saved."""
+        if self.path is None or not self._unsaved:
+            return False
+        self.save()
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.maintenance_seconds)
+            try:
+                if self.needs_training():
+                    self.train()
+                self.save_if_changed()
+            except Exception as e:
+                print(f"Error maintaining vector index: {str(e)}")
+
+    def load(self) -> int:
+        """Load vectors saved by save(), returning how many were loaded."""
+        if self.path is None or not self.path.exists():
+            return 0
+        with np.load(self.path) as saved:
+            keys = saved["keys"].tolist()
+            vectors = saved["vectors"].astype(np.float32)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self.add(key, vector)
+            # Loaded vectors are saved already
+            self._unsaved = False
+            return len(keys)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "vectors": len(self._keys),
+                "dimensions": self.dimensions,
+                "clusters": len(self._clusters) if self._centroids is not None else 0,
+                "searches": self.searches
+            }
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
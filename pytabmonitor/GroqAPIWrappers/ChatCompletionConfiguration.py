@@ -1,16 +1,41 @@
-from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
-
-@dataclass
+from dataclasses import dataclass, field, fields
+from typing import Optional, List, Dict, Any, Sequence
+import json
+
+# The classes below are frozen so they can be hashed and used as cache keys.
+# Each one builds its API payload once, in __post_init__, and to_dict()
+# returns that payload, so a configuration with many tools costs nothing to
+# serialize per request. The payloads are shared: do not modify them. Use
+# dataclasses.replace() to derive a changed copy.
+
+def _freeze_list(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def _normalize_number(value):
+    # 1 and 1.0 compare equal, so they must serialize alike
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+@dataclass(frozen=True, slots=True)
 class ParameterProperty:
     name: str
     type: str
     description: Optional[str] = None
-    enum: Optional[List[str]] = None
+    enum: Optional[Sequence[str]] = None
     required: bool = True
+    _payload: Dict[str, Any] = field(
+        init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "enum", _freeze_list(self.enum))
+        object.__setattr__(self, "_payload", self._build_payload())
 
     def to_dict(self) -> dict[str, Any]:
         """Convert to API-compatible dictionary"""
+        return self._payload
+
+    def _build_payload(self) -> dict[str, Any]:
         property_dict = {
             "type": self.type
         }
@@ -19,15 +44,24 @@ class ParameterProperty:
             property_dict["description"] = self.description
             
         if self.enum is not None:
-            property_dict["enum"] = self.enum
+            property_dict["enum"] = list(self.enum)
             
         return property_dict
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FunctionParameters:
-    properties: List[ParameterProperty]
+    properties: Sequence[ParameterProperty]
+    _payload: Dict[str, Any] = field(
+        init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "properties", tuple(self.properties))
+        object.__setattr__(self, "_payload", self._build_payload())
 
     def to_dict(self) -> Dict[str, Any]:
+        return self._payload
+
+    def _build_payload(self) -> Dict[str, Any]:
         properties = {}
         required = []
         
@@ -42,31 +76,50 @@ class FunctionParameters:
             "required": required
         }
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FunctionDefinition:
     name: str
     description: str
     parameters: FunctionParameters
+    _payload: Dict[str, Any] = field(
+        init=False, default=None, repr=False, compare=False)
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {
+    def __post_init__(self):
+        object.__setattr__(self, "_payload", {
             "name": self.name,
             "description": self.description,
             "parameters": self.parameters.to_dict()
-        }
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._payload
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Tool:
     type: str = "function"
     function: FunctionDefinition = None
+    _payload: Dict[str, Any] = field(
+        init=False, default=None, repr=False, compare=False)
+    _key: str = field(init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        payload = {"type": self.type}
+        if self.function is not None:
+            payload["function"] = self.function.to_dict()
+        object.__setattr__(self, "_payload", payload)
+
+    @property
+    def key(self) -> str:
+        """Canonical JSON of the payload, built on first use."""
+        if self._key is None:
+            object.__setattr__(
+                self, "_key", json.dumps(self._payload, sort_keys=True))
+        return self._key
 
     def to_dict(self) -> Dict[str, Any]:
-        return {
-            "type": self.type,
-            "function": self.function.to_dict()
-        }
+        return self._payload
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ChatCompletionConfiguration:
     """
     See
@@ -93,7 +146,7 @@ class ChatCompletionConfiguration:
     # string / array or null Optional
     # Up to 4 sequences where API will stop generating further tokens. The
     # returned text will not contain the stop sequence.
-    stop: Optional[List[str]] = None
+    stop: Optional[Sequence[str]] = None
     # integer or null Optional Defaults to 1
     # How many chat completion choices to generate for each input message.
     # Note that current moment, only n=1 is supported. Other values will
@@ -112,7 +165,7 @@ class ChatCompletionConfiguration:
     response_model: Optional[Any] = None
 
     # Tool use parameters
-    tools: Optional[List[Tool]] = None
+    tools: Optional[Sequence[Tool]] = None
     tool_choice: Optional[str] = None
     parallel_tool_calls: Optional[bool] = None
 
@@ -120,8 +173,47 @@ class ChatCompletionConfiguration:
     # top_p number or null Optional Defaults to 1.
     # "We generally recommend altering this or temperature but not both."
 
+    _payload: Dict[str, Any] = field(
+        init=False, default=None, repr=False, compare=False)
+    _key: str = field(init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "stop", _freeze_list(self.stop))
+        object.__setattr__(self, "tools", _freeze_list(self.tools))
+        object.__setattr__(self, "_payload", self._build_payload())
+
+    def __hash__(self) -> int:
+        # From the fields __eq__ compares, so equal configurations hash alike
+        return hash(tuple(
+            frozenset(value.items()) if isinstance(value, dict) else value
+            for value in (
+                getattr(self, each.name) for each in fields(self) if each.compare)))
+
+    @property
+    def key(self) -> str:
+        """
+        Stable string identifying the request parameters, built on first
+        use (dataclasses.replace() copies stay cheap) from the keys the
+        tools already cache.
+        """
+        if self._key is None:
+            payload = {
+                name: _normalize_number(value)
+                for name, value in self._payload.items()}
+            payload.pop("tools", None)
+            tool_keys = [tool.key for tool in self.tools or ()]
+            object.__setattr__(self, "_key", "|".join(
+                [json.dumps(payload, sort_keys=True, default=repr)] +
+                tool_keys))
+        return self._key
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert configuration to API-compatible dictionary"""
+        # Shallow copy, since callers unpack it into keyword arguments and
+        # may add their own; nested tool payloads stay shared.
+        return dict(self._payload)
+
+    def _build_payload(self) -> Dict[str, Any]:
         config_dict = {
             "model": self.model,
             "n": self.n,
@@ -135,9 +227,9 @@ class ChatCompletionConfiguration:
         if self.max_tokens is not None:
             config_dict["max_tokens"] = self.max_tokens
         if self.stop is not None:
-            config_dict["stop"] = self.stop
+            config_dict["stop"] = list(self.stop)
         if self.response_format is not None:
-            config_dict["response_format"] = self.response_format
+            config_dict["response_format"] = dict(self.response_format)
         if self.response_model is not None:
             config_dict["response_model"] = self.response_model
 
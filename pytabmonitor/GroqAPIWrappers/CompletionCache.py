@@ -0,0 +1,263 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, List, Optional, Union
+import hashlib
+import json
+import os
+import threading
+import time
+
+from groq.types.chat import ChatCompletion
+
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import (
+    ChatCompletionConfiguration)
+
+# Long strings (base64 images) are fed to the hash in pieces of this many
+# characters instead of being encoded in one copy.
+HASH_CHUNK_CHARACTERS = 1 << 20
+
+# Whether the last completion requested in this context was answered from a
+# completion cache, so that callers timing the call can leave it out.
+completion_cache_hit: ContextVar[bool] = ContextVar(
+    "completion_cache_hit", default=False)
+
+def _update_text(digest, text: str):
+    # Length prefix, so that field boundaries cannot be shifted around.
+    digest.update(f"{len(text)}:".encode("ascii"))
+    for start in range(0, len(text), HASH_CHUNK_CHARACTERS):
+        digest.update(
+            text[start:start + HASH_CHUNK_CHARACTERS].encode("utf-8"))
+
+def hash_messages(messages: List[dict]) -> str:
+    """
+    Stable digest of chat messages. Text and image URLs are streamed into
+    the hash; other message fields (tool calls, names) are hashed as
+    canonical JSON.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for message in messages:
+        _update_text(digest, message.get("role", ""))
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                part_type = part.get("type", "")
+                _update_text(digest, part_type)
+                if part_type == "text":
+                    _update_text(digest, part.get("text", ""))
+                elif part_type == "image_url":
+                    _update_text(digest, part["image_url"]["url"])
+                else:
+                    _update_text(
+                        digest, json.dumps(part, sort_keys=True, default=str))
+        else:
+            _update_text(digest, "" if content is None else str(content))
+        others = {
+            name: value for name, value in message.items()
+            if name not in ("role", "content")}
+        _update_text(digest, json.dumps(others, sort_keys=True, default=str))
+    return digest.hexdigest()
+
+@dataclass
+class CompletionCachePolicy:
+    """
+    Which requests may be answered from the cache. By default only
+    deterministic ones: temperature 0, one choice, no streaming. Set
+    allow_sampled where reusing a sampled answer is acceptable.
+    """
+    allow_sampled: bool = False
+    ttl_seconds: float = 24 * 60 * 60
+    max_memory_entries: int = 512
+    max_disk_bytes: int = 64 * 1024 * 1024
+
+    def is_cacheable(self, configuration: ChatCompletionConfiguration) -> bool:
+        if configuration.stream or configuration.n != 1:
+            return False
+        return self.allow_sampled or configuration.temperature == 0
+
+class CompletionCacheStatistics:
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def to_dict(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": round(
+                (self.memory_hits + self.disk_hits) / lookups, 3)
+                if lookups else None
+        }
+
+class CompletionCache:
+    """
+    Completions keyed by a hash of the messages and the effective
+    configuration. Recent entries are kept in memory (LRU); with a
+    directory, completions are also written there as JSON, one file per
+    key, and survive restarts. Both tiers expire entries after
+    policy.ttl_seconds. The directory is scanned once on start; after that
+    its size is tracked as entries are written and deleted.
+    """
+    def __init__(
+            self,
+            directory: Optional[Union[str, Path]] = None,
+            policy: Optional[CompletionCachePolicy] = None):
+        self.policy = policy if policy is not None else CompletionCachePolicy()
+        self.directory = Path(directory) if directory is not None else None
+        self.statistics = CompletionCacheStatistics()
+        self._entries = OrderedDict()
+        # Sizes of the files on disk by key, oldest first
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+
+    def make_key(
+            self,
+            messages: List[dict],
+            configuration: ChatCompletionConfiguration) -> Optional[str]:
+        """Cache key for a request, or None if the policy bypasses it."""
+        if not self.policy.is_cacheable(configuration):
+            self.statistics.bypassed += 1
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(hash_messages(messages).encode("ascii"))
+        digest.update(configuration.key.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _is_fresh(self, created: float) -> bool:
+        return time.time() - created < self.policy.ttl_seconds
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, result = entry
+                if self._is_fresh(created):
+                    self._entries.move_to_end(key)
+                    self.statistics.memory_hits += 1
+                    return result
+                del self._entries[key]
+
+        result = self._read_disk(key)
+        if result is None:
+            self.statistics.misses += 1
+            return None
+        self.statistics.disk_hits += 1
+        return result
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error reading completion cache entry {key}: {str(e)}")
+            return None
+        if not self._is_fresh(stored["created"]):
+            self._delete_disk_entry(key)
+            return None
+        result = ChatCompletion.model_validate(stored["completion"])
+        self._remember(key, stored["created"], result)
+        return result
+
+    def _remember(self, key: str, created: float, result: Any):
+        with self._lock:
+            self._entries[key] = (created, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.policy.max_memory_entries:
+                self._entries.popitem(last=False)
+                self.statistics.evictions += 1
+
+    def put(self, key: str, result: Any):
+        created = time.time()
+        self._remember(key, created, result)
+        self.statistics.stores += 1
+        # Only API responses (pydantic models) go to disk; other backends'
+        # results are kept in memory.
+        if self.directory is None or not hasattr(result, "model_dump"):
+            return
+        path = self._path(key)
+        temporary_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(temporary_path, "w") as f:
+                json.dump({
+                    "created": created,
+                    "completion": result.model_dump(mode="json")
+                }, f)
+                size = f.tell()
+            os.replace(temporary_path, path)
+        except OSError as e:
+            print(f"Error writing completion cache entry {key}: {str(e)}")
+            return
+        with self._lock:
+            self._disk_bytes += size - self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+        self._enforce_disk_bound()
+
+    def _delete_disk_entry(self, key: str):
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+        self._path(key).unlink(missing_ok=True)
+
+    def _enforce_disk_bound(self):
+        """Delete the oldest files until the directory fits max_disk_bytes."""
+        while True:
+            with self._lock:
+                if self._disk_bytes <= self.policy.max_disk_bytes or \
+                        not self._disk_entries:
+                    return
+                key, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                self.statistics.evictions += 1
+            try:
+                self._path(key).unlink(missing_ok=True)
+            except OSError as e:
+                print(f"Error deleting completion cache entry {key}: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._disk_entries.clear()
+            self._disk_bytes = 0
+        if self.directory is not None:
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def report(self) -> dict:
+        report = self.statistics.to_dict()
+        report["memory_entries"] = len(self._entries)
+        report["disk_entries"] = len(self._disk_entries)
+        report["disk_bytes"] = self._disk_bytes
+        return report
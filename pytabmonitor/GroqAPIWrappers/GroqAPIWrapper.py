@@ -1,39 +1,151 @@
 # ABC stands for Abstract Base Class.
 from abc import ABC, abstractmethod
+from dataclasses import replace
+from typing import Optional
 from groq import AsyncGroq, Groq
 from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import ChatCompletionConfiguration
+from pytabmonitor.GroqAPIWrappers.CompletionCache import (
+    CompletionCache,
+    completion_cache_hit)
+from pytabmonitor.GroqAPIWrappers.HedgedRequests import (
+    HedgingPolicy,
+    RequestHedger)
+from pytabmonitor.GroqAPIWrappers.ModelBackends import (
+    ModelCapabilities,
+    ModelDescription)
+from pytabmonitor.GroqAPIWrappers.ToolExecution import ToolExecutor
+
+# See https://console.groq.com/docs/models and
+# https://groq.com/pricing for context windows and prices.
+GROQ_MODELS = (
+    ModelDescription(
+        name="llama-3.3-70b-versatile",
+        capabilities=ModelCapabilities(
+            json_mode=True, tools=True, streaming=True),
+        context_window=128000,
+        input_cost_per_million_tokens=0.59,
+        output_cost_per_million_tokens=0.79,
+        expected_latency_seconds=2.0),
+    ModelDescription(
+        name="llama-3.1-8b-instant",
+        capabilities=ModelCapabilities(
+            json_mode=True, tools=True, streaming=True),
+        context_window=128000,
+        input_cost_per_million_tokens=0.05,
+        output_cost_per_million_tokens=0.08,
+        expected_latency_seconds=0.5),
+    ModelDescription(
+        name="llama-3.2-11b-vision-preview",
+        capabilities=ModelCapabilities(
+            vision=True, json_mode=True, tools=True, streaming=True),
+        context_window=8192,
+        input_cost_per_million_tokens=0.18,
+        output_cost_per_million_tokens=0.18,
+        expected_latency_seconds=1.5),
+    ModelDescription(
+        name="llama-3.2-90b-vision-preview",
+        capabilities=ModelCapabilities(
+            vision=True, json_mode=True, tools=True, streaming=True),
+        context_window=8192,
+        input_cost_per_million_tokens=0.90,
+        output_cost_per_million_tokens=0.90,
+        expected_latency_seconds=3.0),
+)
 
 class BaseGroqWrapper(ABC):
+    # Name and models this backend declares to ModelBackendRegistry.
+    backend_name = "groq"
+    models: tuple[ModelDescription, ...] = GROQ_MODELS
+
     def __init__(self, api_key: str):
         self.configuration = ChatCompletionConfiguration()
         self.client = self._create_client(api_key)
+        # Set through enable_completion_cache(); None means no caching.
+        self.completion_cache: Optional[CompletionCache] = None
+
+    def enable_completion_cache(self, cache: CompletionCache):
+        """Answer repeated requests that cache.policy allows from cache."""
+        self.completion_cache = cache
+
+    def disable_completion_cache(self):
+        self.completion_cache = None
+
+    def _get_cached_completion(
+            self,
+            messages: list[dict],
+            configuration: ChatCompletionConfiguration):
+        """
+        Return (cache key or None, cached completion or None), and set
+        completion_cache_hit accordingly.
+        """
+        completion_cache_hit.set(False)
+        if self.completion_cache is None:
+            return None, None
+        key = self.completion_cache.make_key(messages, configuration)
+        if key is None:
+            return None, None
+        cached = self.completion_cache.get(key)
+        completion_cache_hit.set(cached is not None)
+        return key, cached
 
     def clear_chat_completion_configuration(self):
         self.configuration = ChatCompletionConfiguration()
 
+    def _get_configuration(
+            self,
+            configuration: Optional[ChatCompletionConfiguration] = None):
+        """Per-call configuration if given, else the wrapper's own."""
+        return configuration if configuration is not None \
+            else self.configuration
+
     @abstractmethod
     def _create_client(self, api_key: str):
         """Create and return appropriate Groq client."""
         pass
 
     @abstractmethod
-    def create_chat_completion(self, messages: list[dict]):
-        """Create chat completion with current configuration."""
+    def create_chat_completion(
+            self,
+            messages: list[dict],
+            configuration: Optional[ChatCompletionConfiguration] = None):
+        """
+        Create chat completion with current configuration, or with
+        configuration if one is passed for just this call.
+        """
         pass
 
 class GroqAPIWrapper(BaseGroqWrapper):
     def _create_client(self, api_key: str) -> Groq:
         return Groq(api_key=api_key)
-        
-    def create_chat_completion(self, messages: list[dict]):
-        config_dict = self.configuration.to_dict()
-        return self.client.chat.completions.create(
+
+    def create_chat_completion(
+            self,
+            messages: list[dict],
+            configuration: Optional[ChatCompletionConfiguration] = None):
+        configuration = self._get_configuration(configuration)
+        cache_key, cached = self._get_cached_completion(messages, configuration)
+        if cached is not None:
+            return cached
+        result = self.client.chat.completions.create(
             messages=messages,
-            **config_dict
+            **configuration.to_dict()
         )
+        if cache_key is not None:
+            self.completion_cache.put(cache_key, result)
+        return result
+
+    def create_chat_completion_with_tools(
+            self,
+            messages: list[dict],
+            tool_executor: ToolExecutor,
+            configuration: Optional[ChatCompletionConfiguration] = None,
+            max_rounds: int = 5):
+        """Run tool calls through tool_executor until a final answer."""
+        return tool_executor.run(self, messages, configuration, max_rounds)
 
     def get_json_response(self, messages: list[dict]):
-        self.configuration.response_format = {"type": "json_object"}
+        self.configuration = replace(
+            self.configuration, response_format={"type": "json_object"})
 
         return self.client.chat.completions.create(
             model=self.configuration.model,
@@ -46,18 +158,73 @@ class GroqAPIWrapper(BaseGroqWrapper):
 
 
 class AsyncGroqAPIWrapper(BaseGroqWrapper):
+    def __init__(self, api_key: str):
+        super().__init__(api_key)
+        # Set through enable_hedging(); None means no hedged requests.
+        self.hedger: Optional[RequestHedger] = None
+
     def _create_client(self, api_key: str) -> AsyncGroq:
         return AsyncGroq(api_key=api_key)
-        
-    async def create_chat_completion(self, messages: list[dict]):
-        config_dict = self.configuration.to_dict()
+
+    def enable_hedging(self, policy: HedgingPolicy):
+        """Hedge slow completions as described by policy."""
+        if policy.fallback_model is None and policy.fallback_wrapper is None:
+            raise ValueError(
+                "HedgingPolicy needs a fallback_model or fallback_wrapper")
+        self.hedger = RequestHedger(policy)
+
+    def disable_hedging(self):
+        self.hedger = None
+
+    async def _create_unhedged_chat_completion(
+            self,
+            messages: list[dict],
+            configuration: ChatCompletionConfiguration):
         return await self.client.chat.completions.create(
             messages=messages,
-            **config_dict
+            **configuration.to_dict()
         )
 
+    async def create_chat_completion(
+            self,
+            messages: list[dict],
+            configuration: Optional[ChatCompletionConfiguration] = None):
+        configuration = self._get_configuration(configuration)
+        cache_key, cached = self._get_cached_completion(messages, configuration)
+        if cached is not None:
+            return cached
+        if self.hedger is None:
+            result = await self._create_unhedged_chat_completion(
+                messages, configuration)
+        else:
+            policy = self.hedger.policy
+            hedge_configuration = configuration \
+                if policy.fallback_model is None \
+                else replace(configuration, model=policy.fallback_model)
+            hedge_wrapper = policy.fallback_wrapper \
+                if policy.fallback_wrapper is not None else self
+            result = await self.hedger.run(
+                lambda: self._create_unhedged_chat_completion(
+                    messages, configuration),
+                lambda: hedge_wrapper._create_unhedged_chat_completion(
+                    messages, hedge_configuration))
+        if cache_key is not None:
+            self.completion_cache.put(cache_key, result)
+        return result
+
+    async def create_chat_completion_with_tools(
+            self,
+            messages: list[dict],
+            tool_executor: ToolExecutor,
+            configuration: Optional[ChatCompletionConfiguration] = None,
+            max_rounds: int = 5):
+        """Run tool calls through tool_executor until a final answer."""
+        return await tool_executor.arun(
+            self, messages, configuration, max_rounds)
+
     async def get_json_response(self, messages: list[dict]):
-        self.configuration.response_format = {"type": "json_object"}
+        self.configuration = replace(
+            self.configuration, response_format={"type": "json_object"})
 
         return await self.client.chat.completions.create(
             model=self.configuration.model,
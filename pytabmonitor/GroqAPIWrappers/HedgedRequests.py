@@ -0,0 +1,151 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import math
+import time
+
+@dataclass
+class HedgingPolicy:
+    """
+    Opt-in settings for hedged requests. When a call has not returned
+    within the running latency percentile, a second request goes to
+    fallback_model (on the same wrapper) or to fallback_wrapper (for
+    example one holding another API key), whichever is set; the first to
+    finish wins and the other is cancelled.
+    """
+    fallback_model: Optional[str] = None
+    # A BaseGroqWrapper of the same (async) kind as the hedging wrapper.
+    fallback_wrapper: Optional[Any] = None
+    percentile: float = 0.95
+    # At most this fraction of recent requests may be hedged.
+    max_hedge_rate: float = 0.05
+    # No hedging until this many latencies have been observed.
+    minimum_samples: int = 20
+    # Latencies (and hedge decisions) kept for the running estimates.
+    window_size: int = 200
+    # Never hedge earlier than this, however fast the percentile is.
+    minimum_delay_seconds: float = 0.05
+
+class LatencyTracker:
+    """Percentile estimate over a sliding window of recent latencies."""
+    def __init__(self, window_size: int = 200):
+        self._latencies = deque(maxlen=window_size)
+
+    def record(self, latency_seconds: float):
+        self._latencies.append(latency_seconds)
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)
+        return ordered[max(index, 0)]
+
+class HedgingStatistics:
+    def __init__(self):
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedge_wins = 0
+        self.primary_wins_after_hedge = 0
+        self.hedges_skipped_by_rate_cap = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges_issued": self.hedges_issued,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins_after_hedge": self.primary_wins_after_hedge,
+            "hedges_skipped_by_rate_cap": self.hedges_skipped_by_rate_cap,
+            "hedge_rate": round(
+                self.hedges_issued / max(self.requests, 1), 4)
+        }
+
+class RequestHedger:
+    """
+    Runs a primary coroutine and, if it is slower than the policy's running
+    percentile and the hedge-rate cap allows, races a hedge coroutine
+    against it. Only primary latencies feed the percentile; when the hedge
+    wins, the time until then is recorded as a lower bound for the primary.
+    """
+    def __init__(self, policy: HedgingPolicy):
+        self.policy = policy
+        self.tracker = LatencyTracker(policy.window_size)
+        self.statistics = HedgingStatistics()
+        self._recent_hedges = deque(maxlen=policy.window_size)
+        self._recent_hedge_count = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while still warming up."""
+        if len(self.tracker) < self.policy.minimum_samples:
+            return None
+        return max(
+            self.tracker.percentile(self.policy.percentile),
+            self.policy.minimum_delay_seconds)
+
+    def _remember_decision(self, hedged: bool):
+        if len(self._recent_hedges) == self._recent_hedges.maxlen:
+            self._recent_hedge_count -= self._recent_hedges[0]
+        self._recent_hedges.append(hedged)
+        self._recent_hedge_count += hedged
+
+    def _may_hedge(self) -> bool:
+        return self._recent_hedge_count < \
+            self.policy.max_hedge_rate * len(self._recent_hedges)
+
+    async def run(
+            self,
+            primary: Callable[[], Awaitable],
+            hedge: Callable[[], Awaitable]):
+        self.statistics.requests += 1
+        start_time = time.perf_counter()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = [primary_task]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({primary_task}, timeout=delay)
+            if delay is None or done:
+                self._remember_decision(False)
+                result = await primary_task
+                self.tracker.record(time.perf_counter() - start_time)
+                return result
+
+            if not self._may_hedge():
+                self.statistics.hedges_skipped_by_rate_cap += 1
+                self._remember_decision(False)
+                result = await primary_task
+                self.tracker.record(time.perf_counter() - start_time)
+                return result
+
+            self._remember_decision(True)
+            self.statistics.hedges_issued += 1
+            hedge_task = asyncio.ensure_future(hedge())
+            tasks.append(hedge_task)
+
+            pending = {primary_task, hedge_task}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    # Prefer the primary if both finished in the same step.
+                    winner = primary_task if primary_task in winners \
+                        else winners[0]
+                    self.tracker.record(time.perf_counter() - start_time)
+                    if winner is primary_task:
+                        self.statistics.primary_wins_after_hedge += 1
+                    else:
+                        self.statistics.hedge_wins += 1
+                    return winner.result()
+
+            # Both failed; surface the primary's error.
+            raise primary_task.exception()
+        finally:
+            # Cancel the loser, or both if the caller itself was cancelled.
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
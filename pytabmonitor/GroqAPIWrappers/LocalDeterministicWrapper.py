@@ -0,0 +1,114 @@
+from dataclasses import dataclass, field
+from typing import Optional, List
+import hashlib
+import json
+
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import ChatCompletionConfiguration
+from pytabmonitor.GroqAPIWrappers.GroqAPIWrapper import BaseGroqWrapper
+from pytabmonitor.GroqAPIWrappers.ModelBackends import (
+    ModelCapabilities,
+    ModelDescription)
+
+# ModelBackendRegistry only routes to the local backend when no primary
+# backend can serve a request, whatever model name the request asked for.
+LOCAL_MODELS = (
+    ModelDescription(
+        name="local-deterministic",
+        capabilities=ModelCapabilities(
+            vision=True, json_mode=True, tools=True, streaming=False),
+        context_window=128000,
+        expected_latency_seconds=0.001),
+)
+
+@dataclass
+class LocalMessage:
+    content: str
+    role: str = "assistant"
+    tool_calls: Optional[list] = None
+
+@dataclass
+class LocalChoice:
+    message: LocalMessage
+    index: int = 0
+    finish_reason: str = "stop"
+
+@dataclass
+class LocalUsage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+@dataclass
+class LocalChatCompletion:
+    """Mirrors the attributes of groq's ChatCompletion that callers read."""
+    model: str
+    choices: List[LocalChoice] = field(default_factory=list)
+    usage: LocalUsage = field(default_factory=LocalUsage)
+
+def get_message_text(messages: list[dict]) -> str:
+    """Concatenate the text parts of messages, skipping image parts."""
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+    return "\n".join(texts)
+
+class LocalDeterministicWrapper(BaseGroqWrapper):
+    """
+    Offline backend that needs no network or API key. The same messages and
+    configuration always produce the same completion, which makes it useful
+    for running the server and bulk tools without Groq.
+    """
+    backend_name = "local"
+    models = LOCAL_MODELS
+
+    def __init__(self, api_key: str = ""):
+        super().__init__(api_key)
+
+    def _create_client(self, api_key: str):
+        return None
+
+    def create_chat_completion(
+            self,
+            messages: list[dict],
+            configuration: Optional[ChatCompletionConfiguration] = None):
+        configuration = self._get_configuration(configuration)
+        prompt_text = get_message_text(messages)
+        digest = hashlib.sha256(
+            (configuration.model + "\0" + prompt_text).encode("utf-8")
+        ).hexdigest()[:16]
+
+        last_line = prompt_text.strip().splitlines()[-1] if \
+            prompt_text.strip() else ""
+        if configuration.response_format is not None and \
+                configuration.response_format.get("type") == "json_object":
+            # Shaped like a structured analysis so JSON mode callers can
+            # validate it offline.
+            content = json.dumps({
+                "entity": f"Offline {digest}",
+                "type": "other",
+                "overview": last_line[:200]})
+        else:
+            content = (
+                f"# Offline Analysis: {digest}\n\n"
+                f"## Overview\n"
+                f"Deterministic local response for: {last_line[:200]}")
+
+        if configuration.max_tokens is not None:
+            # Roughly 4 characters per token.
+            content = content[:configuration.max_tokens * 4]
+
+        prompt_tokens = len(prompt_text) // 4
+        completion_tokens = len(content) // 4
+        return LocalChatCompletion(
+            model=configuration.model,
+            choices=[LocalChoice(message=LocalMessage(content=content))],
+            usage=LocalUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens))
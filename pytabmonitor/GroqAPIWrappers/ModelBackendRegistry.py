@@ -0,0 +1,249 @@
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import inspect
+import threading
+import time
+
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import ChatCompletionConfiguration
+from pytabmonitor.GroqAPIWrappers.CompletionCache import completion_cache_hit
+from pytabmonitor.GroqAPIWrappers.GroqAPIWrapper import BaseGroqWrapper
+from pytabmonitor.GroqAPIWrappers.ModelBackends import (
+    BackendStatistics,
+    ModelCapabilities,
+    ModelDescription,
+    get_usage_tokens)
+
+def _create_sync_chat_completion(wrapper, messages, configuration):
+    result = wrapper.create_chat_completion(messages, configuration)
+    return result, completion_cache_hit.get()
+
+@dataclass
+class RegisteredBackend:
+    wrapper: BaseGroqWrapper
+    # Fallback-only backends (e.g. the local deterministic one) are used only
+    # when no primary backend is able to serve a request.
+    fallback_only: bool = False
+
+@dataclass
+class RoutedCompletion:
+    result: Any
+    backend_name: str
+    model: str
+    latency_seconds: float
+    # Answered from the backend's completion cache, not by the model
+    cached: bool = False
+
+class ModelBackendRegistry:
+    """
+    Keeps every registered backend together with the models it declares and
+    measured per-model statistics, and routes each request to the fastest
+    healthy (backend, model) pair whose capabilities cover the request.
+    """
+    def __init__(self):
+        self._backends: List[RegisteredBackend] = []
+        self._statistics: Dict[Tuple[str, str], BackendStatistics] = {}
+        self._lock = threading.Lock()
+
+    def register(self, wrapper: BaseGroqWrapper, fallback_only: bool = False):
+        with self._lock:
+            self._backends.append(RegisteredBackend(wrapper, fallback_only))
+            for model in wrapper.models:
+                key = (wrapper.backend_name, model.name)
+                if key not in self._statistics:
+                    self._statistics[key] = BackendStatistics(
+                        model.expected_latency_seconds)
+
+    def has_primary_backends(self) -> bool:
+        return any(not backend.fallback_only for backend in self._backends)
+
+    def get_statistics(self, backend_name: str, model_name: str) \
+            -> BackendStatistics:
+        return self._statistics[(backend_name, model_name)]
+
+    def find_model(self, model_name: str) -> Optional[ModelDescription]:
+        for backend in self._backends:
+            for model in backend.wrapper.models:
+                if model.name == model_name:
+                    return model
+        return None
+
+    def candidates(
+            self,
+            required: ModelCapabilities = ModelCapabilities(),
+            model_name: Optional[str] = None) \
+                -> List[Tuple[BaseGroqWrapper, ModelDescription]]:
+        """
+        Every (wrapper, model) able to serve the request, in the order they
+        should be tried: primary backends fastest first, then fallback
+        backends. If model_name is given, primary backends must offer that
+        exact model; fallback backends only need the capabilities. Unhealthy
+        pairs, primary or fallback, go after all healthy ones rather than
+        being dropped so that something is always tried.
+        """
+        candidates = []
+        for backend in self._backends:
+            for model in backend.wrapper.models:
+                if not model.capabilities.satisfies(required):
+                    continue
+                if backend.fallback_only or \
+                        model_name is None or model.name == model_name:
+                    candidates.append((backend.fallback_only, backend.wrapper, model))
+
+        def sort_key(candidate):
+            fallback_only, wrapper, model = candidate
+            statistics = self._statistics[(wrapper.backend_name, model.name)]
+            return (not statistics.is_healthy(), fallback_only, statistics.latency_seconds)
+
+        return [
+            (wrapper, model)
+            for _, wrapper, model in sorted(candidates, key=sort_key)]
+
+    def select(
+            self,
+            required: ModelCapabilities = ModelCapabilities(),
+            model_name: Optional[str] = None) \
+                -> Tuple[BaseGroqWrapper, ModelDescription]:
+        candidates = self.candidates(required, model_name)
+        if not candidates:
+            raise LookupError(
+                f"No registered backend can serve {required} "
+                f"(model: {model_name})")
+        return candidates[0]
+
+    def _configuration_for(
+            self,
+            wrapper: BaseGroqWrapper,
+            model: ModelDescription,
+            configuration: Optional[ChatCompletionConfiguration]):
+        # Never mutate the wrapper's shared configuration; Flask serves
+        # requests from several threads.
+        base = configuration if configuration is not None \
+            else wrapper.configuration
+        return replace(base, model=model.name)
+
+    def _record_success(self, wrapper, model, result, start_time, cached):
+        latency = time.perf_counter() - start_time
+        if cached:
+            # Says nothing about the model's latency or cost
+            return RoutedCompletion(
+                result, wrapper.backend_name, model.name, latency, cached=True)
+        prompt_tokens, completion_tokens = get_usage_tokens(result)
+        self._statistics[(wrapper.backend_name, model.name)].record_success(
+            latency,
+            prompt_tokens,
+            completion_tokens,
+            model.estimate_cost(prompt_tokens, completion_tokens))
+        return RoutedCompletion(
+            result, wrapper.backend_name, model.name, latency)
+
+    def create_chat_completion(
+            self,
+            messages: list[dict],
+            required: ModelCapabilities = ModelCapabilities(),
+            configuration: Optional[ChatCompletionConfiguration] = None,
+            model_name: Optional[str] = None) -> RoutedCompletion:
+        """
+        Try candidates in order until one succeeds. Raises the last error if
+        every candidate fails.
+        """
+        candidates = self.candidates(required, model_name)
+        if not candidates:
+            raise LookupError(
+                f"No registered backend can serve {required} "
+                f"(model: {model_name})")
+
+        last_error = None
+        for wrapper, model in candidates:
+            call_configuration = self._configuration_for(
+                wrapper, model, configuration)
+            start_time = time.perf_counter()
+            completion_cache_hit.set(False)
+            try:
+                result = wrapper.create_chat_completion(
+                    messages, call_configuration)
+                if inspect.isawaitable(result):
+                    raise TypeError(
+                        f"{type(wrapper).__name__} is asynchronous; use "
+                        "acreate_chat_completion")
+            except Exception as e:
+                print(
+                    f"Backend {wrapper.backend_name}/{model.name} failed: "
+                    f"{str(e)}")
+                self._statistics[
+                    (wrapper.backend_name, model.name)].record_failure()
+                last_error = e
+                continue
+            return self._record_success(
+                wrapper, model, result, start_time, completion_cache_hit.get())
+
+        raise last_error
+
+    async def acreate_chat_completion(
+            self,
+            messages: list[dict],
+            required: ModelCapabilities = ModelCapabilities(),
+            configuration: Optional[ChatCompletionConfiguration] = None,
+            model_name: Optional[str] = None) -> RoutedCompletion:
+        """
+        Asynchronous counterpart of create_chat_completion. Synchronous
+        wrappers are run in a worker thread.
+        """
+        candidates = self.candidates(required, model_name)
+        if not candidates:
+            raise LookupError(
+                f"No registered backend can serve {required} "
+                f"(model: {model_name})")
+
+        last_error = None
+        for wrapper, model in candidates:
+            call_configuration = self._configuration_for(
+                wrapper, model, configuration)
+            start_time = time.perf_counter()
+            completion_cache_hit.set(False)
+            try:
+                if inspect.iscoroutinefunction(wrapper.create_chat_completion):
+                    result = await wrapper.create_chat_completion(
+                        messages, call_configuration)
+                    cached = completion_cache_hit.get()
+                else:
+                    # The worker thread runs in a copy of this context
+                    result, cached = await asyncio.to_thread(
+                        _create_sync_chat_completion,
+                        wrapper,
+                        messages,
+                        call_configuration)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(
+                    f"Backend {wrapper.backend_name}/{model.name} failed: "
+                    f"{str(e)}")
+                self._statistics[
+                    (wrapper.backend_name, model.name)].record_failure()
+                last_error = e
+                continue
+            return self._record_success(
+                wrapper, model, result, start_time, cached)
+
+        raise last_error
+
+    def report(self) -> List[dict]:
+        """Declared models, capabilities and measured statistics."""
+        rows = []
+        for backend in self._backends:
+            for model in backend.wrapper.models:
+                row = {
+                    "backend": backend.wrapper.backend_name,
+                    "model": model.name,
+                    "fallback_only": backend.fallback_only,
+                    "capabilities": {
+                        "vision": model.capabilities.vision,
+                        "json_mode": model.capabilities.json_mode,
+                        "tools": model.capabilities.tools,
+                        "streaming": model.capabilities.streaming},
+                    "context_window": model.context_window}
+                row.update(self._statistics[
+                    (backend.wrapper.backend_name, model.name)].to_dict())
+                rows.append(row)
+        return rows
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import Optional
+import threading
+import time
+
+@dataclass(frozen=True)
+class ModelCapabilities:
+    """Features a model supports, or that a request requires."""
+    vision: bool = False
+    json_mode: bool = False
+    tools: bool = False
+    streaming: bool = False
+
+    def satisfies(self, required: "ModelCapabilities") -> bool:
+        """True if every capability set in required is also set here."""
+        return (
+            (self.vision or not required.vision) and
+            (self.json_mode or not required.json_mode) and
+            (self.tools or not required.tools) and
+            (self.streaming or not required.streaming))
+
+@dataclass(frozen=True)
+class ModelDescription:
+    """
+    A model as declared by a backend. Costs are in US dollars per million
+    tokens; expected_latency_seconds is only a prior used until the backend
+    has measured latencies of its own.
+    """
+    name: str
+    capabilities: ModelCapabilities = ModelCapabilities()
+    context_window: int = 8192
+    input_cost_per_million_tokens: float = 0.0
+    output_cost_per_million_tokens: float = 0.0
+    expected_latency_seconds: float = 1.0
+
+    def estimate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (
+            prompt_tokens * self.input_cost_per_million_tokens +
+            completion_tokens * self.output_cost_per_million_tokens) / 1e6
+
+class BackendStatistics:
+    """
+    Running latency, cost and health measurements for one (backend, model)
+    pair. Latency is an exponentially weighted moving average. A pair is
+    unhealthy after failure_threshold consecutive failures and becomes
+    eligible again once cooldown_seconds have passed since the last one.
+    """
+    def __init__(
+            self,
+            expected_latency_seconds: float,
+            smoothing: float = 0.2,
+            failure_threshold: int = 3,
+            cooldown_seconds: float = 30.0):
+        self.smoothing = smoothing
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self.latency_seconds = expected_latency_seconds
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure_time: Optional[float] = None
+        self.total_cost = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record_success(
+            self,
+            latency_seconds: float,
+            prompt_tokens: int = 0,
+            completion_tokens: int = 0,
+            cost: float = 0.0):
+        with self._lock:
+            if self.requests == self.failures:
+                # First measurement replaces the declared prior outright.
+                self.latency_seconds = latency_seconds
+            else:
+                self.latency_seconds += self.smoothing * (
+                    latency_seconds - self.latency_seconds)
+            self.requests += 1
+            self.consecutive_failures = 0
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.total_cost += cost
+
+    def record_failure(self):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure_time = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        if self.consecutive_failures < self.failure_threshold:
+            return True
+        return (time.monotonic() - self.last_failure_time) >= \
+            self.cooldown_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "latency_seconds": round(self.latency_seconds, 4),
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.is_healthy(),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_cost": round(self.total_cost, 6)
+        }
+
+def get_usage_tokens(result) -> tuple[int, int]:
+    """Return (prompt_tokens, completion_tokens) from a completion, or zeros."""
+    usage = getattr(result, "usage", None)
+    if usage is None:
+        return 0, 0
+    return (
+        getattr(usage, "prompt_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", 0) or 0)
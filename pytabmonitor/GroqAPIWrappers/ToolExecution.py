@@ -0,0 +1,262 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import functools
+import inspect
+import json
+import threading
+import time
+
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import (
+    ChatCompletionConfiguration,
+    FunctionDefinition,
+    Tool)
+
+class ToolStatistics:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.total_latency_seconds = 0.0
+        self.max_latency_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency_seconds: float, failed: bool, timed_out: bool):
+        with self._lock:
+            self.calls += 1
+            self.failures += int(failed)
+            self.timeouts += int(timed_out)
+            self.total_latency_seconds += latency_seconds
+            self.max_latency_seconds = max(
+                self.max_latency_seconds, latency_seconds)
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "cache_hits": self.cache_hits,
+            "mean_latency_seconds": round(
+                self.total_latency_seconds / max(self.calls, 1), 4),
+            "max_latency_seconds": round(self.max_latency_seconds, 4)
+        }
+
+@dataclass
+class RegisteredTool:
+    definition: FunctionDefinition
+    # Called with the model's arguments as keyword arguments; may be a
+    # plain function (run on a worker thread) or a coroutine function.
+    function: Callable[..., Any]
+    timeout_seconds: float = 10.0
+    cache_results: bool = True
+
+def _get_attribute(value, name, default=None):
+    """Read name from a groq response object or an equivalent dict."""
+    if isinstance(value, dict):
+        return value.get(name, default)
+    return getattr(value, name, default)
+
+class ToolExecutor:
+    """
+    Executes the tool calls a model asks for against registered Python
+    callables and feeds the results back until the model answers without
+    calling tools. All tool calls of one model turn run concurrently, each
+    under its own timeout; successful results are cached by tool name and
+    arguments.
+    """
+    def __init__(self, cache_size: int = 256, max_workers: int = 8):
+        self._tools: Dict[str, RegisteredTool] = {}
+        self._statistics: Dict[str, ToolStatistics] = {}
+        self._results = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        # Owned rather than the loop's default executor, so a tool thread
+        # that outlives its timeout does not hold up asyncio.run in run().
+        self._thread_pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tool")
+
+    def register(
+            self,
+            definition: FunctionDefinition,
+            function: Callable[..., Any],
+            timeout_seconds: float = 10.0,
+            cache_results: bool = True):
+        self._tools[definition.name] = RegisteredTool(
+            definition, function, timeout_seconds, cache_results)
+        self._statistics[definition.name] = ToolStatistics()
+
+    @property
+    def tools(self) -> List[Tool]:
+        return [
+            Tool(function=registered.definition)
+            for registered in self._tools.values()]
+
+    def configure(
+            self,
+            configuration: ChatCompletionConfiguration,
+            parallel_tool_calls: bool = True) -> ChatCompletionConfiguration:
+        """A copy of configuration offering every registered tool."""
+        return replace(
+            configuration,
+            tools=self.tools,
+            tool_choice="auto",
+            parallel_tool_calls=parallel_tool_calls)
+
+    def _get_cached(self, key):
+        with self._cache_lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return True, self._results[key]
+        return False, None
+
+    def _put_cached(self, key, value):
+        with self._cache_lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            while len(self._results) > self._cache_size:
+                self._results.popitem(last=False)
+
+    async def _execute_tool_call(self, tool_call) -> dict:
+        function_call = _get_attribute(tool_call, "function")
+        name = _get_attribute(function_call, "name")
+        raw_arguments = _get_attribute(function_call, "arguments") or "{}"
+        tool_message = {
+            "role": "tool",
+            "tool_call_id": _get_attribute(tool_call, "id"),
+            "name": name}
+
+        registered = self._tools.get(name)
+        if registered is None:
+            tool_message["content"] = f"Error: unknown tool {name}"
+            return tool_message
+        try:
+            arguments = json.loads(raw_arguments)
+        except json.JSONDecodeError as e:
+            tool_message["content"] = f"Error: invalid arguments: {str(e)}"
+            return tool_message
+
+        cache_key = (name, json.dumps(arguments, sort_keys=True))
+        if registered.cache_results:
+            found, cached = self._get_cached(cache_key)
+            if found:
+                self._statistics[name].record_cache_hit()
+                tool_message["content"] = cached
+                return tool_message
+
+        start_time = time.perf_counter()
+        failed = timed_out = False
+        try:
+            if inspect.iscoroutinefunction(registered.function):
+                call = registered.function(**arguments)
+            else:
+                call = asyncio.get_running_loop().run_in_executor(
+                    self._thread_pool,
+                    functools.partial(registered.function, **arguments))
+            result = await asyncio.wait_for(call, registered.timeout_seconds)
+            content = result if isinstance(result, str) else \
+                json.dumps(result, default=str)
+        except asyncio.TimeoutError:
+            failed = timed_out = True
+            content = (
+                f"Error: {name} timed out after "
+                f"{registered.timeout_seconds} seconds")
+        except Exception as e:
+            failed = True
+            content = f"Error: {name} failed: {str(e)}"
+        self._statistics[name].record(
+            time.perf_counter() - start_time, failed, timed_out)
+
+        if registered.cache_results and not failed:
+            self._put_cached(cache_key, content)
+        tool_message["content"] = content
+        return tool_message
+
+    async def execute_tool_calls(self, tool_calls) -> List[dict]:
+        """Run every tool call concurrently; one tool message per call."""
+        return list(await asyncio.gather(
+            *(self._execute_tool_call(tool_call) for tool_call in tool_calls)))
+
+    @staticmethod
+    def _assistant_message(message) -> dict:
+        return {
+            "role": "assistant",
+            "content": _get_attribute(message, "content") or "",
+            "tool_calls": [
+                {
+                    "id": _get_attribute(tool_call, "id"),
+                    "type": "function",
+                    "function": {
+                        "name": _get_attribute(
+                            _get_attribute(tool_call, "function"), "name"),
+                        "arguments": _get_attribute(
+                            _get_attribute(tool_call, "function"),
+                            "arguments")
+                    }
+                }
+                for tool_call in _get_attribute(message, "tool_calls")
+            ]
+        }
+
+    async def arun(
+            self,
+            wrapper,
+            messages: List[dict],
+            configuration: Optional[ChatCompletionConfiguration] = None,
+            max_rounds: int = 5):
+        """
+        Tool loop for an async wrapper. Returns the final completion; messages
+        is extended in place with the tool calls and results.
+        """
+        configuration = self.configure(
+            wrapper._get_configuration(configuration))
+        for _ in range(max_rounds):
+            result = await wrapper.create_chat_completion(
+                messages, configuration)
+            message = result.choices[0].message
+            if not _get_attribute(message, "tool_calls"):
+                return result
+            messages.append(self._assistant_message(message))
+            messages.extend(await self.execute_tool_calls(
+                _get_attribute(message, "tool_calls")))
+        # Out of rounds: ask for an answer from what has been gathered.
+        return await wrapper.create_chat_completion(
+            messages, replace(configuration, tool_choice="none"))
+
+    def run(
+            self,
+            wrapper,
+            messages: List[dict],
+            configuration: Optional[ChatCompletionConfiguration] = None,
+            max_rounds: int = 5):
+        """
+        Tool loop for a synchronous wrapper. Tool calls of each turn still
+        run concurrently, on worker threads (or as tasks for coroutine
+        tools). Must not be called from a running event loop.
+        """
+        configuration = self.configure(
+            wrapper._get_configuration(configuration))
+        for _ in range(max_rounds):
+            result = wrapper.create_chat_completion(messages, configuration)
+            message = result.choices[0].message
+            if not _get_attribute(message, "tool_calls"):
+                return result
+            messages.append(self._assistant_message(message))
+            messages.extend(asyncio.run(self.execute_tool_calls(
+                _get_attribute(message, "tool_calls"))))
+        return wrapper.create_chat_completion(
+            messages, replace(configuration, tool_choice="none"))
+
+    def shutdown(self):
+        self._thread_pool.shutdown(wait=False, cancel_futures=True)
+
+    def report(self) -> dict:
+        return {
+            name: statistics.to_dict()
+            for name, statistics in self._statistics.items()}
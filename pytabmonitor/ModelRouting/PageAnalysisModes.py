@@ -0,0 +1,154 @@
+from dataclasses import dataclass, field
+from typing import Dict, List
+import re
+import threading
+
+TEXT_MODE = "text"
+VISION_MODE = "vision"
+# Re-analysis of a changed page from the text delta and its last analysis.
+INCREMENTAL_MODE = "incremental"
+
+# What the text prompt asks the model to answer, alone, when the text it
+# was given does not say what the page shows.
+INSUFFICIENT_TEXT_ANSWER = "INSUFFICIENT_TEXT"
+
+# Pages with fewer words than this (canvas apps, image galleries, players)
+# go straight to the vision model.
+MIN_PAGE_TEXT_WORDS = 30
+
+# Why a page was escalated to the vision model.
+ESCALATION_LITTLE_TEXT = "little_text"
+ESCALATION_MODEL_INSUFFICIENT = "model_insufficient"
+
+# Text the extension sends when it could not read the page.
+PLACEHOLDER_TEXTS = (
+    "Cannot access content on this page type",
+    "Waiting for content...")
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+@dataclass
+class PageText:
+    """Structured text getPageContentScript extracts from a page."""
+    url: str = ""
+    title: str = ""
+    meta_description: str = ""
+    main_heading: str = ""
+    full_text: str = ""
+
+    def word_count(self) -> int:
+        return sum(
+            len(WORD_PATTERN.findall(text))
+            for text in (self.meta_description, self.main_heading,
+                         self.full_text)
+            if text not in PLACEHOLDER_TEXTS)
+
+@dataclass
+class ModeDecision:
+    mode: str
+    reasons: List[str] = field(default_factory=list)
+
+def is_insufficient_answer(analysis_text: str) -> bool:
+    return (analysis_text or "").strip().strip(".").upper() \
+        .startswith(INSUFFICIENT_TEXT_ANSWER)
+
+class ModeStatistics:
+    def __init__(self):
+        self.requests = 0
+        self.total_latency_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_cost = 0.0
+        self._lock = threading.Lock()
+
+    def record(
+            self,
+            latency_seconds: float,
+            prompt_tokens: int,
+            completion_tokens: int,
+            cost: float):
+        with self._lock:
+            self.requests += 1
+            self.total_latency_seconds += latency_seconds
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.total_cost += cost
+
+    def to_dict(self) -> dict:
+        requests = max(self.requests, 1)
+        return {
+            "requests": self.requests,
+            "mean_latency_seconds": round(
+                self.total_latency_seconds / requests, 4),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_cost": round(self.total_cost, 6),
+            "mean_cost": round(self.total_cost / requests, 8)
+        }
+
+class PageAnalysisModeSelector:
+    """
+    Chooses between analyzing a page from its extracted text with a cheap
+    text model and analyzing its screenshot with a vision model. Text comes
+    first; the vision model is used when the page has too little text, or
+    when the text model answers INSUFFICIENT_TEXT_ANSWER. Latency, tokens
+    and cost are kept per mode, and escalations are counted by reason.
+    """
+    def __init__(
+            self,
+            text_model_name: str = "llama-3.1-8b-instant",
+            text_max_tokens: int = 400,
+            min_page_text_words: int = MIN_PAGE_TEXT_WORDS):
+        self.text_model_name = text_model_name
+        self.text_max_tokens = text_max_tokens
+        self.min_page_text_words = min_page_text_words
+        self.statistics: Dict[str, ModeStatistics] = {
+            TEXT_MODE: ModeStatistics(),
+            VISION_MODE: ModeStatistics(),
+            INCREMENTAL_MODE: ModeStatistics()}
+        self.escalations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def select(self, page: PageText, has_screenshot: bool) -> ModeDecision:
+        word_count = page.word_count()
+        if word_count >= self.min_page_text_words:
+            return ModeDecision(TEXT_MODE, [f"{word_count} words of text"])
+        if has_screenshot:
+            return self.escalate(
+                ModeDecision(TEXT_MODE),
+                ESCALATION_LITTLE_TEXT,
+                f"only {word_count} words of text")
+        return ModeDecision(
+            TEXT_MODE, [f"only {word_count} words of text, no screenshot"])
+
+    def escalate(
+            self,
+            decision: ModeDecision,
+            category: str,
+            reason: str) -> ModeDecision:
+        """Switch decision to the vision mode, counting it under category."""
+        with self._lock:
+            self.escalations[category] = self.escalations.get(category, 0) + 1
+        return ModeDecision(VISION_MODE, decision.reasons + [reason])
+
+    def record(
+            self,
+            decision: ModeDecision,
+            latency_seconds: float,
+            prompt_tokens: int,
+            completion_tokens: int,
+            cost: float):
+        self.statistics[decision.mode].record(
+            latency_seconds, prompt_tokens, completion_tokens, cost)
+        print(
+            f"Page analysis mode {decision.mode}: {latency_seconds:.2f}s, "
+            f"{prompt_tokens}+{completion_tokens} tokens, ${cost:.6f} "
+            f"[{'; '.join(decision.reasons)}]")
+
+    def report(self) -> dict:
+        return {
+            "modes": {
+                mode: statistics.to_dict()
+                for mode, statistics in self.statistics.items()},
+            "escalations": dict(self.escalations)
+        }
@@ -0,0 +1,257 @@
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional
+import re
+import threading
+import urllib.parse
+
+from pytabmonitor.AnalysisStorage.StructuredAnalysis import (
+    StructuredAnalysisError,
+    parse_structured_analysis)
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import ChatCompletionConfiguration
+
+# Domain classes a URL can fall into, cheapest to analyze first.
+DOMAIN_CLASS_SEARCH = "search"
+DOMAIN_CLASS_LOGIN = "login"
+DOMAIN_CLASS_DOCUMENTATION = "documentation"
+DOMAIN_CLASS_SOCIAL = "social"
+DOMAIN_CLASS_GENERAL = "general"
+
+SEARCH_DOMAINS = (
+    "google.com", "bing.com", "duckduckgo.com", "search.yahoo.com",
+    "baidu.com", "yandex.com", "search.brave.com", "ecosia.org")
+SOCIAL_DOMAINS = (
+    "reddit.com", "twitter.com", "x.com", "facebook.com", "linkedin.com",
+    "youtube.com", "instagram.com", "tiktok.com", "quora.com")
+DOCUMENTATION_DOMAINS = ("readthedocs.io", "readthedocs.org", "github.io")
+DOCUMENTATION_SUBDOMAINS = ("docs.", "developer.", "developers.", "api.")
+
+LOGIN_PATH_PATTERN = re.compile(
+    r"/(login|log-in|signin|sign-in|signup|sign-up|auth|oauth2?|sso)(/|$)",
+    re.IGNORECASE)
+SEARCH_PATH_PATTERN = re.compile(r"/(search|results)(/|$)", re.IGNORECASE)
+DOCUMENTATION_PATH_PATTERN = re.compile(
+    r"/(docs?|documentation|reference|api|manual|guide)(/|$)", re.IGNORECASE)
+
+def _matches_domain(domain: str, suffixes) -> bool:
+    return any(
+        domain == suffix or domain.endswith("." + suffix)
+        for suffix in suffixes)
+
+def classify_domain(url: str) -> str:
+    """Classify a URL from its host and path alone, without fetching it."""
+    parsed_url = urllib.parse.urlparse(url)
+    domain = parsed_url.netloc.lower().split(":")[0]
+    path = parsed_url.path
+
+    if domain.startswith(("login.", "accounts.", "auth.", "signin.")) or \
+            LOGIN_PATH_PATTERN.search(path):
+        return DOMAIN_CLASS_LOGIN
+    if _matches_domain(domain, SEARCH_DOMAINS) and (
+            SEARCH_PATH_PATTERN.search(path) or "q=" in parsed_url.query):
+        return DOMAIN_CLASS_SEARCH
+    if SEARCH_PATH_PATTERN.search(path) and "q=" in parsed_url.query:
+        return DOMAIN_CLASS_SEARCH
+    if _matches_domain(domain, DOCUMENTATION_DOMAINS) or \
+            domain.startswith(DOCUMENTATION_SUBDOMAINS) or \
+            DOCUMENTATION_PATH_PATTERN.search(path):
+        return DOMAIN_CLASS_DOCUMENTATION
+    if _matches_domain(domain, SOCIAL_DOMAINS):
+        return DOMAIN_CLASS_SOCIAL
+    return DOMAIN_CLASS_GENERAL
+
+@dataclass
+class PageSignals:
+    """Cheap facts about a page, all known before any model call."""
+    url: str
+    # Length of the page text the extension extracted, if it sent one.
+    page_text_length: Optional[int] = None
+    # True if some other URL on the same domain is already in the cache.
+    domain_cached: bool = False
+    title: Optional[str] = None
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model_name: str
+    max_tokens: int
+
+@dataclass
+class RouteDecision:
+    route: Route
+    domain_class: str
+    reasons: List[str] = field(default_factory=list)
+
+# Ordered from cheapest to most expensive.
+DEFAULT_ROUTES = {
+    "minimal": Route("minimal", "llama-3.1-8b-instant", 150),
+    "light": Route("light", "llama-3.1-8b-instant", 400),
+    "standard": Route("standard", "llama-3.3-70b-versatile", 600),
+    "full": Route("full", "llama-3.3-70b-versatile", 1000),
+}
+
+# Pages with less text than this are treated as near empty.
+SHORT_PAGE_TEXT_LENGTH = 200
+
+class RouteStatistics:
+    """
+    Latency and quality tradeoff of one route. Quality is approximated by
+    whether the answer came back in the requested structure, "# NAME: TYPE"
+    sections or valid JSON in JSON mode, since there is no ground truth to
+    compare against.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.total_latency_seconds = 0.0
+        self.total_completion_tokens = 0
+        self.structured_answers = 0
+        self._lock = threading.Lock()
+
+    def record(
+            self,
+            latency_seconds: float,
+            completion_tokens: int,
+            structured: bool):
+        with self._lock:
+            self.requests += 1
+            self.total_latency_seconds += latency_seconds
+            self.total_completion_tokens += completion_tokens
+            self.structured_answers += int(structured)
+
+    def to_dict(self) -> dict:
+        requests = max(self.requests, 1)
+        return {
+            "requests": self.requests,
+            "mean_latency_seconds": round(
+                self.total_latency_seconds / requests, 4),
+            "mean_completion_tokens": round(
+                self.total_completion_tokens / requests, 1),
+            "structured_answer_rate": round(
+                self.structured_answers / requests, 3)
+        }
+
+STRUCTURED_ANSWER_PATTERN = re.compile(r"^#\s*[^:\n]+:", re.MULTILINE)
+
+class PageComplexityRouter:
+    """
+    Picks a model and token budget for a research request from cheap page
+    signals, so that the large model is only used where it pays off:
+
+    - search results and login pages get the minimal route,
+    - documentation, social sites and near-empty pages the light route,
+    - subpages of domains already in the cache the standard route,
+    - everything else (new, content-rich domains) the full route.
+
+    An optional classifier, for example a single-token call to a small
+    model, is consulted only for pages the rules send to the full route and
+    may downgrade them to "standard" or "light" (the one from
+    create_model_classifier only answers "light"). Keyword arguments of
+    route are passed on to it, e.g. to attribute its call to a client.
+    """
+    def __init__(
+            self,
+            routes: Optional[Dict[str, Route]] = None,
+            classifier: Optional[Callable[..., Optional[str]]] = None):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.classifier = classifier
+        self.statistics: Dict[str, RouteStatistics] = {
+            name: RouteStatistics() for name in self.routes}
+
+    def route(self, signals: PageSignals, **classifier_options) -> RouteDecision:
+        domain_class = classify_domain(signals.url)
+        reasons = [f"domain class {domain_class}"]
+
+        if domain_class in (DOMAIN_CLASS_SEARCH, DOMAIN_CLASS_LOGIN):
+            name = "minimal"
+        elif domain_class in (DOMAIN_CLASS_DOCUMENTATION, DOMAIN_CLASS_SOCIAL):
+            name = "light"
+        elif signals.page_text_length is not None and \
+                signals.page_text_length < SHORT_PAGE_TEXT_LENGTH:
+            name = "light"
+            reasons.append(f"page text {signals.page_text_length} chars")
+        elif signals.domain_cached:
+            name = "standard"
+            reasons.append("domain already cached")
+        else:
+            name = "full"
+            reasons.append("domain not cached")
+            if self.classifier is not None:
+                try:
+                    classified = self.classifier(signals, **classifier_options)
+                except Exception as e:
+                    print(f"Route classifier failed: {str(e)}")
+                    classified = None
+                if classified in ("light", "standard"):
+                    name = classified
+                    reasons.append(f"classifier chose {classified}")
+
+        return RouteDecision(self.routes[name], domain_class, reasons)
+
+    def record(
+            self,
+            decision: RouteDecision,
+            latency_seconds: float,
+            completion_tokens: int,
+            analysis_text: str,
+            response_format: Optional[dict] = None):
+        """
+        Log one finished request against its route. response_format is the
+        one the completion was requested with; JSON mode answers count as
+        structured only if they validate as a structured analysis.
+        """
+        if (response_format or {}).get("type") == "json_object":
+            try:
+                parse_structured_analysis(analysis_text)
+                structured = True
+            except StructuredAnalysisError:
+                structured = False
+        else:
+            structured = bool(
+                STRUCTURED_ANSWER_PATTERN.search(analysis_text or ""))
+        self.statistics[decision.route.name].record(
+            latency_seconds, completion_tokens, structured)
+        print(
+            f"Route {decision.route.name} ({decision.route.model_name}, "
+            f"max_tokens={decision.route.max_tokens}): "
+            f"{latency_seconds:.2f}s, {completion_tokens} completion tokens, "
+            f"structured={structured} [{'; '.join(decision.reasons)}]")
+
+    def report(self) -> dict:
+        return {
+            name: dict(
+                model=self.routes[name].model_name,
+                max_tokens=self.routes[name].max_tokens,
+                **statistics.to_dict())
+            for name, statistics in self.statistics.items()
+        }
+
+def create_model_classifier(
+        create_chat_completion: Callable,
+        model_name: str = "llama-3.1-8b-instant"):
+    """
+    Return a classifier that asks a small model whether a page needs deep
+    research. create_chat_completion is called like
+    ModelBackendRegistry.create_chat_completion and must return a
+    RoutedCompletion; keyword arguments of the classifier are passed on to
+    it. It costs one short completion, so only use it when that is cheaper
+    than the large-model call it may avoid.
+    """
+    configuration = replace(
+        ChatCompletionConfiguration(), temperature=0.0, max_tokens=3)
+
+    def classify(signals: PageSignals, **completion_options) -> Optional[str]:
+        title = f" titled '{signals.title}'" if signals.title else ""
+        messages = [{
+            "role": "user",
+            "content": (
+                f"Page {signals.url}{title}. Does researching the company or "
+                "organization behind it need an in-depth answer? Reply with "
+                "exactly one word: DEEP or BRIEF.")}]
+        routed = create_chat_completion(
+            messages,
+            configuration=configuration,
+            model_name=model_name,
+            **completion_options)
+        answer = routed.result.choices[0].message.content.strip().upper()
+        return "light" if answer.startswith("BRIEF") else None
+
+    return classify
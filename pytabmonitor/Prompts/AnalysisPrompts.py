@@ -0,0 +1,148 @@
+from pytabmonitor.Prompts.PromptTemplates import (
+    PromptTemplate,
+    PromptTemplateRegistry)
+
+# Templates are compiled once at import; requests only fill in the fields.
+analysis_prompts = PromptTemplateRegistry()
+
+# For vision models, we can't use system messages with images, so the
+# instructions are part of the user message.
+SCREENSHOT_PROMPT = analysis_prompts.register(PromptTemplate(
+    name="analyze-screenshot",
+    user_template=(
+        "You are an AI assistant that analyzes screenshots of webpages. "
+        "Describe what you see in this image in detail, including text content, "
+        "layout, and visual elements. Be thorough but concise.")))
+
+STOCK_RESEARCH_PROMPT = analysis_prompts.register(PromptTemplate(
+    name="stock-research",
+    system_text=(
+        "You are an expert financial and technical researcher specializing in company stock analysis and deep research. "
+        "Your task is to analyze a website URL and provide detailed, structured information."),
+    user_template=(
+        "Analyze this URL thoroughly: {url}\n\n"
+        "STEP 1: Determine if this website is related to a publicly traded company.\n"
+        "- Look for company names, corporate domains, product references\n"
+        "- Check if there are hints of stock market presence\n\n"
+        "STEP 2: If it IS a publicly traded company:\n"
+        "- Identify and prominently display the stock ticker symbol and exchange\n"
+        "- Find the most recent SEC filings (focus on Form 10-K, Form 10-Q, Form 8-K)\n"
+        "- Extract key financial data: revenue, profit margins, EPS, market cap\n"
+        "- Identify primary business segments and growth areas\n"
+        "- Report any recent significant news or developments\n\n"
+        "STEP 3: If it is NOT a publicly traded company:\n"
+        "- Determine the entity type (private company, non-profit, government, educational, etc.)\n"
+        "- Conduct deep research using 'sonar-deep-research' methodology:\n"
+        "  * Find research papers, technical documentation, or whitepapers\n"
+        "  * Discover most upvoted content on Reddit, Quora, Twitter, TikTok\n"
+        "  * Identify mentions in major publications (The Atlantic, Washington Post, NYT, etc.)\n"
+        "  * Look for industry associations, competitors, and market position\n"
+        "  * Analyze technical aspects, innovations, or specialized knowledge\n\n"
+        "FORMAT YOUR RESPONSE AS FOLLOWS:\n"
+        "1. For public companies:\n"
+        "```\n"
+        "# [TICKER]: [COMPANY NAME]\n\n"
+        "## Company Overview\n"
+        "[Brief description, 1-2 sentences]\n\n"
+        "**Exchange:** [Exchange name]\n"
+        "**Industry:** [Primary industry]\n\n"
+        "## Recent SEC Filings\n"
+        "- Most recent 10-K: [Date, key points]\n"
+        "- Most recent 10-Q: [Date, key points]\n"
+        "- Recent 8-K: [Date, purpose]\n\n"
+        "## Financial Highlights\n"
+        "- Revenue: [Amount] ([Period])\n"
+        "- [Other key metrics]\n\n"
+        "## Business Segments\n"
+        "- [List key segments]\n\n"
+        "## Recent Developments\n"
+        "- [List recent news]\n"
+        "```\n\n"
+        "2. For non-public entities:\n"
+        "```\n"
+        "# [ENTITY NAME]: [ENTITY TYPE]\n\n"
+        "## Overview\n"
+        "[Brief description, 2-3 sentences]\n\n"
+        "## Key Research & Resources\n"
+        "- Research Papers: [List notable papers]\n"
+        "- Technical Documentation: [List key resources]\n"
+        "- Community Insights: [Reddit, Quora, social media highlights]\n\n"
+        "## Industry Position\n"
+        "- Competitors: [List main competitors]\n"
+        "- Market Focus: [Describe target market/users]\n\n"
+        "## Technical Analysis\n"
+        "- [Key technical aspects]\n\n"
+        "## Media Coverage\n"
+        "- [Notable mentions in publications]\n"
+        "```\n\n"
+        "Ensure your analysis is comprehensive but concise. Always provide valuable information regardless of entity type.")))
+
+# JSON mode variant of the research prompt; braces of the example are doubled
+# because they are literal text, not template fields.
+STRUCTURED_RESEARCH_PROMPT = analysis_prompts.register(PromptTemplate(
+    name="stock-research-structured",
+    system_text=(
+        "You are an expert financial and technical researcher specializing in company stock analysis and deep research. "
+        "You answer only with a single JSON object."),
+    user_template=(
+        "Analyze this URL: {url}\n\n"
+        "Determine the company or organization behind it and whether it is publicly traded. "
+        "Reply with a JSON object with these keys:\n"
+        "- entity: company or organization name\n"
+        "- type: one of public_company, private_company, non_profit, government, educational, open_source, other\n"
+        "- ticker, exchange: stock ticker symbol and exchange, or null if not publicly traded\n"
+        "- industry: primary industry\n"
+        "- overview: one or two sentences\n"
+        "- filings: most recent SEC filings (10-K, 10-Q, 8-K) as objects with form, date and description, or []\n"
+        "- segments: key business segments, or []\n"
+        "- competitors: main competitors, or []\n"
+        "- market_focus: target market or users\n"
+        "- research_papers, documentation, community: one line each on notable research papers, "
+        "technical documentation and community discussion, or null\n\n"
+        "Example: {{\"entity\": \"NVIDIA Corporation\", \"type\": \"public_company\", \"ticker\": \"NVDA\", "
+        "\"exchange\": \"NASDAQ\", \"filings\": [{{\"form\": \"10-K\", \"date\": \"2024-02-21\", "
+        "\"description\": \"Annual report\"}}], \"segments\": [\"Data Center\", \"Gaming\"]}}\n\n"
+        "Keep every string short. Do not add other keys.")))
+
+# Text-first page analysis from what getPageContentScript extracts; the
+# screenshot prompt is only used when this one cannot tell what the page is.
+PAGE_TEXT_PROMPT = analysis_prompts.register(PromptTemplate(
+    name="analyze-page-text",
+    system_text=(
+        "You are an AI assistant that analyzes webpages from their extracted text. "
+        "Describe what the page is about and what it shows, including its main content "
+        "and purpose. Be thorough but concise. If the text is not enough to tell what "
+        "the page shows, for example because the content is in images or a canvas, "
+        "reply with exactly INSUFFICIENT_TEXT and nothing else."),
+    user_template=(
+        "URL: {url}\n"
+        "Title: {title}\n"
+        "Meta description: {meta_description}\n"
+        "Main heading: {main_heading}\n\n"
+        "Page text:\n{page_text}"),
+    trimmable_field="page_text"))
+
+# Map step of summarizing long page text: each chunk (or group of chunk
+# summaries) is condensed on its own before the page is analyzed as a whole.
+CHUNK_SUMMARY_PROMPT = analysis_prompts.register(PromptTemplate(
+    name="summarize-chunk",
+    system_text=(
+        "You condense part of a webpage's text. Keep names, numbers, dates and the main "
+        "points; drop navigation, boilerplate and repetition. Reply with the summary only."),
+    user_template="Part of the page {url}:\n\n{chunk}",
+    trimmable_field="chunk"))
+
+# Incremental re-analysis of a page whose text changed a little since its
+# last analysis; only the changed lines are sent.
+PAGE_UPDATE_PROMPT = analysis_prompts.register(PromptTemplate(
+    name="analyze-page-update",
+    system_text=(
+        "You keep an analysis of a webpage up to date as its text changes. Given the previous "
+        "analysis and the lines added to and removed from the page since, reply with the "
+        "updated analysis in the same form. Change only what the new lines affect."),
+    user_template=(
+        "Page: {url}\n\n"
+        "Previous analysis:\n{previous_analysis}\n\n"
+        "Lines removed:\n{removed}\n\n"
+        "Lines added:\n{added}"),
+    trimmable_field="added"))
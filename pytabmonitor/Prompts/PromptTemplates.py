@@ -0,0 +1,152 @@
+from typing import Dict, List, Optional, Tuple
+import string
+
+from pytabmonitor.Prompts.TokenEstimation import (
+    IMAGE_TOKEN_ESTIMATE,
+    MESSAGE_OVERHEAD_TOKENS,
+    estimate_tokens)
+
+class PromptBudgetError(ValueError):
+    """A prompt does not fit the model context or the token budget."""
+    pass
+
+class PromptTemplate:
+    """
+    A chat prompt whose static parts (system message, literal text of the
+    user message and their token counts) are built once. Rendering only
+    interpolates the variable fields, written as {field} in user_template.
+
+    If trimmable_field is set, that field is shortened when a rendered
+    prompt would exceed max_prompt_tokens; otherwise such prompts raise
+    PromptBudgetError.
+    """
+    def __init__(
+            self,
+            name: str,
+            user_template: str,
+            system_text: Optional[str] = None,
+            trimmable_field: Optional[str] = None):
+        self.name = name
+        self.trimmable_field = trimmable_field
+        self.system_message = {"role": "system", "content": system_text} \
+            if system_text is not None else None
+
+        # Compile the template into (literal, field name or None) pairs.
+        self._segments: List[Tuple[str, Optional[str]]] = []
+        for literal, field_name, format_spec, conversion in \
+                string.Formatter().parse(user_template):
+            if format_spec or conversion:
+                raise ValueError(
+                    f"Prompt template {name} uses a format spec or "
+                    f"conversion on {{{field_name}}}; only plain fields are "
+                    "supported")
+            self._segments.append((literal, field_name))
+        self.field_names = tuple(
+            field_name for _, field_name in self._segments
+            if field_name is not None)
+        if trimmable_field is not None and \
+                trimmable_field not in self.field_names:
+            raise ValueError(
+                f"Prompt template {name} has no field {trimmable_field}")
+
+        self.static_tokens = MESSAGE_OVERHEAD_TOKENS + sum(
+            estimate_tokens(literal) for literal, _ in self._segments)
+        if self.system_message is not None:
+            self.static_tokens += MESSAGE_OVERHEAD_TOKENS + \
+                estimate_tokens(system_text)
+
+    def render_text(self, **fields) -> str:
+        """The user message text with fields interpolated."""
+        try:
+            return "".join(
+                literal if field_name is None
+                else literal + str(fields[field_name])
+                for literal, field_name in self._segments)
+        except KeyError as e:
+            raise KeyError(
+                f"Prompt template {self.name} needs field {e.args[0]}")
+
+    def estimate_tokens(self, image: bool = False, **fields) -> int:
+        return self.static_tokens + \
+            (IMAGE_TOKEN_ESTIMATE if image else 0) + sum(
+                estimate_tokens(str(fields[field_name]))
+                for field_name in self.field_names)
+
+    def _trim_to_fit(self, max_prompt_tokens: int, image: bool, fields):
+        value = str(fields[self.trimmable_field])
+        others = dict(fields)
+        others[self.trimmable_field] = ""
+        available = max_prompt_tokens - self.estimate_tokens(image, **others)
+        if available <= 0:
+            raise PromptBudgetError(
+                f"Prompt {self.name} exceeds {max_prompt_tokens} tokens even "
+                f"with {self.trimmable_field} empty")
+        # Start from about 4 characters per token and shrink until it fits.
+        value = value[:available * 4]
+        while value and estimate_tokens(value) > available:
+            value = value[:int(len(value) * 0.9)]
+        fields[self.trimmable_field] = value
+        return fields
+
+    def render_messages(
+            self,
+            max_prompt_tokens: Optional[int] = None,
+            image_base64: Optional[str] = None,
+            **fields) -> Tuple[List[dict], int]:
+        """
+        Return the chat messages and their estimated prompt tokens. Raises
+        PromptBudgetError if they cannot be made to fit max_prompt_tokens.
+        """
+        image = image_base64 is not None
+        if image and self.system_message is not None:
+            # Vision models take no system message alongside an image.
+            raise ValueError(
+                f"Prompt template {self.name} has a system message and "
+                "cannot carry an image")
+        prompt_tokens = self.estimate_tokens(image, **fields)
+        if max_prompt_tokens is not None and prompt_tokens > max_prompt_tokens:
+            if self.trimmable_field is None:
+                raise PromptBudgetError(
+                    f"Prompt {self.name} needs about {prompt_tokens} tokens, "
+                    f"more than the {max_prompt_tokens} available")
+            fields = self._trim_to_fit(max_prompt_tokens, image, fields)
+            prompt_tokens = self.estimate_tokens(image, **fields)
+            print(
+                f"Trimmed {self.trimmable_field} of prompt {self.name} to "
+                f"fit {max_prompt_tokens} tokens")
+
+        text = self.render_text(**fields)
+        if image:
+            user_message = {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": text},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{image_base64}"
+                        }
+                    }
+                ]
+            }
+        else:
+            user_message = {"role": "user", "content": text}
+
+        if self.system_message is not None:
+            return [self.system_message, user_message], prompt_tokens
+        return [user_message], prompt_tokens
+
+class PromptTemplateRegistry:
+    """Prompt templates by name, compiled once at registration."""
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
@@ -0,0 +1,82 @@
+from typing import Iterator, List, Optional
+import re
+import zlib
+
+from pytabmonitor.Prompts.TokenEstimation import estimate_tokens
+
+BLOCK_SEPARATOR_PATTERN = re.compile(r"\n\s*\n")
+LINE_SEPARATOR_PATTERN = re.compile(r"\n+")
+SENTENCE_SEPARATOR_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+# A chunk may end after any block whose checksum is divisible by this, once
+# it holds min_chunk_tokens. Boundaries then depend on the blocks around
+# them rather than on their position, so an edit near the top of a page does
+# not shift every later chunk.
+BOUNDARY_MODULUS = 8
+
+def _split_oversized(text: str, max_tokens: int) -> Iterator[str]:
+    """Split text into pieces of at most max_tokens, at the coarsest unit."""
+    for pattern in (LINE_SEPARATOR_PATTERN, SENTENCE_SEPARATOR_PATTERN):
+        pieces = [piece for piece in pattern.split(text) if piece.strip()]
+        if len(pieces) > 1:
+            for piece in pieces:
+                if estimate_tokens(piece) <= max_tokens:
+                    yield piece
+                else:
+                    yield from _split_oversized(piece, max_tokens)
+            return
+    # One unbroken sentence: fall back to runs of words.
+    words = text.split()
+    piece = []
+    for word in words:
+        if piece and estimate_tokens(" ".join(piece + [word])) > max_tokens:
+            yield " ".join(piece)
+            piece = []
+        piece.append(word)
+    if piece:
+        yield " ".join(piece)
+
+def split_blocks(text: str, max_tokens: int) -> List[str]:
+    """
+    Paragraph-like blocks of text (separated by blank lines), with blocks
+    over max_tokens split on lines, then sentences, then words.
+    """
+    blocks = []
+    for block in BLOCK_SEPARATOR_PATTERN.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        if estimate_tokens(block) <= max_tokens:
+            blocks.append(block)
+        else:
+            blocks.extend(_split_oversized(block, max_tokens))
+    return blocks
+
+def split_text(
+        text: str,
+        max_chunk_tokens: int = 1500,
+        min_chunk_tokens: Optional[int] = None) -> List[str]:
+    """
+    Split text into chunks of at most max_chunk_tokens on semantic
+    boundaries. Chunks end at content-defined block boundaries where
+    possible, so unchanged regions of an edited text split the same way.
+    """
+    if min_chunk_tokens is None:
+        min_chunk_tokens = max_chunk_tokens // 4
+    chunks = []
+    current = []
+    current_tokens = 0
+    for block in split_blocks(text, max_chunk_tokens):
+        block_tokens = estimate_tokens(block)
+        if current and current_tokens + block_tokens > max_chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += block_tokens
+        if current_tokens >= min_chunk_tokens and \
+                zlib.crc32(block.encode("utf-8")) % BOUNDARY_MODULUS == 0:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
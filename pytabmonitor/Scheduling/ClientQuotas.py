@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import threading
+import time
+
+from pytabmonitor.Scheduling.RateLimiter import RateLimiter, Reservation
+
+class QuotaExceededError(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass
+class ClientUsage:
+    requests: int = 0
+    # Refused for having too many requests in flight
+    rejected_requests: int = 0
+    in_flight_requests: int = 0
+    model_calls: int = 0
+    # Model calls refused for exceeding the token quota
+    rejected_model_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    last_seen: float = field(default_factory=time.time)
+
+class ClientQuotas:
+    """
+    Per-client limits and usage, by client id (the X-Client-Id header the
+    extension sends, or the remote address).
+
+    A client may have max_concurrent_requests requests in flight; more are
+    refused rather than tying up server threads. Given tokens_per_minute,
+    each client also has its own sliding-window token budget, checked
+    before every model call it makes. Usage of the max_clients most
+    recently seen clients is kept.
+    """
+    def __init__(
+            self,
+            max_concurrent_requests: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None,
+            max_clients: int = 1000):
+        self.max_concurrent_requests = max_concurrent_requests
+        self.tokens_per_minute = tokens_per_minute
+        self.max_clients = max_clients
+        self._usage: "OrderedDict[str, ClientUsage]" = OrderedDict()
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, client: str) -> ClientUsage:
+        usage = self._usage.get(client)
+        if usage is None:
+            usage = ClientUsage()
+            self._usage[client] = usage
+            while len(self._usage) > self.max_clients:
+                # Keep clients with requests in flight so they are finished
+                oldest, oldest_usage = next(iter(self._usage.items()))
+                if oldest_usage.in_flight_requests:
+                    self._usage.move_to_end(oldest)
+                    break
+                del self._usage[oldest]
+                self._limiters.pop(oldest, None)
+        self._usage.move_to_end(client)
+        usage.last_seen = time.time()
+        return usage
+
+    def start_request(self, client: str) -> bool:
+        """Count a request in flight; False if the client has too many."""
+        with self._lock:
+            usage = self._get(client)
+            if self.max_concurrent_requests is not None and \
+                    usage.in_flight_requests >= self.max_concurrent_requests:
+                usage.rejected_requests += 1
+                return False
+            usage.requests += 1
+            usage.in_flight_requests += 1
+            return True
+
+    def finish_request(self, client: str):
+        with self._lock:
+            usage = self._usage.get(client)
+            if usage is not None:
+                usage.in_flight_requests -= 1
+
+    def reserve(self, client: str, tokens: int) -> Optional[Reservation]:
+        """
+        Reserve tokens from the client's budget for a model call, or None
+        if it has none. Raises QuotaExceededError if it is exhausted.
+        """
+        with self._lock:
+            usage = self._get(client)
+            if self.tokens_per_minute is None:
+                return None
+            limiter = self._limiters.get(client)
+            if limiter is None:
+                limiter = RateLimiter(tokens_per_minute=self.tokens_per_minute)
+                self._limiters[client] = limiter
+        tokens = min(tokens, self.tokens_per_minute)
+        reservation = limiter.try_acquire(tokens)
+        if reservation is None:
+            with self._lock:
+                usage.rejected_model_calls += 1
+            raise QuotaExceededError(
+                f"Client token quota of {self.tokens_per_minute} per minute exhausted",
+                limiter.wait_time(tokens))
+        return reservation
+
+    def record(
+            self,
+            client: str,
+            reservation: Optional[Reservation],
+            prompt_tokens: int,
+            completion_tokens: int):
+        """Record a finished model call, settling its reservation."""
+        with self._lock:
+            usage = self._get(client)
+            usage.model_calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+            limiter = self._limiters.get(client)
+        if reservation is not None and limiter is not None:
+            limiter.settle(reservation, prompt_tokens + completion_tokens)
+
+    def release(self, client: str, reservation: Optional[Reservation]):
+        """Return the tokens of a model call that failed or was cancelled."""
+        with self._lock:
+            limiter = self._limiters.get(client)
+        if reservation is not None and limiter is not None:
+            limiter.settle(reservation, 0)
+
+    def report(self, limit: int = 100) -> dict:
+        """Usage of the clients that used the most tokens, most first."""
+        with self._lock:
+            clients = sorted(
+                self._usage.items(),
+                key=lambda item: -(item[1].prompt_tokens + item[1].completion_tokens))
+            rows = []
+            for client, usage in clients[:limit]:
+                limiter = self._limiters.get(client)
+                rows.append({
+                    "client": client,
+                    "requests": usage.requests,
+                    "rejected_requests": usage.rejected_requests,
+                    "in_flight_requests": usage.in_flight_requests,
+                    "model_calls": usage.model_calls,
+                    "rejected_model_calls": usage.rejected_model_calls,
+                    "prompt_tokens": usage.prompt_tokens,
+                    "completion_tokens": usage.completion_tokens,
+                    "tokens_in_window": limiter.report()["tokens_in_window"]
+                    if limiter else None,
+                    "last_seen": usage.last_seen
+                })
+            return {
+                "max_concurrent_requests": self.max_concurrent_requests,
+                "tokens_per_minute": self.tokens_per_minute,
+                "clients_seen": len(self._usage),
+                "clients": rows
+            }
@@ -0,0 +1,164 @@
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from typing import Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+import threading
+import time
+
+from pytabmonitor.Scheduling.RateLimiter import RateLimiter
+
+@dataclass
+class PrefetchStatistics:
+    submitted: int = 0
+    queued: int = 0
+    # Already queued or being prefetched
+    duplicates: int = 0
+    # Dropped because the queue, or the client's share of it, was full
+    dropped: int = 0
+    completed: int = 0
+    failed: int = 0
+    queue_seconds: float = 0.0
+    run_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "submitted": self.submitted,
+            "queued": self.queued,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "average_queue_seconds": round(
+                self.queue_seconds / finished, 3) if finished else None,
+            "average_run_seconds": round(
+                self.run_seconds / finished, 3) if finished else None
+        }
+
+class PrefetchQueue:
+    """
+    Keys to warm a cache with, handled one at a time by a background
+    thread, round robin across the clients that submitted them and in the
+    order submitted for each. A key already queued or in flight is not
+    queued again, and a client may have at most max_queued_per_client keys
+    queued, so one client cannot crowd out the others.
+
+    Prefetching yields to interactive work: the next key only starts while
+    no interactive request is running (see interactive_started and
+    interactive_finished) and, given a rate_limiter, while less than
+    max_utilization of its per-minute budget is used, leaving the rest to
+    interactive requests.
+
+    handler(key, client=client, **options), with the client and options
+    the key was submitted with, returns whether the key was prefetched;
+    exceptions count as failures.
+    """
+    def __init__(
+            self,
+            handler: Callable[..., bool],
+            rate_limiter: Optional[RateLimiter] = None,
+            max_utilization: float = 0.5,
+            max_queued: int = 1000,
+            max_queued_per_client: int = 500,
+            poll_seconds: float = 1.0):
+        self.handler = handler
+        self.rate_limiter = rate_limiter
+        self.max_utilization = max_utilization
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.poll_seconds = poll_seconds
+        self.statistics = PrefetchStatistics()
+        # Clients with keys queued, in round-robin order
+        self._queues: "OrderedDict[str, Deque[Tuple[str, Dict, float]]]" = OrderedDict()
+        self._depth = 0
+        self._pending: Set[str] = set()
+        self._in_flight: Optional[str] = None
+        self._interactive = 0
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._worker.start()
+
+    def submit(self, keys: Iterable[str], client: str = "", **options) -> int:
+        """
+        Queue keys not queued yet, to be handled as client's with options,
+        returning how many were queued.
+        """
+        queued = 0
+        with self._condition:
+            queue = self._queues.get(client)
+            if queue is None:
+                queue = deque()
+            for key in keys:
+                self.statistics.submitted += 1
+                if key in self._pending:
+                    self.statistics.duplicates += 1
+                elif self._depth >= self.max_queued or \
+                        len(queue) >= self.max_queued_per_client:
+                    self.statistics.dropped += 1
+                else:
+                    queue.append((key, options, time.monotonic()))
+                    self._pending.add(key)
+                    self._depth += 1
+                    queued += 1
+            if queue and client not in self._queues:
+                self._queues[client] = queue
+            self.statistics.queued += queued
+            self._condition.notify_all()
+        return queued
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._pending
+
+    def interactive_started(self):
+        with self._condition:
+            self._interactive += 1
+
+    def interactive_finished(self):
+        with self._condition:
+            self._interactive -= 1
+            self._condition.notify_all()
+
+    def _can_start(self) -> bool:
+        if not self._depth or self._interactive > 0:
+            return False
+        return self.rate_limiter is None or \
+            self.rate_limiter.utilization() < self.max_utilization
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # The rate limiter does not notify, so poll it
+                while not self._can_start():
+                    self._condition.wait(self.poll_seconds)
+                client, queue = next(iter(self._queues.items()))
+                key, options, queued_at = queue.popleft()
+                self._depth -= 1
+                if queue:
+                    self._queues.move_to_end(client)
+                else:
+                    del self._queues[client]
+                self._in_flight = key
+            started_at = time.monotonic()
+            try:
+                completed = self.handler(key, client=client, **options)
+            except Exception as e:
+                print(f"Error prefetching {key}: {str(e)}")
+                completed = False
+            with self._condition:
+                self._in_flight = None
+                self._pending.discard(key)
+                if completed:
+                    self.statistics.completed += 1
+                else:
+                    self.statistics.failed += 1
+                self.statistics.queue_seconds += started_at - queued_at
+                self.statistics.run_seconds += time.monotonic() - started_at
+
+    def report(self) -> dict:
+        with self._condition:
+            return {
+                "depth": self._depth,
+                "clients_queued": len(self._queues),
+                "in_flight": self._in_flight,
+                "interactive_requests": self._interactive,
+                **self.statistics.to_dict()
+            }
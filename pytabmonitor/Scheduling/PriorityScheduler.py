@@ -0,0 +1,292 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+import asyncio
+import inspect
+import threading
+import time
+
+INTERACTIVE = "interactive"
+PERIODIC = "periodic"
+BATCH = "batch"
+
+# Served in this order
+PRIORITY_CLASSES = (INTERACTIVE, PERIODIC, BATCH)
+
+# Queue times kept per class for percentiles
+RECENT_WAITS = 1000
+
+QUEUED = "queued"
+ADMITTED = "admitted"
+CANCELLED = "cancelled"
+
+T = TypeVar("T")
+
+@dataclass(eq=False)
+class Waiter:
+    priority: str
+    client: str
+    cost: float
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # Queues drop a waiter lazily once it is no longer queued
+    state: str = QUEUED
+
+class ClassStatistics:
+    def __init__(self):
+        self.admitted = 0
+        self.cancelled = 0
+        # Admitted ahead of their class after waiting too long
+        self.promoted = 0
+        self.in_flight = 0
+        self.queue_seconds = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=RECENT_WAITS)
+
+    def to_dict(self, queued: int) -> dict:
+        waits = sorted(self.recent_waits)
+        return {
+            "queued": queued,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "cancelled": self.cancelled,
+            "promoted": self.promoted,
+            "average_queue_seconds": round(
+                self.queue_seconds / self.admitted, 4) if self.admitted else None,
+            "p95_queue_seconds": round(
+                waits[int(0.95 * (len(waits) - 1))], 4) if waits else None,
+            "max_queue_seconds": round(waits[-1], 4) if waits else None
+        }
+
+class ClassQueue:
+    """
+    Waiters of one priority class, queued per client and served by deficit
+    round robin: each client in turn gets quantum times its weight added
+    to its deficit and has its calls admitted while their cost fits in it.
+    A client queueing many calls gets the same share as one queueing a few.
+    """
+    def __init__(self, quantum: float):
+        self.quantum = quantum
+        # Clients with queued calls, in round-robin order
+        self.clients: "OrderedDict[str, Deque[Waiter]]" = OrderedDict()
+        self.deficits: Dict[str, float] = {}
+        # Client at the head whose turn has started
+        self.current: Optional[str] = None
+        # Same waiters by arrival, to find the longest waiting one
+        self.arrivals: Deque[Waiter] = deque()
+        self.waiting = 0
+
+    def push(self, waiter: Waiter):
+        queue = self.clients.get(waiter.client)
+        if queue is None:
+            queue = deque()
+            self.clients[waiter.client] = queue
+            self.deficits[waiter.client] = 0.0
+        queue.append(waiter)
+        self.arrivals.append(waiter)
+        self.waiting += 1
+
+    def oldest(self, eligible: Callable[[str], bool]) -> Optional[Waiter]:
+        while self.arrivals and self.arrivals[0].state != QUEUED:
+            self.arrivals.popleft()
+        if self.arrivals and eligible(self.arrivals[0].client):
+            return self.arrivals[0]
+        return None
+
+    def _end_turn(self, client: str):
+        self.clients.move_to_end(client)
+        self.current = None
+
+    def fairest(
+            self,
+            eligible: Callable[[str], bool],
+            weight: Callable[[str], float]) -> Optional[Waiter]:
+        """Next waiter by deficit round robin among eligible clients."""
+        skipped = 0
+        while self.clients and skipped < len(self.clients):
+            client, queue = next(iter(self.clients.items()))
+            while queue and queue[0].state != QUEUED:
+                queue.popleft()
+            if not queue:
+                # Clients with nothing queued get no credit for their idle time
+                del self.clients[client]
+                del self.deficits[client]
+                self.current = None
+                continue
+            if not eligible(client):
+                self._end_turn(client)
+                skipped += 1
+                continue
+            if self.current != client:
+                self.current = client
+                self.deficits[client] += self.quantum * weight(client)
+            if queue[0].cost <= self.deficits[client]:
+                return queue[0]
+            self._end_turn(client)
+            skipped = 0
+        return None
+
+    def remove(self, waiter: Waiter, state: str):
+        waiter.state = state
+        self.waiting -= 1
+
+    def admitted(self, waiter: Waiter):
+        self.remove(waiter, ADMITTED)
+        if waiter.client in self.deficits:
+            self.deficits[waiter.client] = max(
+                self.deficits[waiter.client] - waiter.cost, 0.0)
+
+class PriorityScheduler:
+    """
+    Admits model calls to at most max_concurrent at a time. Waiting calls
+    are admitted interactive first, then periodic, then batch, and within
+    a class fairly across clients by their weights (1 by default) and the
+    cost of each call, e.g. its max_tokens, quantum of it per turn.
+
+    interactive_reserve slots are kept for interactive calls, so a click
+    does not wait behind a full set of background calls. A periodic or
+    batch call that waited longer than its class's max_wait_seconds is
+    admitted like an interactive one, so background work cannot starve.
+
+    A client may have at most max_client_concurrent calls running; its
+    other calls wait while other clients' are admitted, so a client
+    fanning out many calls cannot take every slot.
+
+    All calls must be run on the same event loop.
+    """
+    def __init__(
+            self,
+            max_concurrent: int = 4,
+            interactive_reserve: int = 1,
+            max_wait_seconds: Optional[Dict[str, float]] = None,
+            client_weights: Optional[Dict[str, float]] = None,
+            max_client_concurrent: Optional[int] = None,
+            quantum: float = 1000.0):
+        self.max_concurrent = max_concurrent
+        self.max_client_concurrent = max_client_concurrent
+        self.interactive_reserve = min(interactive_reserve, max_concurrent - 1)
+        self.max_wait_seconds = {PERIODIC: 15.0, BATCH: 60.0} \
+            if max_wait_seconds is None else max_wait_seconds
+        self.client_weights = dict(client_weights or {})
+        self._queues = {priority: ClassQueue(quantum) for priority in PRIORITY_CLASSES}
+        self.statistics = {priority: ClassStatistics() for priority in PRIORITY_CLASSES}
+        self._in_flight = 0
+        self._background_in_flight = 0
+        self._client_in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _has_slot(self, priority: str) -> bool:
+        if self._in_flight >= self.max_concurrent:
+            return False
+        return priority == INTERACTIVE or \
+            self._background_in_flight < self.max_concurrent - self.interactive_reserve
+
+    def _client_eligible(self, client: str) -> bool:
+        return self.max_client_concurrent is None or \
+            self._client_in_flight.get(client, 0) < self.max_client_concurrent
+
+    def _client_weight(self, client: str) -> float:
+        return self.client_weights.get(client, 1.0)
+
+    def _next(self) -> Optional[Waiter]:
+        now = time.monotonic()
+        for priority, max_wait in self.max_wait_seconds.items():
+            oldest = self._queues[priority].oldest(self._client_eligible)
+            if oldest is not None and now - oldest.enqueued_at > max_wait and \
+                    self._in_flight < self.max_concurrent:
+                self.statistics[priority].promoted += 1
+                return oldest
+        for priority in PRIORITY_CLASSES:
+            fairest = self._queues[priority].fairest(
+                self._client_eligible, self._client_weight)
+            if fairest is not None:
+                return fairest if self._has_slot(priority) else None
+        return None
+
+    def _admit(self, waiter: Waiter):
+        self._queues[waiter.priority].admitted(waiter)
+        statistics = self.statistics[waiter.priority]
+        wait = time.monotonic() - waiter.enqueued_at
+        statistics.admitted += 1
+        statistics.in_flight += 1
+        statistics.queue_seconds += wait
+        statistics.recent_waits.append(wait)
+        self._in_flight += 1
+        self._client_in_flight[waiter.client] = \
+            self._client_in_flight.get(waiter.client, 0) + 1
+        if waiter.priority != INTERACTIVE:
+            self._background_in_flight += 1
+        waiter.future.set_result(None)
+
+    def _dispatch(self):
+        while True:
+            waiter = self._next()
+            if waiter is None:
+                return
+            if waiter.future.cancelled():
+                # Its task has not handled the cancellation yet
+                self._queues[waiter.priority].remove(waiter, CANCELLED)
+                self.statistics[waiter.priority].cancelled += 1
+                continue
+            self._admit(waiter)
+
+    def _release(self, priority: str, client: str):
+        with self._lock:
+            self._in_flight -= 1
+            self._client_in_flight[client] -= 1
+            if not self._client_in_flight[client]:
+                del self._client_in_flight[client]
+            self.statistics[priority].in_flight -= 1
+            if priority != INTERACTIVE:
+                self._background_in_flight -= 1
+            self._dispatch()
+
+    async def run(
+            self,
+            awaitable: Awaitable[T],
+            priority: str = INTERACTIVE,
+            client: str = "",
+            cost: float = 1.0) -> T:
+        """Await awaitable once admitted. Cancelling while queued dequeues it."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class {priority}")
+        with self._lock:
+            queue = self._queues[priority]
+            waiter = Waiter(
+                priority,
+                client,
+                max(cost, 1.0),
+                asyncio.get_running_loop().create_future())
+            queue.push(waiter)
+            self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                state = waiter.state
+                if state == QUEUED:
+                    queue.remove(waiter, CANCELLED)
+                    self.statistics[priority].cancelled += 1
+            if state == ADMITTED:
+                # Admitted just as it was cancelled
+                self._release(priority, client)
+            if inspect.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await awaitable
+        finally:
+            self._release(priority, client)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "interactive_reserve": self.interactive_reserve,
+                "max_client_concurrent": self.max_client_concurrent,
+                "in_flight": self._in_flight,
+                "clients_in_flight": len(self._client_in_flight),
+                "classes": {
+                    priority: self.statistics[priority].to_dict(
+                        self._queues[priority].waiting)
+                    for priority in PRIORITY_CLASSES}
+            }
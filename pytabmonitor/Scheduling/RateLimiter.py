@@ -0,0 +1,147 @@
+from collections import deque
+from typing import Optional
+import asyncio
+import threading
+import time
+
+class Reservation:
+    """Tokens and one request taken from a RateLimiter at a point in time."""
+    __slots__ = ("time", "tokens")
+
+    def __init__(self, time: float, tokens: int):
+        self.time = time
+        self.tokens = tokens
+
+class RateLimiter:
+    """
+    Sliding-window limit on tokens and requests per minute, matching how
+    Groq enforces its TPM/RPM limits. A limit of None means unlimited.
+
+    Callers reserve their estimated tokens (prompt plus max_tokens) before
+    a call and may settle the reservation to the actual usage after.
+    """
+    def __init__(
+            self,
+            tokens_per_minute: Optional[int] = None,
+            requests_per_minute: Optional[int] = None,
+            window_seconds: float = 60.0):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.window_seconds = window_seconds
+        # Reservations still inside the window, oldest first
+        self._reservations = deque()
+        self._tokens_in_window = 0
+        self._requests_in_window = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _expire(self, now: float):
+        while self._reservations and \
+                now - self._reservations[0].time >= self.window_seconds:
+            reservation = self._reservations.popleft()
+            self._tokens_in_window -= reservation.tokens
+            self._requests_in_window -= 1
+
+    def _fits(self, tokens: int) -> bool:
+        if self.tokens_per_minute is not None and \
+                self._tokens_in_window + tokens > self.tokens_per_minute:
+            return False
+        if self.requests_per_minute is not None and \
+                self._requests_in_window + 1 > self.requests_per_minute:
+            return False
+        return True
+
+    def _check_possible(self, tokens: int):
+        if self.tokens_per_minute is not None and \
+                tokens > self.tokens_per_minute:
+            raise ValueError(
+                f"{tokens} tokens exceed the whole budget of "
+                f"{self.tokens_per_minute} tokens per minute")
+
+    def try_acquire(self, tokens: int) -> Optional[Reservation]:
+        """Reserve tokens and one request now, or return None."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if not self._fits(tokens):
+                self.rejected += 1
+                return None
+            reservation = Reservation(now, tokens)
+            self._reservations.append(reservation)
+            self._tokens_in_window += tokens
+            self._requests_in_window += 1
+            return reservation
+
+    def wait_time(self, tokens: int) -> float:
+        """Seconds until a reservation of tokens could succeed."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if self._fits(tokens):
+                return 0.0
+            tokens_in_window = self._tokens_in_window
+            requests_in_window = self._requests_in_window
+            for reservation in self._reservations:
+                tokens_in_window -= reservation.tokens
+                requests_in_window -= 1
+                tokens_fit = self.tokens_per_minute is None or \
+                    tokens_in_window + tokens <= self.tokens_per_minute
+                requests_fit = self.requests_per_minute is None or \
+                    requests_in_window + 1 <= self.requests_per_minute
+                if tokens_fit and requests_fit:
+                    return max(
+                        reservation.time + self.window_seconds - now, 0.0)
+            return self.window_seconds
+
+    def utilization(self) -> float:
+        """Fraction of the token or request limit used, whichever is higher."""
+        with self._lock:
+            self._expire(time.monotonic())
+            fractions = [0.0]
+            if self.tokens_per_minute:
+                fractions.append(self._tokens_in_window / self.tokens_per_minute)
+            if self.requests_per_minute:
+                fractions.append(self._requests_in_window / self.requests_per_minute)
+            return max(fractions)
+
+    async def acquire(self, tokens: int) -> Reservation:
+        """Wait until tokens and one request can be reserved, then do so."""
+        self._check_possible(tokens)
+        while True:
+            reservation = self.try_acquire(tokens)
+            if reservation is not None:
+                return reservation
+            await asyncio.sleep(max(self.wait_time(tokens), 0.01))
+
+    def acquire_blocking(self, tokens: int) -> Reservation:
+        """Synchronous counterpart of acquire for worker threads."""
+        self._check_possible(tokens)
+        while True:
+            reservation = self.try_acquire(tokens)
+            if reservation is not None:
+                return reservation
+            time.sleep(max(self.wait_time(tokens), 0.01))
+
+    def settle(self, reservation: Reservation, used_tokens: int):
+        """
+        Shrink a reservation to the tokens actually used, e.g. once the
+        completion's usage is known. Has no effect once it left the window.
+        """
+        with self._lock:
+            unused = reservation.tokens - used_tokens
+            if unused <= 0 or reservation.time + self.window_seconds <= \
+                    time.monotonic():
+                return
+            reservation.tokens = used_tokens
+            self._tokens_in_window -= unused
+
+    def report(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "tokens_per_minute": self.tokens_per_minute,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_in_window": self._tokens_in_window,
+                "requests_in_window": self._requests_in_window,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,53 @@
+from typing import Dict, Hashable, Tuple
+import concurrent.futures
+import threading
+
+class RequestSupersession:
+    """
+    Tracks the in-flight model call for each key, for example
+    (client id, endpoint, URL). Tracking a newer call under the same key
+    cancels the older one if it has not finished yet, so upstream capacity
+    goes to the page the user is looking at now.
+
+    Tokens saved are an upper-bound estimate: the completion budget
+    (max_tokens) of every call cancelled before it finished.
+    """
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Tuple[concurrent.futures.Future, int]] = {}
+        self._lock = threading.Lock()
+        self.tracked = 0
+        self.superseded = 0
+        self.estimated_tokens_saved = 0
+
+    def track(
+            self,
+            key: Hashable,
+            future: concurrent.futures.Future,
+            estimated_tokens: int = 0):
+        with self._lock:
+            previous = self._in_flight.get(key)
+            self._in_flight[key] = (future, estimated_tokens)
+            self.tracked += 1
+
+        if previous is not None and previous[0].cancel():
+            with self._lock:
+                self.superseded += 1
+                self.estimated_tokens_saved += previous[1]
+            print(f"Cancelled superseded request for {key}")
+
+        future.add_done_callback(lambda done: self._forget(key, done))
+
+    def _forget(self, key: Hashable, future: concurrent.futures.Future):
+        with self._lock:
+            current = self._in_flight.get(key)
+            if current is not None and current[0] is future:
+                del self._in_flight[key]
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "tracked": self.tracked,
+                "in_flight": len(self._in_flight),
+                "superseded": self.superseded,
+                "estimated_tokens_saved": self.estimated_tokens_saved
+            }
@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import hashlib
+import threading
+
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import (
+    ChatCompletionConfiguration)
+from pytabmonitor.GroqAPIWrappers.ModelBackends import get_usage_tokens
+from pytabmonitor.Prompts.PromptTemplates import PromptTemplate
+from pytabmonitor.Prompts.TextChunking import split_text
+from pytabmonitor.Prompts.TokenEstimation import estimate_tokens
+from pytabmonitor.Scheduling.RateLimiter import RateLimiter
+
+@dataclass
+class SummaryResult:
+    text: str
+    # Chunks of the original text, and how many of them were cached.
+    chunks: int = 0
+    cached_chunks: int = 0
+    model_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Map and reduce rounds run; 0 if the text was short enough as is.
+    rounds: int = 0
+
+class ChunkSummaryCache:
+    """Summaries by content hash of the text summarized, least recent out."""
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        digest = hashlib.blake2b(namespace.encode("utf-8"), digest_size=16)
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+            return summary
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class MapReduceSummarizer:
+    """
+    Condenses text too long for one prompt. The text is split into chunks
+    on semantic boundaries, the chunks are summarized in parallel (at most
+    max_parallel calls at a time, each waiting for its tokens in the rate
+    limiter), and the joined summaries are reduced the same way, in groups,
+    until they fit target_tokens.
+
+    Summaries are cached by a hash of the text they summarize, so when a
+    page changes slightly only its changed chunks are summarized again.
+
+    create_chat_completion is called like
+    ModelBackendRegistry.acreate_chat_completion and must return a
+    RoutedCompletion.
+    """
+    def __init__(
+            self,
+            create_chat_completion: Callable[..., Awaitable],
+            prompt: PromptTemplate,
+            rate_limiter: Optional[RateLimiter] = None,
+            model_name: Optional[str] = "llama-3.1-8b-instant",
+            chunk_tokens: int = 1500,
+            summary_max_tokens: int = 200,
+            target_tokens: int = 2000,
+            max_parallel: int = 4,
+            max_rounds: int = 3,
+            cache: Optional[ChunkSummaryCache] = None):
+        self.create_chat_completion = create_chat_completion
+        self.prompt = prompt
+        self.rate_limiter = rate_limiter
+        self.model_name = model_name
+        self.chunk_tokens = chunk_tokens
+        self.target_tokens = target_tokens
+        self.max_parallel = max_parallel
+        self.max_rounds = max_rounds
+        self.cache = cache if cache is not None else ChunkSummaryCache()
+        self.configuration = replace(
+            ChatCompletionConfiguration(),
+            temperature=0.0,
+            max_tokens=summary_max_tokens)
+        # Cached summaries depend on the prompt and model as well as the text.
+        self._namespace = f"{prompt.name}\0{model_name}\0{summary_max_tokens}"
+
+    def needs_summary(self, text: str) -> bool:
+        return estimate_tokens(text) > self.target_tokens
+
+    async def _summarize_chunk(
+            self,
+            chunk: str,
+            semaphore: asyncio.Semaphore,
+            result: SummaryResult,
+            fields: dict) -> str:
+        key = ChunkSummaryCache.make_key(self._namespace, chunk)
+        summary = self.cache.get(key)
+        if summary is not None:
+            result.cached_chunks += 1
+            return summary
+
+        async with semaphore:
+            messages, prompt_tokens = self.prompt.render_messages(
+                max_prompt_tokens=self.chunk_tokens * 2,
+                chunk=chunk,
+                **fields)
+            reservation = None
+            if self.rate_limiter is not None:
+                reservation = await self.rate_limiter.acquire(
+                    prompt_tokens + self.configuration.max_tokens)
+            # The tokens used, none if the call fails or is cancelled
+            used_prompt_tokens, used_completion_tokens = 0, 0
+            try:
+                routed = await self.create_chat_completion(
+                    messages,
+                    configuration=self.configuration,
+                    model_name=self.model_name)
+                used_prompt_tokens, used_completion_tokens = \
+                    get_usage_tokens(routed.result)
+            finally:
+                if reservation is not None:
+                    self.rate_limiter.settle(
+                        reservation, used_prompt_tokens + used_completion_tokens)
+        result.model_calls += 1
+        result.prompt_tokens += used_prompt_tokens
+        result.completion_tokens += used_completion_tokens
+
+        summary = (routed.result.choices[0].message.content or "").strip()
+        self.cache.put(key, summary)
+        return summary
+
+    async def _summarize_chunks(
+            self,
+            chunks: List[str],
+            result: SummaryResult,
+            fields: dict) -> List[str]:
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        return list(await asyncio.gather(*(
+            self._summarize_chunk(chunk, semaphore, result, fields)
+            for chunk in chunks)))
+
+    async def summarize(self, text: str, **fields) -> SummaryResult:
+        """
+        Summarize text to about target_tokens or less. Extra fields (such
+        as url) fill the other placeholders of the prompt. Text that
+        already fits is returned unchanged.
+        """
+        result = SummaryResult(text=text)
+        if not self.needs_summary(text):
+            return result
+
+        chunks = split_text(text, self.chunk_tokens)
+        result.chunks = len(chunks)
+        while result.rounds < self.max_rounds:
+            summaries = await self._summarize_chunks(chunks, result, fields)
+            result.rounds += 1
+            result.text = "\n\n".join(
+                summary for summary in summaries if summary)
+            if not self.needs_summary(result.text) or len(chunks) == 1:
+                break
+            # Reduce: summarize groups of summaries in the next round.
+            chunks = split_text(result.text, self.chunk_tokens)
+        return result
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, List, Optional
+import difflib
+import threading
+import time
+
+from pytabmonitor.Prompts.TokenEstimation import estimate_tokens
+
+# Above this fraction of changed text a page is analyzed from scratch; the
+# delta would cost about as much and describe the page worse.
+FULL_ANALYSIS_DIFF_RATIO = 0.5
+
+def _lines(text: str) -> List[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+@dataclass
+class PageDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed_tokens: int = 0
+    total_tokens: int = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.added and not self.removed
+
+    @property
+    def ratio(self) -> float:
+        """Changed tokens relative to the larger of the two texts."""
+        if self.total_tokens == 0:
+            return 0.0 if self.is_empty else 1.0
+        return min(self.changed_tokens / self.total_tokens, 1.0)
+
+def compute_page_diff(old_text: str, new_text: str) -> PageDiff:
+    """Line-level diff of two page texts, ignoring blank lines and indents."""
+    old_lines = _lines(old_text)
+    new_lines = _lines(new_text)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    diff = PageDiff()
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag in ("replace", "delete"):
+            diff.removed.extend(old_lines[old_start:old_end])
+        if tag in ("replace", "insert"):
+            diff.added.extend(new_lines[new_start:new_end])
+    diff.changed_tokens = max(
+        sum(estimate_tokens(line) for line in diff.added),
+        sum(estimate_tokens(line) for line in diff.removed))
+    diff.total_tokens = max(
+        estimate_tokens(old_text), estimate_tokens(new_text))
+    return diff
+
+@dataclass
+class PageSession:
+    """The last analyzed text of a page and the analysis it produced."""
+    text: str
+    analysis: str
+    updated_at: float = field(default_factory=time.time)
+    full_analyses: int = 0
+    incremental_analyses: int = 0
+    unchanged: int = 0
+
+class PageDiffSessions:
+    """
+    Page sessions by key, for example (client id, URL), so that a page
+    whose text keeps changing (live feeds, chat apps) is re-analyzed from
+    the delta against its last analysis rather than from scratch. Sessions
+    idle for ttl_seconds are dropped, as are the least recent ones beyond
+    max_sessions.
+    """
+    def __init__(
+            self,
+            max_sessions: int = 256,
+            ttl_seconds: float = 30 * 60,
+            full_analysis_ratio: float = FULL_ANALYSIS_DIFF_RATIO):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.full_analysis_ratio = full_analysis_ratio
+        self._sessions: "OrderedDict[Hashable, PageSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.full_analyses = 0
+        self.incremental_analyses = 0
+        self.unchanged = 0
+
+    def get(self, key: Hashable) -> Optional[PageSession]:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl_seconds:
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return session
+
+    def needs_full_analysis(
+            self,
+            session: Optional[PageSession],
+            diff: PageDiff) -> bool:
+        return session is None or diff.ratio > self.full_analysis_ratio
+
+    def record_unchanged(self, session: PageSession):
+        with self._lock:
+            session.unchanged += 1
+            session.updated_at = time.time()
+            self.unchanged += 1
+
+    def update(
+            self,
+            key: Hashable,
+            text: str,
+            analysis: str,
+            incremental: bool) -> PageSession:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = PageSession(text, analysis)
+                self._sessions[key] = session
+            session.text = text
+            session.analysis = analysis
+            session.updated_at = time.time()
+            if incremental:
+                session.incremental_analyses += 1
+                self.incremental_analyses += 1
+            else:
+                session.full_analyses += 1
+                self.full_analyses += 1
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "full_analyses": self.full_analyses,
+                "incremental_analyses": self.incremental_analyses,
+                "unchanged": self.unchanged,
+                "full_analysis_ratio": self.full_analysis_ratio
+            }
@@ -0,0 +1,34 @@
+import asyncio
+import concurrent.futures
+import threading
+
+class BackgroundEventLoop:
+    """
+    An asyncio event loop running forever in a daemon thread, so that
+    synchronous code (such as Flask request handlers) can run async model
+    calls and cancel them through the returned futures.
+    """
+    def __init__(self, name: str = "pytabmonitor-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine) -> concurrent.futures.Future:
+        """
+        Schedule coroutine on the loop. Cancelling the returned future
+        cancels the coroutine's task.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout=None):
+        """Run coroutine on the loop and block until it returns."""
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -1,3 +1,4 @@
 from pytabmonitor.Utilities.load_environment_file import (
     load_environment_file,
-    get_environment_variable)
\ No newline at end of file
+    get_environment_variable)
+from pytabmonitor.Utilities.BackgroundEventLoop import BackgroundEventLoop
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""
+Analyze a list of URLs into the analysis cache without running the server:
+
+    python -m pytabmonitor.bulk urls.txt --concurrency 8
+
+URLs are read one per line (blank lines and lines starting with # are
+skipped) and researched like /stock-research does, through the async model
+wrappers, with at most --concurrency calls in flight and within the
+per-minute token and request limits. URLs already cached, answered by the
+entity table or seen earlier in the file are skipped.
+
+Progress is checkpointed next to the input file. Running the same command
+again after an interruption resumes after the last line whose URL and every
+URL before it was handled. URLs that failed are appended to a .failed file,
+which can be run again as an input. Do not run this against the cache file
+of a running server; the server would overwrite what it writes.
+"""
+from dataclasses import replace
+from pathlib import Path
+from typing import Iterator, Optional, Set
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+import urllib.parse
+
+from pytabmonitor.Utilities.load_environment_file import (
+    load_environment_file,
+    get_environment_variable)
+from pytabmonitor.GroqAPIWrappers.GroqAPIWrapper import AsyncGroqAPIWrapper
+from pytabmonitor.GroqAPIWrappers.LocalDeterministicWrapper import (
+    LocalDeterministicWrapper)
+from pytabmonitor.GroqAPIWrappers.ModelBackendRegistry import (
+    ModelBackendRegistry)
+from pytabmonitor.GroqAPIWrappers.ModelBackends import (
+    ModelCapabilities,
+    get_usage_tokens)
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import (
+    ChatCompletionConfiguration)
+from pytabmonitor.ModelRouting.PageComplexityRouter import (
+    PageComplexityRouter,
+    PageSignals)
+from pytabmonitor.Prompts.AnalysisPrompts import (
+    STOCK_RESEARCH_PROMPT,
+    STRUCTURED_RESEARCH_PROMPT)
+from pytabmonitor.Scheduling.RateLimiter import RateLimiter
+from pytabmonitor.AnalysisStorage.AnalysisCache import (
+    AnalysisCache,
+    get_cache_key,
+    get_key_domain)
+from pytabmonitor.AnalysisStorage.DomainEntityTable import DomainEntityTable
+from pytabmonitor.AnalysisStorage.StructuredAnalysis import (
+    parse_structured_analysis)
+
+# Same cap as the server's structured answers
+STRUCTURED_MAX_TOKENS = 600
+
+def get_limit(environment_variable_name):
+    value = os.environ.get(environment_variable_name, "")
+    return int(value) if value else None
+
+class BulkProgress:
+    """Counts of a run, and the lines of the input known to be handled."""
+    def __init__(self, start_line: int = 0):
+        self.start_line = start_line
+        self.analyzed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.tokens = 0
+        self.started_at = time.monotonic()
+        self._read_lines = start_line
+        # Lines queued or being analyzed
+        self._pending: Set[int] = set()
+
+    def read(self, line_number: int):
+        self._read_lines = line_number + 1
+
+    def queued(self, line_number: int):
+        self._pending.add(line_number)
+
+    def finished(self, line_number: int):
+        self._pending.discard(line_number)
+
+    @property
+    def handled_lines(self) -> int:
+        """Lines of the input before which every line was handled."""
+        return min(self._pending) if self._pending else self._read_lines
+
+    def rate(self) -> float:
+        return self.analyzed / max(time.monotonic() - self.started_at, 1e-9)
+
+    def to_dict(self) -> dict:
+        return {
+            "analyzed": self.analyzed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "tokens": self.tokens
+        }
+
+class BulkAnalyzer:
+    def __init__(
+            self,
+            cache: AnalysisCache,
+            model_registry: ModelBackendRegistry,
+            rate_limiter: RateLimiter,
+            entities: Optional[DomainEntityTable] = None,
+            concurrency: int = 4,
+            structured: bool = False,
+            save_every: int = 100,
+            report_seconds: float = 10.0):
+        self.cache = cache
+        self.model_registry = model_registry
+        self.rate_limiter = rate_limiter
+        self.entities = entities
+        self.concurrency = concurrency
+        self.structured = structured
+        self.save_every = save_every
+        self.report_seconds = report_seconds
+        self.router = PageComplexityRouter()
+        self.configuration = ChatCompletionConfiguration(
+            temperature=0.7,
+            max_tokens=1000,
+            stream=False)
+
+    async def analyze(self, cache_key: str):
+        """Research one URL and cache the analysis, returning tokens used."""
+        route_decision = self.router.route(PageSignals(
+            url=cache_key,
+            domain_cached=get_key_domain(cache_key) in self.cache.domains))
+        max_tokens = route_decision.route.max_tokens
+        configuration = replace(self.configuration, max_tokens=max_tokens)
+        required = ModelCapabilities()
+        template = STOCK_RESEARCH_PROMPT
+        if self.structured:
+            configuration = replace(
+                configuration,
+                max_tokens=min(max_tokens, STRUCTURED_MAX_TOKENS),
+                response_format={"type": "json_object"})
+            required = ModelCapabilities(json_mode=True)
+            template = STRUCTURED_RESEARCH_PROMPT
+
+        _, model = self.model_registry.select(required, route_decision.route.model_name)
+        messages, prompt_tokens = template.render_messages(
+            max_prompt_tokens=model.context_window - configuration.max_tokens,
+            url=cache_key)
+        reservation = await self.rate_limiter.acquire(
+            prompt_tokens + configuration.max_tokens)
+        routed = await self.model_registry.acreate_chat_completion(
+            messages,
+            configuration=configuration,
+            required=required,
+            model_name=route_decision.route.model_name)
+        tokens = sum(get_usage_tokens(routed.result))
+        self.rate_limiter.settle(reservation, tokens)
+
+        analysis_text = routed.result.choices[0].message.content
+        if self.structured:
+            value = parse_structured_analysis(analysis_text).to_dict()
+        else:
+            value = analysis_text
+        self.cache.put(cache_key, value, persist=False)
+        return tokens
+
+    def _should_skip(self, cache_key: str, seen: Set[str]) -> bool:
+        domain = urllib.parse.urlparse(cache_key).netloc
+        if not cache_key.startswith(("http://", "https://")) or not domain:
+            print(f"Skipping invalid URL {cache_key}")
+            return True
+        if cache_key in seen or cache_key in self.cache:
+            return True
+        return self.entities is not None and self.entities.lookup(domain) is not None
+
+    async def run(
+            self,
+            lines: Iterator[str],
+            progress: BulkProgress,
+            checkpoint,
+            failed_path: Path):
+        """
+        Analyze the URLs of lines, numbered from progress.start_line, calling
+        checkpoint() after the cache is saved.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * self.concurrency)
+        since_save = 0
+
+        def save():
+            nonlocal since_save
+            self.cache.save()
+            checkpoint()
+            since_save = 0
+
+        async def work():
+            nonlocal since_save
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                line_number, cache_key = item
+                try:
+                    progress.tokens += await self.analyze(cache_key)
+                    progress.analyzed += 1
+                except Exception as e:
+                    print(f"Error analyzing {cache_key}: {str(e)}")
+                    progress.failed += 1
+                    with open(failed_path, "a") as f:
+                        f.write(cache_key + "\n")
+                progress.finished(line_number)
+                since_save += 1
+                if since_save >= self.save_every:
+                    save()
+
+        async def report():
+            last_analyzed, last_time = 0, time.monotonic()
+            while True:
+                await asyncio.sleep(self.report_seconds)
+                now = time.monotonic()
+                print(
+                    f"{progress.analyzed} analyzed, {progress.failed} failed, "
+                    f"{progress.skipped} skipped, up to line {progress.handled_lines}: "
+                    f"{(progress.analyzed - last_analyzed) / (now - last_time):.2f} URLs/s "
+                    f"now, {progress.rate():.2f} URLs/s overall, "
+                    f"{progress.tokens} tokens")
+                last_analyzed, last_time = progress.analyzed, now
+
+        workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(report())
+        seen: Set[str] = set()
+        try:
+            for line_number, line in enumerate(lines, progress.start_line):
+                url = line.strip()
+                if url and not url.startswith("#"):
+                    cache_key = get_cache_key(url)
+                    if self._should_skip(cache_key, seen):
+                        progress.skipped += 1
+                    else:
+                        seen.add(cache_key)
+                        progress.queued(line_number)
+                        await queue.put((line_number, cache_key))
+                progress.read(line_number)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            for worker in workers:
+                worker.cancel()
+            save()
+
+def read_lines(path: Path, start_line: int) -> Iterator[str]:
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f):
+            if line_number >= start_line:
+                yield line
+
+def load_checkpoint(path: Path, input_path: Path) -> int:
+    """Lines of input_path already handled according to the checkpoint."""
+    if not path.exists():
+        return 0
+    with open(path, "r") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("input") != str(input_path.resolve()):
+        raise ValueError(f"Checkpoint {path} belongs to {checkpoint.get('input')}")
+    return checkpoint["lines"]
+
+def save_checkpoint(path: Path, input_path: Path, progress: BulkProgress):
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "w") as f:
+        json.dump({
+            "input": str(input_path.resolve()),
+            "lines": progress.handled_lines,
+            "updated_at": time.time(),
+            **progress.to_dict()
+        }, f)
+    os.replace(temporary_path, path)
+
+def create_model_registry(local: bool) -> ModelBackendRegistry:
+    model_registry = ModelBackendRegistry()
+    try:
+        wrapper = AsyncGroqAPIWrapper(api_key=get_environment_variable("GROQ_API_KEY"))
+        wrapper.configuration = ChatCompletionConfiguration(
+            model="llama-3.3-70b-versatile",
+            temperature=0.7,
+            max_tokens=1000,
+            stream=False)
+        model_registry.register(wrapper)
+    except Exception as e:
+        print(f"Error initializing AsyncGroqAPIWrapper: {e}")
+    if local:
+        model_registry.register(LocalDeterministicWrapper(), fallback_only=True)
+    return model_registry
+
+def parse_arguments(arguments=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m pytabmonitor.bulk",
+        description="Research a list of URLs into the analysis cache.")
+    parser.add_argument("input", type=Path, help="file with one URL per line")
+    parser.add_argument(
+        "--cache", type=Path, default=Path("url_analysis_cache.json"),
+        help="analysis cache to fill (default: %(default)s)")
+    parser.add_argument(
+        "--checkpoint", type=Path,
+        help="progress file (default: the input path with .checkpoint appended)")
+    parser.add_argument(
+        "--restart", action="store_true",
+        help="ignore the checkpoint and start from the first line")
+    parser.add_argument(
+        "--concurrency", type=int, default=4,
+        help="model calls in flight at once (default: %(default)s)")
+    parser.add_argument(
+        "--tokens-per-minute", type=int,
+        default=get_limit("PYTABMONITOR_TOKENS_PER_MINUTE"),
+        help="token limit (default: $PYTABMONITOR_TOKENS_PER_MINUTE, else none)")
+    parser.add_argument(
+        "--requests-per-minute", type=int,
+        default=get_limit("PYTABMONITOR_REQUESTS_PER_MINUTE"),
+        help="request limit (default: $PYTABMONITOR_REQUESTS_PER_MINUTE, else none)")
+    parser.add_argument(
+        "--structured", action="store_true",
+        help="cache structured (JSON mode) analyses instead of markdown")
+    parser.add_argument(
+        "--local", action="store_true",
+        default=os.environ.get("PYTABMONITOR_LOCAL_BACKEND", "") not in ("", "0"),
+        help="fall back to the local deterministic backend")
+    parser.add_argument(
+        "--save-every", type=int, default=100,
+        help="save the cache and checkpoint after this many URLs (default: %(default)s)")
+    parser.add_argument(
+        "--report-seconds", type=float, default=10.0,
+        help="seconds between throughput reports (default: %(default)s)")
+    return parser.parse_args(arguments)
+
+def main(arguments=None) -> int:
+    arguments = parse_arguments(arguments)
+    load_environment_file()
+    input_path = arguments.input
+    checkpoint_path = arguments.checkpoint or \
+        input_path.with_name(input_path.name + ".checkpoint")
+    failed_path = input_path.with_name(input_path.name + ".failed")
+
+    start_line = 0 if arguments.restart else load_checkpoint(checkpoint_path, input_path)
+    if start_line:
+        print(f"Resuming {input_path} after line {start_line}")
+
+    model_registry = create_model_registry(arguments.local)
+    if not model_registry.candidates():
+        print("Error: No model backend available; set GROQ_API_KEY or pass --local")
+        return 1
+
+    cache = AnalysisCache(arguments.cache, compress=True)
+    print(f"Loaded {cache.load()} cached analyses from {arguments.cache}")
+    entities = DomainEntityTable()
+    try:
+        entities.load()
+    except Exception as e:
+        print(f"Error loading entity table: {str(e)}")
+        entities = None
+
+    analyzer = BulkAnalyzer(
+        cache,
+        model_registry,
+        RateLimiter(arguments.tokens_per_minute, arguments.requests_per_minute),
+        entities=entities,
+        concurrency=arguments.concurrency,
+        structured=arguments.structured,
+        save_every=arguments.save_every,
+        report_seconds=arguments.report_seconds)
+    progress = BulkProgress(start_line)
+    try:
+        asyncio.run(analyzer.run(
+            read_lines(input_path, start_line),
+            progress,
+            lambda: save_checkpoint(checkpoint_path, input_path, progress),
+            failed_path))
+    except KeyboardInterrupt:
+        print(f"Interrupted; run again to resume after line {progress.handled_lines}")
+        return 130
+    except Exception as e:
+        print(f"Error running bulk analysis: {str(e)}")
+        print(traceback.format_exc())
+        return 1
+
+    elapsed = time.monotonic() - progress.started_at
+    print(
+        f"Done in {elapsed:.1f}s: {progress.analyzed} analyzed "
+        f"({progress.rate():.2f} URLs/s), {progress.failed} failed, "
+        f"{progress.skipped} skipped, {progress.tokens} tokens")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
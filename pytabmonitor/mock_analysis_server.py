@@ -1,76 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify, send_file
 from flask_cors import CORS
 import time
 import sys
+import atexit
 import traceback
 from pathlib import Path
 import base64
 import re
-<<<<<<< HEAD
 import urllib.parse
-import json
-import os
-
-# Set up a fallback environment variable loader in case the import fails
-def fallback_load_environment_file():
-    """Load environment variables from .env file (fallback implementation)"""
-    print("Using fallback environment loader")
-    env_path = Path('.env')
-    if env_path.exists():
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                key, value = line.split('=', 1)
-                os.environ[key] = value
-                print(f"Loaded environment variable: {key}")
-    else:
-        print("No .env file found")
-
-def fallback_get_environment_variable(name, default=None):
-    """Get an environment variable (fallback implementation)"""
-    return os.environ.get(name, default)
-
-# Try to import from the repository or use the fallback
-try:
-    # Add the repository root to the Python path
-    # Assuming mock_analysis_server.py is one level deep from repo root
-    file_path = Path(__file__).resolve()  # Get the absolute path of the current file
-    repo_root = file_path.parent.parent   # Go up one level to get repo root
-    sys.path.insert(0, str(repo_root))    # Add repo root to Python path
-    
-    # Try to import modules from pytabmonitor
-    try:
-        from pytabmonitor.Utilities.load_environment_file import (
-            load_environment_file,
-            get_environment_variable)
-        print("Successfully imported load_environment_file from pytabmonitor")
-    except ImportError:
-        print("Could not import from pytabmonitor.Utilities, using fallback")
-        load_environment_file = fallback_load_environment_file
-        get_environment_variable = fallback_get_environment_variable
-    
-    try:
-        from pytabmonitor.GroqAPIWrappers.GroqAPIWrapper import GroqAPIWrapper
-        print("Successfully imported GroqAPIWrapper from pytabmonitor")
-        has_groq_wrapper = True
-    except ImportError:
-        print("Could not import GroqAPIWrapper, will use mock responses only")
-        has_groq_wrapper = False
-        
-    # Load environment variables from .env file
-    load_environment_file()
-    
-except Exception as e:
-    print(f"Error setting up imports: {e}")
-    print("Using fallback implementations")
-    load_environment_file = fallback_load_environment_file
-    get_environment_variable = fallback_get_environment_variable
-    has_groq_wrapper = False
-    load_environment_file()
-=======
->>>>>>> a440591 (Groq can read images)
+import concurrent.futures
 
 # Add the repository root to the Python path
 # Assuming mock_analysis_server.py is one level deep from repo root
@@ -82,7 +20,86 @@ sys.path.insert(0, str(repo_root))    # Add repo root to Python path
 from pytabmonitor.Utilities.load_environment_file import (
     load_environment_file,
     get_environment_variable)
-from pytabmonitor.GroqAPIWrappers.GroqAPIWrapper import GroqAPIWrapper
+from pytabmonitor.Utilities.BackgroundEventLoop import BackgroundEventLoop
+from pytabmonitor.GroqAPIWrappers.GroqAPIWrapper import AsyncGroqAPIWrapper
+from pytabmonitor.GroqAPIWrappers.CompletionCache import (
+    CompletionCache,
+    CompletionCachePolicy)
+from pytabmonitor.GroqAPIWrappers.LocalDeterministicWrapper import (
+    LocalDeterministicWrapper)
+from pytabmonitor.GroqAPIWrappers.ModelBackendRegistry import (
+    ModelBackendRegistry)
+from pytabmonitor.GroqAPIWrappers.ModelBackends import (
+    ModelCapabilities,
+    get_usage_tokens)
+from pytabmonitor.GroqAPIWrappers.ChatCompletionConfiguration import (
+    ChatCompletionConfiguration)
+from pytabmonitor.ModelRouting.PageComplexityRouter import (
+    PageComplexityRouter,
+    PageSignals,
+    create_model_classifier)
+from pytabmonitor.ModelRouting.PageAnalysisModes import (
+    ESCALATION_MODEL_INSUFFICIENT,
+    INCREMENTAL_MODE,
+    TEXT_MODE,
+    VISION_MODE,
+    ModeDecision,
+    PageAnalysisModeSelector,
+    PageText,
+    is_insufficient_answer)
+from pytabmonitor.Scheduling.RequestSupersession import RequestSupersession
+from pytabmonitor.Scheduling.ClientQuotas import ClientQuotas, QuotaExceededError
+from pytabmonitor.Scheduling.PrefetchQueue import PrefetchQueue
+from pytabmonitor.Scheduling.PriorityScheduler import (
+    BATCH,
+    INTERACTIVE,
+    PERIODIC,
+    PriorityScheduler)
+from pytabmonitor.Scheduling.RateLimiter import RateLimiter
+from pytabmonitor.Prompts.PromptTemplates import PromptBudgetError
+from pytabmonitor.Prompts.TokenEstimation import estimate_message_tokens
+from pytabmonitor.Prompts.AnalysisPrompts import (
+    CHUNK_SUMMARY_PROMPT,
+    PAGE_TEXT_PROMPT,
+    PAGE_UPDATE_PROMPT,
+    SCREENSHOT_PROMPT,
+    STOCK_RESEARCH_PROMPT,
+    STRUCTURED_RESEARCH_PROMPT)
+from pytabmonitor.Summarization.MapReduceSummarizer import (
+    ChunkSummaryCache,
+    MapReduceSummarizer)
+from pytabmonitor.Summarization.PageDiff import (
+    PageDiffSessions,
+    compute_page_diff)
+from pytabmonitor.AnalysisStorage.AnalysisCache import (
+    AnalysisCache,
+    get_cache_key,
+    get_key_domain)
+from pytabmonitor.AnalysisStorage.AnalysisHistory import (
+    AnalysisHistory,
+    HistoryEvent)
+from pytabmonitor.AnalysisStorage.DomainEntityTable import (
+    DEFAULT_ENTITY_TABLE_PATH,
+    DomainEntityTable)
+from pytabmonitor.AnalysisStorage.FullTextIndex import FullTextIndex
+from pytabmonitor.AnalysisStorage.HashingEmbedder import HashingEmbedder
+from pytabmonitor.AnalysisStorage.VectorIndex import VectorIndex
+from pytabmonitor.AnalysisStorage.ScreenshotArchive import ScreenshotArchive
+from pytabmonitor.AnalysisStorage.TextSnapshotHistory import TextSnapshotHistory
+from pytabmonitor.AnalysisStorage.NearDuplicateIndex import (
+    NearDuplicateIndex,
+    simhash)
+from pytabmonitor.AnalysisStorage.FailureCache import (
+    INVALID_OUTPUT,
+    FailureCache)
+from pytabmonitor.AnalysisStorage.StructuredAnalysis import (
+    StructuredAnalysisError,
+    parse_structured_analysis,
+    structured_from_markdown,
+    validate_structured_analysis)
+from dataclasses import replace
+from datetime import datetime
+import os
 
 # Load environment variables from .env file
 load_environment_file()
@@ -91,119 +108,382 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS so the Chrome extension can access this server
 
 
-# Track already analyzed URLs to avoid duplicate API calls
-analyzed_urls = {}
+# Track already analyzed URLs to avoid duplicate API calls. Values are saved
+# compressed with a dictionary trained on them; set
+# PYTABMONITOR_COMPRESS_CACHE_IN_MEMORY=1 to keep them compressed in memory too.
+compress_cache_in_memory = os.environ.get("PYTABMONITOR_COMPRESS_CACHE_IN_MEMORY") == "1"
+analysis_cache = AnalysisCache(
+    'url_analysis_cache.json',
+    compress=True,
+    compress_in_memory=compress_cache_in_memory)
+
+# Known entities by domain, reloaded when the table file changes. Set
+# PYTABMONITOR_ENTITY_TABLE to use another table.
+domain_entities = DomainEntityTable(
+    os.environ.get("PYTABMONITOR_ENTITY_TABLE") or DEFAULT_ENTITY_TABLE_PATH)
+
+# Embeddings of cached research analyses, for looking up similar entities.
+# They are derived from the cache and rebuilt from it on startup, and their
+# index is trained in the background once they are numerous.
+analysis_embedder = HashingEmbedder()
+analysis_vectors = VectorIndex(analysis_embedder.dimensions, maintenance_seconds=60)
+
+def describe_analysis(cache_key, value):
+    """Text of a research analysis to embed: its domain and what it says"""
+    if isinstance(value, dict):
+        value = " ".join(
+            " ".join(field) if isinstance(field, list) else str(field)
+            for name, field in value.items()
+            if name not in ("type", "filings"))
+    return f"{get_key_domain(cache_key)} {value}"
+
+# Full-text search over research analyses (keys "research:<url>") and
+# analyzed page text (keys "page:<url>")
+search_index = FullTextIndex('search_index.jsonl')
+
+def index_research_text(cache_key, value):
+    if isinstance(value, dict):
+        value = validate_structured_analysis(value).to_markdown()
+    search_index.add(f"research:{cache_key}", value)
+
+def store_research_analysis(cache_key, value):
+    """Cache a research analysis, persisting it, and index it for lookups"""
+    analysis_cache.put(cache_key, value)
+    analysis_vectors.add(
+        cache_key, analysis_embedder.embed([describe_analysis(cache_key, value)])[0])
+    index_research_text(cache_key, value)
+
+# Recent failed analyses per URL and format, answered without a model call
+# until their backoff expires
+failure_cache = FailureCache()
 
-# Initialize the GroqAPIWrapper with API key from environment
+# Timeline of analyses served, partitioned by day, for operators to review.
+# Finished days are sealed by a background thread.
+analysis_history = AnalysisHistory('analysis_history', maintenance_seconds=60)
+
+def record_history(url, kind, routed=None):
+    """Record an analysis served by a model call (routed) or without one"""
+    cache_key = get_cache_key(url)
+    event = HistoryEvent(
+        url=cache_key,
+        domain=get_key_domain(cache_key) or cache_key,
+        kind=kind,
+        cached=routed is None)
+    if routed is not None:
+        event.model = routed.model
+        event.latency_seconds = routed.latency_seconds
+        event.prompt_tokens, event.completion_tokens = get_usage_tokens(routed.result)
+    analysis_history.record(event)
+
+# Set PYTABMONITOR_SCREENSHOT_ARCHIVE to a directory to keep the screenshots
+# received, deduplicated and within PYTABMONITOR_SCREENSHOT_QUOTA_MB (512 by
+# default), for debugging what the model saw
+screenshot_archive = None
+screenshot_archive_directory = os.environ.get("PYTABMONITOR_SCREENSHOT_ARCHIVE", "")
+if screenshot_archive_directory:
+    screenshot_archive = ScreenshotArchive(
+        screenshot_archive_directory,
+        quota_bytes=int(os.environ.get("PYTABMONITOR_SCREENSHOT_QUOTA_MB", "512")) * 1024 * 1024)
+
+# Structured (JSON mode) answers are short; cap their completion budget
+STRUCTURED_MAX_TOKENS = 600
+
+# Every model backend the server may route requests to
+model_registry = ModelBackendRegistry()
+
+# Settings shared by every analysis call; routes override model and max_tokens
+analysis_configuration = ChatCompletionConfiguration(
+    temperature=0.7,
+    max_tokens=1000,
+    stream=False)
+
+# Model calls run on this loop so that superseded ones can be cancelled
+analysis_loop = BackgroundEventLoop()
+request_supersession = RequestSupersession()
+
+# Admits model calls to PYTABMONITOR_MAX_CONCURRENT_MODEL_CALLS (4 by default)
+# at a time: user clicks first, then periodic page analyses, then prefetches,
+# each fairly across clients, of which none runs more than
+# PYTABMONITOR_CLIENT_MAX_MODEL_CALLS (2 by default) at once
+model_scheduler = PriorityScheduler(
+    max_concurrent=int(os.environ.get("PYTABMONITOR_MAX_CONCURRENT_MODEL_CALLS") or 4),
+    max_client_concurrent=int(os.environ.get("PYTABMONITOR_CLIENT_MAX_MODEL_CALLS") or 2))
+
+# Initialize the AsyncGroqAPIWrapper with API key from environment
 try:
     api_key = get_environment_variable("GROQ_API_KEY")
     print(f"Got API key: {api_key[:4]}...{api_key[-4:]} (length: {len(api_key)})")
     
-    groq_api_wrapper = GroqAPIWrapper(
+    groq_api_wrapper = AsyncGroqAPIWrapper(
         api_key=api_key
     )
-    # Configure the API wrapper
-    groq_api_wrapper.configuration.temperature = 0.7
-    groq_api_wrapper.configuration.max_tokens = 1000
-    groq_api_wrapper.configuration.stop = None
-    groq_api_wrapper.configuration.stream = False
+    # Configure the API wrapper; make sure we set a model - this is often
+    # required
+    groq_api_wrapper.configuration = ChatCompletionConfiguration(
+        model="llama-3.3-70b-versatile",
+        temperature=0.7,
+        max_tokens=1000,
+        stop=None,
+        stream=False)
     
-    # Make sure we set a model - this is often required
-    groq_api_wrapper.configuration.model = "llama-3.3-70b-versatile"
-    
-    print("Successfully initialized GroqAPIWrapper")
+    # Set PYTABMONITOR_COMPLETION_CACHE to a directory to reuse completions
+    # of identical prompts (same instructions, same screenshot) across
+    # requests and restarts. Only deterministic (temperature 0) completions
+    # are reused unless PYTABMONITOR_COMPLETION_CACHE_SAMPLED=1 allows
+    # reusing sampled ones too.
+    completion_cache_directory = os.environ.get(
+        "PYTABMONITOR_COMPLETION_CACHE", "")
+    if completion_cache_directory:
+        groq_api_wrapper.enable_completion_cache(CompletionCache(
+            completion_cache_directory,
+            CompletionCachePolicy(allow_sampled=os.environ.get(
+                "PYTABMONITOR_COMPLETION_CACHE_SAMPLED", "") == "1")))
+        print(f"Caching completions in {completion_cache_directory}")
+
+    model_registry.register(groq_api_wrapper)
+    print("Successfully initialized AsyncGroqAPIWrapper")
     print(f"Using model: {groq_api_wrapper.configuration.model}")
 except Exception as e:
-    print(f"Error initializing GroqAPIWrapper: {e}")
+    print(f"Error initializing AsyncGroqAPIWrapper: {e}")
     print(traceback.format_exc())
     groq_api_wrapper = None
 
-def create_system_message(content):
-    """Helper function to create a system message"""
-    return {"role": "system", "content": content}
-
-def create_user_message(text_content, image_base64=None):
-    """Create a user message with optional image content"""
-    if image_base64:
-        # Create a multimodal message with both text and image
-        return {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": text_content},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_base64}"
-                    }
-                }
-            ]
-        }
-    else:
-        # Text-only message
-        return {"role": "user", "content": text_content}
+# Set PYTABMONITOR_LOCAL_BACKEND=1 to answer offline with the deterministic
+# local backend whenever no Groq backend is available or healthy.
+if os.environ.get("PYTABMONITOR_LOCAL_BACKEND", "") not in ("", "0"):
+    local_wrapper = LocalDeterministicWrapper()
+    local_wrapper.configuration = replace(
+        local_wrapper.configuration, temperature=0.7, max_tokens=1000)
+    model_registry.register(local_wrapper, fallback_only=True)
+    print("Registered local deterministic backend for offline runs")
 
-@app.route('/analyze-screenshot', methods=['POST'])
-def analyze_screenshot():
-    # Get the data from the request
-    data = request.json
+def has_model_backend():
+    return len(model_registry.candidates()) > 0
+
+def get_client_id():
+    """Identify the extension instance that sent the current request"""
+    return request.headers.get('X-Client-Id') or request.remote_addr
+
+def get_supersession_key(url, kind=None):
+    """
+    Key of a model call that a newer one supersedes: same client, same
+    endpoint (or kind of call) and same page
+    """
+    return (get_client_id(), kind or request.path, get_cache_key(url))
+
+def scheduled_completion(priority, client):
+    """
+    acreate_chat_completion, admitted by the model scheduler as client's
+    work and charged to its token quota. Raises PromptBudgetError if the
+    quota is exhausted.
+    """
+    async def create_chat_completion(messages, configuration=None, **routing):
+        max_tokens = configuration.max_tokens if configuration and configuration.max_tokens else 1
+        try:
+            reservation = client_quotas.reserve(
+                client, estimate_message_tokens(messages) + max_tokens)
+        except QuotaExceededError as e:
+            raise PromptBudgetError(
+                f"{e}; retry in {e.retry_after:.0f} seconds") from e
+        routed = None
+        try:
+            routed = await model_scheduler.run(
+                model_registry.acreate_chat_completion(
+                    messages,
+                    configuration=configuration,
+                    **routing),
+                priority,
+                client,
+                cost=max_tokens)
+            return routed
+        finally:
+            if routed is not None:
+                client_quotas.record(client, reservation, *get_usage_tokens(routed.result))
+            else:
+                client_quotas.release(client, reservation)
+    return create_chat_completion
+
+def run_model_request(supersession_key, messages, configuration, reservation, priority=INTERACTIVE, **routing):
+    """
+    Run a routed completion on the analysis loop, once the model scheduler
+    admits it, and wait for it. A newer request with the same
+    supersession_key (client id, kind, URL) cancels this one, in which case
+    concurrent.futures.CancelledError is raised. The reservation from
+    prepare_prompt is settled to the tokens used however the call ends,
+    none if it failed or was cancelled.
+    """
+    used_tokens = 0
+    try:
+        future = analysis_loop.submit(scheduled_completion(priority, supersession_key[0])(
+            messages,
+            configuration=configuration,
+            **routing))
+        request_supersession.track(
+            supersession_key,
+            future,
+            configuration.max_tokens or 0)
+        routed = future.result()
+        used_tokens = sum(get_usage_tokens(routed.result))
+        return routed
+    finally:
+        token_rate_limiter.settle(reservation, used_tokens)
+
+def get_limit(environment_variable_name):
+    """Read an optional integer limit; unset or empty means unlimited"""
+    value = os.environ.get(environment_variable_name, "")
+    return int(value) if value else None
+
+# Per-minute budget shared by all model calls, e.g. the account's Groq limits
+token_rate_limiter = RateLimiter(
+    tokens_per_minute=get_limit("PYTABMONITOR_TOKENS_PER_MINUTE"),
+    requests_per_minute=get_limit("PYTABMONITOR_REQUESTS_PER_MINUTE"))
+
+# Per-client limits, so that one runaway extension instance cannot use up
+# the server: PYTABMONITOR_CLIENT_MAX_REQUESTS analysis requests in flight
+# (8 by default) and PYTABMONITOR_CLIENT_TOKENS_PER_MINUTE (unlimited by
+# default) of the budget above
+client_quotas = ClientQuotas(
+    max_concurrent_requests=int(os.environ.get("PYTABMONITOR_CLIENT_MAX_REQUESTS") or 8),
+    tokens_per_minute=get_limit("PYTABMONITOR_CLIENT_TOKENS_PER_MINUTE"))
+
+def prepare_prompt(template, max_tokens, model_name=None, required=ModelCapabilities(), **fields):
+    """
+    Render a precompiled prompt so that it fits the context window of the
+    model it will be routed to, and reserve its estimated tokens in the
+    per-minute budget. Raises PromptBudgetError before any network call if
+    either does not fit.
+    """
+    _, model = model_registry.select(required, model_name)
+    messages, prompt_tokens = template.render_messages(
+        max_prompt_tokens=model.context_window - max_tokens,
+        **fields)
+    reservation = token_rate_limiter.try_acquire(prompt_tokens + max_tokens)
+    if reservation is None:
+        raise PromptBudgetError(
+            f"Per-minute token budget exhausted; {prompt_tokens + max_tokens} tokens needed")
+    return messages, reservation
+
+def analysis_response(domain, value, structured):
+    """
+    Respond with a cached analysis in the format the client asked for.
+    Markdown entries requested as structured are converted per response;
+    the conversion is lossy, so the cached markdown is kept as it is.
+    """
+    if structured:
+        if isinstance(value, str):
+            value = structured_from_markdown(value, domain).to_dict()
+        return jsonify({
+            "success": True,
+            "structured": value
+        })
+    if isinstance(value, dict):
+        value = validate_structured_analysis(value).to_markdown()
+    return jsonify({
+        "success": True,
+        "analysis": value
+    })
+
+def failure_response(failure):
+    """Respond with a failed analysis and when it is worth retrying"""
+    return jsonify({
+        "success": False,
+        "analysis": f"Error analyzing URL: {failure.message}",
+        "errorClass": failure.error_class,
+        "retryAfter": round(failure.retry_after_seconds(), 1)
+    })
+
+def superseded_response():
+    return jsonify({
+        "success": False,
+        "superseded": True,
+        "analysis": "Superseded by a newer request from this client"
+    })
+
+def run_classifier_completion(messages, priority=INTERACTIVE, client='', **kwargs):
+    """Run a route classifier call as client's work, at its research's priority"""
+    return analysis_loop.run(
+        scheduled_completion(priority, client)(messages, **kwargs))
+
+# Set PYTABMONITOR_ROUTE_CLASSIFIER=1 to let a small model downgrade pages the
+# routing rules would send to the large model.
+research_router = PageComplexityRouter(
+    classifier=create_model_classifier(run_classifier_completion)
+    if os.environ.get("PYTABMONITOR_ROUTE_CLASSIFIER", "") not in ("", "0")
+    else None)
+
+def get_screenshot_data(data):
+    """Base64 screenshot from a request, or None if missing or invalid"""
+    if 'screenshot' not in data:
+        print("No screenshot data received")
+        return None
     
     # Print some info about the received screenshot
-    screenshot_data = None
-    if 'screenshot' in data:
-        screenshot_length = len(data['screenshot'])
-        raw_screenshot = data['screenshot']
-        print(f"Received screenshot data ({screenshot_length} bytes)")
-        
-        # Ensure proper base64 formatting
-        # First, check if the data already contains the data URL prefix
-        if raw_screenshot.startswith('data:'):
-            # Extract just the base64 part if it's already a data URL
-            match = re.search(r'base64,(.+)', raw_screenshot)
-            if match:
-                screenshot_data = match.group(1)
-            else:
-                screenshot_data = raw_screenshot
+    screenshot_length = len(data['screenshot'])
+    raw_screenshot = data['screenshot']
+    print(f"Received screenshot data ({screenshot_length} bytes)")
+    
+    # Ensure proper base64 formatting
+    # First, check if the data already contains the data URL prefix
+    if raw_screenshot.startswith('data:'):
+        # Extract just the base64 part if it's already a data URL
+        match = re.search(r'base64,(.+)', raw_screenshot)
+        if match:
+            screenshot_data = match.group(1)
         else:
-            # If it's raw base64, use it directly
             screenshot_data = raw_screenshot
-            
-        # Validate that it's proper base64
-        try:
-            # Try to decode to verify it's valid base64
-            base64.b64decode(screenshot_data)
-        except Exception as e:
-            print(f"Invalid base64 data: {str(e)}")
-            screenshot_data = None
     else:
-        print("No screenshot data received")
+        # If it's raw base64, use it directly
+        screenshot_data = raw_screenshot
+        
+    # Validate that it's proper base64
+    try:
+        # Try to decode to verify it's valid base64
+        screenshot_bytes = base64.b64decode(screenshot_data)
+    except Exception as e:
+        print(f"Invalid base64 data: {str(e)}")
+        return None
+    
+    if screenshot_archive is not None:
+        # Archived by a background thread, off the request path
+        screenshot_archive.submit(
+            screenshot_bytes, url=data.get('url') or '', client=get_client_id())
+    return screenshot_data
+
+@app.route('/analyze-screenshot', methods=['POST'])
+def analyze_screenshot():
+    # Get the data from the request
+    data = request.json
+    screenshot_data = get_screenshot_data(data)
     
-    # If GroqAPIWrapper is available, use it to analyze the screenshot
-    if groq_api_wrapper and screenshot_data:
+    # If a model backend is available, use it to analyze the screenshot
+    if has_model_backend() and screenshot_data:
         try:
             # For vision models, we can't use system messages with images
-            # So we'll incorporate the instructions into the user message
-            user_message = create_user_message(
-                "You are an AI assistant that analyzes screenshots of webpages. "
-                "Describe what you see in this image in detail, including text content, "
-                "layout, and visual elements. Be thorough but concise.",
-                screenshot_data
-            )
+            # So the screenshot prompt carries the instructions itself
+            messages, reservation = prepare_prompt(
+                SCREENSHOT_PROMPT,
+                analysis_configuration.max_tokens,
+                required=ModelCapabilities(vision=True),
+                image_base64=screenshot_data)
             
-            # Create messages array with only the user message
-            messages = [user_message]
+            print("Sending request to model backend...")
             
-            print("Sending request to Groq API...")
-            
-            # Update model to vision-capable model
-            groq_api_wrapper.configuration.model = "llama-3.2-11b-vision-preview"
-            
-            # Get completion from Groq
-            result = groq_api_wrapper.create_chat_completion(messages)
+            # Route to the fastest healthy vision-capable model
+            routed = run_model_request(
+                get_supersession_key(data.get('url') or ''),
+                messages,
+                analysis_configuration,
+                reservation,
+                priority=PERIODIC,
+                required=ModelCapabilities(vision=True))
+            result = routed.result
+            print(f"Served by {routed.backend_name}/{routed.model} in {routed.latency_seconds:.2f}s")
             
             # Extract the response content
             if hasattr(result, 'choices') and len(result.choices) > 0:
                 analysis_text = result.choices[0].message.content
-                print(f"Successfully received content from Groq API")
+                print(f"Successfully received content from {routed.backend_name}")
+                record_history(data.get('url') or '', 'screenshot', routed)
             else:
                 error_msg = "Unexpected response format from Groq API"
                 print(error_msg)
@@ -214,6 +494,15 @@ def analyze_screenshot():
                 "analysis": analysis_text
             })
             
+        except concurrent.futures.CancelledError:
+            print("Model request superseded by a newer one from the same client")
+            return superseded_response()
+        except PromptBudgetError as e:
+            print(f"Prompt rejected before sending: {str(e)}")
+            return jsonify({
+                "success": False,
+                "analysis": f"Error: {str(e)}"
+            })
         except Exception as e:
             error_detail = str(e)
             stack_trace = traceback.format_exc()
@@ -236,14 +525,327 @@ def analyze_screenshot():
         "analysis": "I can see a webpage displayed in a browser window. The page contains text content, navigation elements, and possibly images. The layout appears to be structured with headers and content sections. This analysis is a mock response - when using the real Groq API, you'll receive a detailed description of the actual content visible in the screenshot."
     })
 
+# Tracks latency and cost of text-first page analysis per mode
+page_mode_selector = PageAnalysisModeSelector()
+
+# Chunk summaries of long page text, shared by every client's summarizer
+page_summary_cache = ChunkSummaryCache()
+
+def create_page_summarizer(client):
+    """Condenses long page text in parallel chunk summaries before text analysis"""
+    return MapReduceSummarizer(
+        scheduled_completion(PERIODIC, client),
+        CHUNK_SUMMARY_PROMPT,
+        rate_limiter=token_rate_limiter,
+        cache=page_summary_cache)
+
+def run_page_analysis(decision, template, configuration, required=ModelCapabilities(), model_name=None, **fields):
+    """Run one page analysis call and record it against its mode"""
+    messages, reservation = prepare_prompt(
+        template,
+        configuration.max_tokens,
+        model_name=model_name,
+        required=required,
+        **fields)
+    routed = run_model_request(
+        get_supersession_key(request.json.get('url') or ''),
+        messages,
+        configuration,
+        reservation,
+        priority=PERIODIC,
+        required=required,
+        model_name=model_name)
+    prompt_tokens, completion_tokens = get_usage_tokens(routed.result)
+    record_history(request.json.get('url') or '', decision.mode, routed)
+    model = model_registry.find_model(routed.model)
+    page_mode_selector.record(
+        decision,
+        routed.latency_seconds,
+        prompt_tokens,
+        completion_tokens,
+        model.estimate_cost(prompt_tokens, completion_tokens) if model else 0.0)
+    return routed.result.choices[0].message.content
+
+# Last analyzed text and analysis per client and page, for incremental updates
+page_sessions = PageDiffSessions()
+
+# Every distinct text the extension sent per client and page, as compressed
+# snapshots and deltas, so the text of a page at any time can be rebuilt
+page_text_history = TextSnapshotHistory()
+
+# Text analyses of pages, and SimHash fingerprints of their text, so that
+# mirrors, syndicated copies and variants of an analyzed page reuse its
+# analysis instead of costing another model call
+page_analysis_cache = AnalysisCache(
+    'page_analysis_cache.json',
+    compress=True,
+    compress_in_memory=compress_cache_in_memory)
+page_fingerprints = NearDuplicateIndex('page_fingerprints.tsv')
+
+# Embeddings of analyzed page text. A URL whose page reads like a page with
+# cached research (the same entity under another domain) reuses that
+# research instead of generating it again.
+# They are saved and their index trained in the background every 30 seconds,
+# and saved once more at exit.
+page_vectors = VectorIndex(
+    analysis_embedder.dimensions, path='page_vectors.npz', maintenance_seconds=30)
+atexit.register(page_vectors.save_if_changed)
+RESEARCH_REUSE_MIN_SCORE = 0.9
+
+def index_page_text(cache_key, page):
+    search_index.add(f"page:{cache_key}", f"{page.title}\n{page.full_text}")
+    page_vectors.add(
+        cache_key,
+        analysis_embedder.embed([f"{page.title}\n{page.full_text}"])[0])
+
+def find_reusable_research(cache_key):
+    """Cached research of the page most like this URL's page, if close enough"""
+    vector = page_vectors.get(cache_key)
+    if vector is None:
+        return None
+    for match in page_vectors.search(
+            vector,
+            min_score=RESEARCH_REUSE_MIN_SCORE,
+            exclude_keys=(cache_key,)):
+        value = analysis_cache.get(match.key)
+        if value is not None:
+            return match, value
+    return None
+
+def get_page_text(data):
+    return PageText(
+        url=data.get('url') or '',
+        title=data.get('title') or '',
+        meta_description=data.get('metaDescription') or '',
+        main_heading=data.get('mainHeading') or '',
+        full_text=data.get('fullText') or '')
+
+def get_page_session_key(page):
+    return (get_client_id(), get_cache_key(page.url))
+
+def record_page_text(page):
+    if page.full_text:
+        page_text_history.record(get_page_session_key(page), page.full_text)
+
+def analyze_page_text(decision, page):
+    """
+    Analyze a page from its text alone, summarizing long text first. Pages
+    whose text is a near-duplicate of an analyzed page reuse its analysis.
+    """
+    cache_key = get_cache_key(page.url)
+    fingerprint = simhash(page.full_text)
+    if fingerprint is not None:
+        duplicate = page_fingerprints.find(fingerprint)
+        analysis_text = page_analysis_cache.get(duplicate.key) if duplicate else None
+        if analysis_text is not None:
+            print(
+                f"Reusing analysis of {duplicate.key} for {cache_key} "
+                f"(fingerprints {duplicate.distance} bits apart)")
+            page_sessions.update(
+                get_page_session_key(page), page.full_text, analysis_text, incremental=False)
+            index_page_text(cache_key, page)
+            record_history(page.url, decision.mode)
+            return analysis_text
+    
+    page_text = page.full_text
+    page_summarizer = create_page_summarizer(get_client_id())
+    if page_summarizer.needs_summary(page_text):
+        # Summarize long pages chunk by chunk instead of truncating
+        future = analysis_loop.submit(
+            page_summarizer.summarize(page_text, url=page.url))
+        request_supersession.track(
+            get_supersession_key(page.url, f"{request.path} summary"), future)
+        summary = future.result()
+        page_text = summary.text
+        print(
+            f"Summarized {summary.chunks} chunks ({summary.cached_chunks} cached) "
+            f"in {summary.rounds} rounds and {summary.model_calls} model calls")
+    analysis_text = run_page_analysis(
+        decision,
+        PAGE_TEXT_PROMPT,
+        replace(analysis_configuration, max_tokens=page_mode_selector.text_max_tokens),
+        model_name=page_mode_selector.text_model_name,
+        url=page.url,
+        title=page.title,
+        meta_description=page.meta_description,
+        main_heading=page.main_heading,
+        page_text=page_text)
+    if not is_insufficient_answer(analysis_text):
+        # Later text changes of this page can be analyzed incrementally
+        page_sessions.update(
+            get_page_session_key(page), page.full_text, analysis_text, incremental=False)
+        if fingerprint is not None:
+            page_analysis_cache.put(cache_key, analysis_text)
+            page_fingerprints.add(cache_key, fingerprint)
+            index_page_text(cache_key, page)
+    return analysis_text
+
+@app.route('/analyze-page', methods=['POST'])
+def analyze_page():
+    """
+    Analyze a page from the text the extension extracted, with a cheap text
+    model. The screenshot, if sent, is only analyzed by a vision model when
+    the page has too little text or the text model cannot tell what it shows.
+    """
+    data = request.json
+    page = get_page_text(data)
+    record_page_text(page)
+    screenshot_data = get_screenshot_data(data)
+    
+    if not has_model_backend():
+        return jsonify({
+            "success": False,
+            "analysis": "Error: No model backend available"
+        })
+    
+    decision = page_mode_selector.select(page, screenshot_data is not None)
+    try:
+        if decision.mode == TEXT_MODE:
+            analysis_text = analyze_page_text(decision, page)
+            if not is_insufficient_answer(analysis_text):
+                return jsonify({
+                    "success": True,
+                    "mode": TEXT_MODE,
+                    "analysis": analysis_text
+                })
+            if screenshot_data is None:
+                return jsonify({
+                    "success": False,
+                    "mode": TEXT_MODE,
+                    "needsScreenshot": True,
+                    "analysis": "Error: The page text is not enough to analyze this page"
+                })
+            decision = page_mode_selector.escalate(
+                decision,
+                ESCALATION_MODEL_INSUFFICIENT,
+                "text model found the text insufficient")
+        
+        analysis_text = run_page_analysis(
+            decision,
+            SCREENSHOT_PROMPT,
+            analysis_configuration,
+            required=ModelCapabilities(vision=True),
+            image_base64=screenshot_data)
+        return jsonify({
+            "success": True,
+            "mode": VISION_MODE,
+            "analysis": analysis_text
+        })
+    
+    except concurrent.futures.CancelledError:
+        print("Model request superseded by a newer one from the same client")
+        return superseded_response()
+    except PromptBudgetError as e:
+        print(f"Prompt rejected before sending: {str(e)}")
+        return jsonify({
+            "success": False,
+            "analysis": f"Error: {str(e)}"
+        })
+    except Exception as e:
+        print(f"Error analyzing page: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            "success": False,
+            "analysis": f"Error analyzing page: {str(e)}"
+        })
+
+@app.route('/analyze-page-update', methods=['POST'])
+def analyze_page_update():
+    """
+    Re-analyze a page whose text changed since its last analysis for this
+    client. Only the changed lines and the previous analysis are sent to
+    the model; pages without a previous analysis, or whose text changed
+    too much, are analyzed in full.
+    """
+    data = request.json
+    page = get_page_text(data)
+    record_page_text(page)
+    
+    if not has_model_backend():
+        return jsonify({
+            "success": False,
+            "analysis": "Error: No model backend available"
+        })
+    
+    session_key = get_page_session_key(page)
+    session = page_sessions.get(session_key)
+    diff = compute_page_diff(session.text if session else "", page.full_text)
+    if session is not None and diff.is_empty:
+        page_sessions.record_unchanged(session)
+        return jsonify({
+            "success": True,
+            "mode": "unchanged",
+            "analysis": session.analysis
+        })
+    
+    try:
+        if page_sessions.needs_full_analysis(session, diff):
+            decision = ModeDecision(TEXT_MODE, [
+                "no previous analysis" if session is None
+                else f"diff ratio {diff.ratio:.2f}"])
+            analysis_text = analyze_page_text(decision, page)
+            if is_insufficient_answer(analysis_text):
+                return jsonify({
+                    "success": False,
+                    "mode": TEXT_MODE,
+                    "needsScreenshot": True,
+                    "analysis": "Error: The page text is not enough to analyze this page"
+                })
+            return jsonify({
+                "success": True,
+                "mode": TEXT_MODE,
+                "analysis": analysis_text
+            })
+        
+        decision = ModeDecision(INCREMENTAL_MODE, [
+            f"{len(diff.added)} lines added, {len(diff.removed)} removed, "
+            f"diff ratio {diff.ratio:.2f}"])
+        analysis_text = run_page_analysis(
+            decision,
+            PAGE_UPDATE_PROMPT,
+            replace(analysis_configuration, max_tokens=page_mode_selector.text_max_tokens),
+            model_name=page_mode_selector.text_model_name,
+            url=page.url,
+            previous_analysis=session.analysis,
+            removed="\n".join(diff.removed) or "(none)",
+            added="\n".join(diff.added) or "(none)")
+        page_sessions.update(session_key, page.full_text, analysis_text, incremental=True)
+        return jsonify({
+            "success": True,
+            "mode": INCREMENTAL_MODE,
+            "analysis": analysis_text
+        })
+    
+    except concurrent.futures.CancelledError:
+        print("Model request superseded by a newer one from the same client")
+        return superseded_response()
+    except PromptBudgetError as e:
+        print(f"Prompt rejected before sending: {str(e)}")
+        return jsonify({
+            "success": False,
+            "analysis": f"Error: {str(e)}"
+        })
+    except Exception as e:
+        print(f"Error updating page analysis: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            "success": False,
+            "analysis": f"Error analyzing page: {str(e)}"
+        })
+
 # Replace the existing stock-research endpoint with this improved version
 
 @app.route('/stock-research', methods=['POST'])
 def stock_research():
     """Endpoint for analyzing URLs for stock information and technical research"""
-    # Get the data from the request
-    data = request.json
-    
+    return research_response(request.json, get_client_id(), request.path)
+
+def research_response(data, client, kind, priority=INTERACTIVE):
+    """
+    Research the URL in data from the cache, the entity table or a model,
+    superseding any model call of client's still running for the same kind
+    of request and URL
+    """
     if 'url' not in data:
         return jsonify({
             "success": False,
@@ -251,133 +853,141 @@ def stock_research():
         })
     
     url = data['url']
+    # Clients that render from JSON ask for format "structured"
+    structured = data.get('format') == 'structured'
     
     # Normalize the URL to handle variations
-    try:
-        parsed_url = urllib.parse.urlparse(url)
-        domain = parsed_url.netloc
-        clean_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-        print(f"Analyzing URL: {clean_url} (Domain: {domain})")
-    except Exception as e:
-        print(f"Error parsing URL '{url}': {str(e)}")
-        clean_url = url
-        domain = url
+    clean_url = get_cache_key(url)
+    domain = urllib.parse.urlparse(clean_url).netloc or url
+    supersession_key = (client, kind, clean_url)
+    print(f"Analyzing URL: {clean_url} (Domain: {domain})")
     
     # Check cache for previous analysis
-    if clean_url in analyzed_urls:
+    cached_analysis = analysis_cache.get(clean_url)
+    if cached_analysis is not None:
         print(f"Using cached analysis for {clean_url}")
-        return jsonify({
-            "success": True,
-            "analysis": analyzed_urls[clean_url]
-        })
+        record_history(clean_url, 'research')
+        return analysis_response(domain, cached_analysis, structured)
+    
+    # Polls for an analysis that just failed get the same error back
+    failure_key = (clean_url, structured)
+    failure = failure_cache.get(failure_key)
+    if failure is not None:
+        print(f"Recent {failure.error_class} failure for {clean_url}, not retrying yet")
+        return failure_response(failure)
+    
+    # Well-known domains are answered from the entity table, without a
+    # model call
+    known_entity = domain_entities.lookup(domain)
+    if known_entity is not None:
+        print(f"Using entity table entry for {known_entity.entity}")
+        value = known_entity.analysis_value()
+        if structured and isinstance(value, str):
+            value = structured_from_markdown(value, domain).to_dict()
+        record_history(clean_url, 'research')
+        return analysis_response(domain, value, structured)
     
-    # If GroqAPIWrapper is available, use it for analysis
-    if groq_api_wrapper:
+    # Reuse research of a page that reads the same, e.g. another domain of
+    # the same entity, before generating it again
+    reusable = find_reusable_research(clean_url)
+    if reusable is not None:
+        match, value = reusable
+        print(f"Reusing research of {match.key} for {clean_url} (similarity {match.score:.2f})")
+        store_research_analysis(clean_url, value)
+        record_history(clean_url, 'research')
+        return analysis_response(domain, value, structured)
+    
+    # If a model backend is available, use it for analysis
+    if has_model_backend():
         try:
-            # System message with improved instructions
-            system_message = create_system_message(
-                "You are an expert financial and technical researcher specializing in company stock analysis and deep research. "
-                "Your task is to analyze a website URL and provide detailed, structured information."
-            )
-            
-            # Enhanced user message with more specific instructions
-            user_message = create_user_message(
-                f"Analyze this URL thoroughly: {clean_url}\n\n"
-                "STEP 1: Determine if this website is related to a publicly traded company.\n"
-                "- Look for company names, corporate domains, product references\n"
-                "- Check if there are hints of stock market presence\n\n"
-                "STEP 2: If it IS a publicly traded company:\n"
-                "- Identify and prominently display the stock ticker symbol and exchange\n"
-                "- Find the most recent SEC filings (focus on Form 10-K, Form 10-Q, Form 8-K)\n"
-                "- Extract key financial data: revenue, profit margins, EPS, market cap\n"
-                "- Identify primary business segments and growth areas\n"
-                "- Report any recent significant news or developments\n\n"
-                "STEP 3: If it is NOT a publicly traded company:\n"
-                "- Determine the entity type (private company, non-profit, government, educational, etc.)\n"
-                "- Conduct deep research using 'sonar-deep-research' methodology:\n"
-                "  * Find research papers, technical documentation, or whitepapers\n"
-                "  * Discover most upvoted content on Reddit, Quora, Twitter, TikTok\n"
-                "  * Identify mentions in major publications (The Atlantic, Washington Post, NYT, etc.)\n"
-                "  * Look for industry associations, competitors, and market position\n"
-                "  * Analyze technical aspects, innovations, or specialized knowledge\n\n"
-                "FORMAT YOUR RESPONSE AS FOLLOWS:\n"
-                "1. For public companies:\n"
-                "```\n"
-                "# [TICKER]: [COMPANY NAME]\n\n"
-                "## Company Overview\n"
-                "[Brief description, 1-2 sentences]\n\n"
-                "**Exchange:** [Exchange name]\n"
-                "**Industry:** [Primary industry]\n\n"
-                "## Recent SEC Filings\n"
-                "- Most recent 10-K: [Date, key points]\n"
-                "- Most recent 10-Q: [Date, key points]\n"
-                "- Recent 8-K: [Date, purpose]\n\n"
-                "## Financial Highlights\n"
-                "- Revenue: [Amount] ([Period])\n"
-                "- [Other key metrics]\n\n"
-                "## Business Segments\n"
-                "- [List key segments]\n\n"
-                "## Recent Developments\n"
-                "- [List recent news]\n"
-                "```\n\n"
-                "2. For non-public entities:\n"
-                "```\n"
-                "# [ENTITY NAME]: [ENTITY TYPE]\n\n"
-                "## Overview\n"
-                "[Brief description, 2-3 sentences]\n\n"
-                "## Key Research & Resources\n"
-                "- Research Papers: [List notable papers]\n"
-                "- Technical Documentation: [List key resources]\n"
-                "- Community Insights: [Reddit, Quora, social media highlights]\n\n"
-                "## Industry Position\n"
-                "- Competitors: [List main competitors]\n"
-                "- Market Focus: [Describe target market/users]\n\n"
-                "## Technical Analysis\n"
-                "- [Key technical aspects]\n\n"
-                "## Media Coverage\n"
-                "- [Notable mentions in publications]\n"
-                "```\n\n"
-                "Ensure your analysis is comprehensive but concise. Always provide valuable information regardless of entity type."
-            )
-            
-            # Create messages array
-            messages = [system_message, user_message]
+            # Pick a model and token budget from cheap page signals
+            text_length = data.get('textLength')
+            route_decision = research_router.route(PageSignals(
+                url=url,
+                page_text_length=text_length if isinstance(text_length, int) else None,
+                domain_cached=domain in analysis_cache.domains,
+                title=data.get('title')),
+                priority=priority,
+                client=client)
             
-            print("Sending URL analysis request to Groq API...")
+            # Fill the precompiled research prompt, checking it fits the
+            # model context and the per-minute token budget
+            max_tokens = route_decision.route.max_tokens
+            configuration = replace(analysis_configuration, max_tokens=max_tokens)
+            required = ModelCapabilities()
+            template = STOCK_RESEARCH_PROMPT
+            if structured:
+                # JSON mode answer in a fixed schema, validated once below
+                configuration = replace(
+                    configuration,
+                    max_tokens=min(max_tokens, STRUCTURED_MAX_TOKENS),
+                    response_format={"type": "json_object"})
+                required = ModelCapabilities(json_mode=True)
+                template = STRUCTURED_RESEARCH_PROMPT
+            messages, reservation = prepare_prompt(
+                template,
+                configuration.max_tokens,
+                model_name=route_decision.route.model_name,
+                required=required,
+                url=clean_url)
             
-            # Use appropriate model for text analysis
-            groq_api_wrapper.configuration.model = "llama-3.3-70b-versatile"
+            print("Sending URL analysis request to model backend...")
             
-            # Get completion from Groq
-            result = groq_api_wrapper.create_chat_completion(messages)
+            # Use the routed model, on whichever backend is fastest
+            routed = run_model_request(
+                supersession_key,
+                messages,
+                configuration,
+                reservation,
+                priority=priority,
+                required=required,
+                model_name=route_decision.route.model_name)
+            result = routed.result
+            print(f"Served by {routed.backend_name}/{routed.model} in {routed.latency_seconds:.2f}s")
             
             # Extract the response content
             if hasattr(result, 'choices') and len(result.choices) > 0:
                 analysis_text = result.choices[0].message.content
-                print(f"Successfully received URL analysis from Groq API")
+                print(f"Successfully received URL analysis from {routed.backend_name}")
+                research_router.record(
+                    route_decision,
+                    routed.latency_seconds,
+                    get_usage_tokens(result)[1],
+                    analysis_text,
+                    configuration.response_format)
                 
-                # Save to cache
-                analyzed_urls[clean_url] = analysis_text
+                if structured:
+                    # Validate once; only the compact structured form is kept
+                    try:
+                        analysis_value = parse_structured_analysis(analysis_text).to_dict()
+                    except StructuredAnalysisError as e:
+                        print(f"Invalid structured analysis: {str(e)}")
+                        return failure_response(
+                            failure_cache.record_error(failure_key, e))
+                else:
+                    analysis_value = analysis_text
                 
-                # Save cache to file for persistence
-                try:
-                    with open('url_analysis_cache.json', 'w') as f:
-                        json.dump(analyzed_urls, f)
-                except Exception as e:
-                    print(f"Error saving cache: {str(e)}")
+                # Save to cache, which also persists it to file
+                store_research_analysis(clean_url, analysis_value)
+                failure_cache.clear(failure_key)
+                record_history(clean_url, 'research', routed)
                 
-                return jsonify({
-                    "success": True,
-                    "analysis": analysis_text
-                })
+                return analysis_response(domain, analysis_value, structured)
             else:
                 error_msg = "Unexpected response format from Groq API"
                 print(error_msg)
-                return jsonify({
-                    "success": False, 
-                    "analysis": f"Error: {error_msg}"
-                })
+                return failure_response(failure_cache.record(
+                    failure_key, INVALID_OUTPUT, error_msg))
                 
+        except concurrent.futures.CancelledError:
+            print("Model request superseded by a newer one from the same client")
+            return superseded_response()
+        except PromptBudgetError as e:
+            print(f"Prompt rejected before sending: {str(e)}")
+            return jsonify({
+                "success": False,
+                "analysis": f"Error: {str(e)}"
+            })
         except Exception as e:
             error_detail = str(e)
             stack_trace = traceback.format_exc()
@@ -385,107 +995,14 @@ def stock_research():
             print(stack_trace)
             
             # Return the error in the response
-            return jsonify({
-                "success": False,
-                "analysis": f"Error analyzing URL: {error_detail}"
-            })
+            return failure_response(failure_cache.record_error(failure_key, e))
     
     # Fallback to improved mock response
     print("Using mock response for URL analysis (Groq API unavailable)")
     time.sleep(1)  # Simulate processing time
     
-    # Generate an enhanced custom mock response based on the domain
-    mock_response = ""
-    
-    if "nvidia.com" in domain:
-        mock_response = """# NVDA: NVIDIA Corporation
-
-## Company Overview
-NVIDIA is a global technology company specializing in GPUs, AI, and accelerated computing solutions.
-
-**Exchange:** NASDAQ
-**Industry:** Semiconductors, Computer Hardware
-
-## Recent SEC Filings
-- Most recent 10-K: February 21, 2024 (FY ended January 28, 2024) - Record revenue of $60.92B, up 126% from previous year
-- Most recent 10-Q: November 21, 2023 (Q3 FY 2024) - Revenue of $18.12B, up 206% from previous year
-- Recent 8-K: February 21, 2024 - Announcing Q4 and FY 2024 financial results
-
-## Financial Highlights
-- Revenue: $60.92 billion (FY 2024)
-- Net Income: $29.76 billion (FY 2024)
-- Gross Margin: 74.2% (FY 2024)
-- EPS: $12.03 (FY 2024)
-- Market Capitalization: ~$2.2 trillion
-
-## Business Segments
-- Data Center (AI, Cloud Computing)
-- Gaming (GeForce GPUs)
-- Professional Visualization (Workstation Graphics)
-- Automotive (Self-driving Vehicle Technology)
-
-## Recent Developments
-- Released Blackwell GPU architecture for AI computing
-- Expanding manufacturing partnerships to meet AI chip demand
-- Announced new enterprise AI solutions and partnerships
-- Continuing development of omniverse platform for industrial metaverse applications"""
-    
-    elif "python.org" in domain:
-        mock_response = """# Python Software Foundation: Non-profit Organization
-
-## Overview
-Python.org is the official website of the Python programming language, maintained by the Python Software Foundation (PSF). Python is one of the world's most popular programming languages, known for its readability and versatility.
-
-## Key Research & Resources
-- Research Papers: "Python in Scientific Computing" (Nature Methods), "Python in Data Science" (Various academic publications)
-- Technical Documentation: Comprehensive Python Language Reference, Library References, Python Enhancement Proposals (PEPs)
-- Community Insights: r/Python (960K+ members), extensive Stack Overflow presence (1.9M+ questions), active Python Discord communities
-
-## Industry Position
-- Competitors: Other programming languages (JavaScript, Java, C++, R, Go)
-- Market Focus: Developers, data scientists, educators, researchers, enterprise organizations
-
-## Technical Analysis
-- Current stable release: Python 3.12
-- Key features: Dynamic typing, comprehensive standard library, extensive third-party package ecosystem
-- Implementation variants: CPython (standard), PyPy, Jython, IronPython
-- Growing applications in AI/ML, data science, web development, automation, and systems programming
-
-## Media Coverage
-- Featured in IEEE Spectrum's top programming languages
-- Regular coverage in TechCrunch, The Verge, and technology publications
-- Highlighted in academic journals for scientific computing applications
-- Frequently mentioned in business publications for enterprise adoption"""
-    
-    elif "claude.ai" in domain:
-        mock_response = """# Anthropic: Private AI Company
-
-## Overview
-Claude.ai is the website for Claude, an AI assistant developed by Anthropic. Anthropic is a private AI safety company founded in 2021 focused on developing reliable, interpretable, and steerable AI systems.
-
-## Key Research & Resources
-- Research Papers: "Constitutional AI" (2022), "Training language models to follow instructions" (2022), "Discovering Language Model Behaviors" (2023)
-- Technical Documentation: Claude system cards, model specifications, safety benchmarking reports
-- Community Insights: r/AnthropicAI (40K+ members), popular discussions on Hacker News and AI forums
-
-## Industry Position
-- Competitors: OpenAI (ChatGPT), Google (Bard/Gemini), Cohere, Microsoft
-- Market Focus: Enterprise AI solutions, researchers, developers, general consumers
-
-## Technical Analysis
-- Current models: Claude 3 family (Haiku, Sonnet, Opus)
-- Key capabilities: Natural language understanding, contextual comprehension, reduced hallucinations
-- Technical approach: Constitutional AI methodology, RLHF, frontier model safety research
-- API availability with extensive documentation for developers
-
-## Media Coverage
-- Featured in New York Times, Wall Street Journal, MIT Technology Review
-- Significant venture funding rounds reported in TechCrunch and Bloomberg
-- Academic citations in AI safety and alignment literature
-- Growing presence in enterprise AI adoption discussions"""
-    
-    else:
-        mock_response = f"""# {domain}: General Website
+    # Well-known domains were answered from the entity table above
+    mock_response = f"""# {domain}: General Website
 
 ## Overview
 This website does not appear to be associated with a publicly traded company. After thorough analysis, I could not definitively determine the nature of this entity based on the URL alone.
@@ -510,30 +1027,454 @@ This website does not appear to be associated with a publicly traded company. Af
 For more accurate analysis, additional information about the website or organization would be needed."""
     
     # Save this enhanced mock response to the cache
-    analyzed_urls[clean_url] = mock_response
+    store_research_analysis(clean_url, mock_response)
+    record_history(clean_url, 'research')
+    
+    return analysis_response(domain, mock_response, structured)
+
+
+def prefetch_research(cache_key, client, analysis_format=None):
+    """
+    Research a URL in the background as the work of the client that asked
+    for it, in the format it renders, returning whether it succeeded
+    """
+    with app.app_context():
+        response = research_response(
+            {'url': cache_key, 'format': analysis_format},
+            client,
+            '/prefetch',
+            BATCH)
+    return bool(response.get_json().get('success'))
+
+# URLs whose research is generated ahead of their first visit, one at a time,
+# round robin across clients, and only while no interactive request runs and
+# the token budget has room. The model calls count against each client's
+# quotas like its own requests'.
+MAX_PREFETCH_URLS = 500
+prefetch_queue = PrefetchQueue(
+    prefetch_research,
+    rate_limiter=token_rate_limiter,
+    max_queued=10000,
+    max_queued_per_client=MAX_PREFETCH_URLS)
+
+INTERACTIVE_PATHS = (
+    '/analyze-screenshot',
+    '/analyze-page',
+    '/analyze-page-update',
+    '/stock-research')
+
+# Requests counted against their client's limit of requests in flight
+CLIENT_LIMITED_PATHS = INTERACTIVE_PATHS + ('/prefetch',)
+
+@app.before_request
+def start_interactive_request():
+    if request.path in CLIENT_LIMITED_PATHS:
+        client = get_client_id()
+        if not client_quotas.start_request(client):
+            response = jsonify({
+                "success": False,
+                "analysis": "Error: Too many requests in flight from this client",
+                "retryAfter": 1
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+            return response
+        g.client = client
+    if request.path in INTERACTIVE_PATHS:
+        g.interactive = True
+        prefetch_queue.interactive_started()
+
+@app.teardown_request
+def finish_interactive_request(exception=None):
+    if g.pop('interactive', False):
+        prefetch_queue.interactive_finished()
+    client = g.pop('client', None)
+    if client is not None:
+        client_quotas.finish_request(client)
+
+@app.route('/prefetch', methods=['GET', 'POST'])
+def prefetch():
+    """
+    Queue research of the URLs in "urls", for example all open tabs, to
+    warm the cache in "format" (as for /stock-research). URLs already
+    cached, answered by the entity table or queued are skipped. GET
+    reports the queue.
+    """
+    if request.method == 'GET':
+        return jsonify({"success": True, "prefetch": prefetch_queue.report()})
+    
+    data = request.json or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list):
+        return jsonify({"success": False, "analysis": "Error: No URL list provided"})
+    if len(urls) > MAX_PREFETCH_URLS:
+        return jsonify({
+            "success": False,
+            "analysis": f"Error: At most {MAX_PREFETCH_URLS} URLs can be prefetched at once"
+        })
+    
+    counts = {"queued": 0, "cached": 0, "known": 0, "duplicates": 0, "invalid": 0}
+    keys = []
+    for url in urls:
+        cache_key = get_cache_key(url) if isinstance(url, str) else ''
+        domain = urllib.parse.urlparse(cache_key).netloc
+        if not cache_key.startswith(('http://', 'https://')) or not domain:
+            counts["invalid"] += 1
+        elif cache_key in analysis_cache:
+            counts["cached"] += 1
+        elif domain_entities.lookup(domain) is not None:
+            counts["known"] += 1
+        elif cache_key in keys or cache_key in prefetch_queue:
+            counts["duplicates"] += 1
+        else:
+            keys.append(cache_key)
+    counts["queued"] = prefetch_queue.submit(
+        keys, client=get_client_id(), analysis_format=data.get('format'))
+    # The rest did not fit in the queue
+    counts["dropped"] = len(keys) - counts["queued"]
+    return jsonify({
+        "success": True,
+        **counts,
+        "prefetch": prefetch_queue.report()
+    })
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler():
+    """Report model calls queued, running and their queue times per priority class"""
+    return jsonify({
+        "success": True,
+        "scheduler": model_scheduler.report()
+    })
+
+@app.route('/clients', methods=['GET'])
+def clients():
+    """Report requests, model calls and tokens per client, heaviest first"""
+    return jsonify({
+        "success": True,
+        "clients": client_quotas.report()
+    })
+
+@app.route('/token-budget', methods=['GET'])
+def token_budget():
+    """Report usage of the per-minute token and request budget"""
+    return jsonify({
+        "success": True,
+        "budget": token_rate_limiter.report()
+    })
+
+@app.route('/supersession', methods=['GET'])
+def supersession():
+    """Report how many superseded model calls were cancelled"""
+    return jsonify({
+        "success": True,
+        "supersession": request_supersession.report()
+    })
+
+@app.route('/routes', methods=['GET'])
+def routes():
+    """Report latency/quality tradeoffs measured per research route"""
+    return jsonify({
+        "success": True,
+        "routes": research_router.report()
+    })
+
+@app.route('/analysis-modes', methods=['GET'])
+def analysis_modes():
+    """Report latency and cost of text-first and vision page analysis"""
+    return jsonify({
+        "success": True,
+        "modes": page_mode_selector.report()
+    })
+
+@app.route('/page-sessions', methods=['GET'])
+def page_session_report():
+    """Report full, incremental and skipped re-analyses of changing pages"""
+    return jsonify({
+        "success": True,
+        "sessions": page_sessions.report()
+    })
+
+@app.route('/near-duplicates', methods=['GET'])
+def near_duplicates():
+    """Report page analyses reused for near-duplicate page text"""
+    return jsonify({
+        "success": True,
+        "near_duplicates": page_fingerprints.report()
+    })
+
+@app.route('/entities', methods=['GET'])
+def entities():
+    """Report the domain entity table and how often it answered"""
+    return jsonify({
+        "success": True,
+        "entities": domain_entities.report()
+    })
+
+@app.route('/search', methods=['GET'])
+def search():
+    """
+    Research analyses and page text matching ?q=, ranked by BM25 with a
+    snippet each. ?kind=research or ?kind=page limits the results to one
+    kind, and ?k= sets how many are returned (10 by default).
+    """
+    query = request.args.get('q', '')
+    kind = request.args.get('kind', '')
+    k = min(request.args.get('k', 10, type=int), 100)
+    if not query.strip():
+        return jsonify({"success": False, "analysis": "Error: No query provided"})
+    if kind not in ('', 'research', 'page'):
+        return jsonify({"success": False, "analysis": f"Error: Unknown kind {kind}"})
     
-    # Try to save to file
+    start_time = time.perf_counter()
+    hits = search_index.search(query, k=k, prefix=f"{kind}:" if kind else "")
+    results = []
+    for hit in hits:
+        hit_kind, _, url = hit.key.partition(":")
+        results.append({
+            "kind": hit_kind,
+            "url": url,
+            "score": round(hit.score, 3),
+            "snippet": hit.snippet
+        })
+    return jsonify({
+        "success": True,
+        "results": results,
+        "took_ms": round((time.perf_counter() - start_time) * 1000, 2)
+    })
+
+def get_time_argument(name, default):
+    """A time query argument, as Unix seconds or an ISO 8601 date and time"""
+    value = request.args.get(name)
+    if not value:
+        return default
     try:
-        with open('url_analysis_cache.json', 'w') as f:
-            json.dump(analyzed_urls, f)
-    except Exception as e:
-        print(f"Error saving cache: {str(e)}")
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def get_history_range():
+    """
+    The ?start= and ?end= of a history query, the last 7 days by default.
+    Raises ValueError for ranges that are reversed or reach beyond now.
+    """
+    now = time.time()
+    end = get_time_argument('end', now)
+    start = get_time_argument('start', end - 7 * 24 * 60 * 60)
+    if not (0 <= start <= end <= now + 24 * 60 * 60):
+        raise ValueError("History range must be from after 1970 to no later than tomorrow")
+    return start, end
+
+@app.route('/history', methods=['GET'])
+def history():
+    """
+    Analyses served between ?start= and ?end= (the last 7 days by default),
+    newest first, optionally for one ?domain= or ?kind= only.
+    """
+    try:
+        start, end = get_history_range()
+    except ValueError as e:
+        return jsonify({"success": False, "analysis": f"Error: {str(e)}"})
+    limit = min(request.args.get('limit', 100, type=int), 10000)
+    events = analysis_history.query(
+        start,
+        end,
+        domain=request.args.get('domain'),
+        kind=request.args.get('kind'),
+        limit=limit)
+    return jsonify({
+        "success": True,
+        "events": [event.to_dict() for event in events]
+    })
+
+@app.route('/history/summary', methods=['GET'])
+def history_summary():
+    """
+    Analyses between ?start= and ?end= grouped ?by= domain (default), kind
+    or model, with their model calls, average latency and tokens.
+    """
+    try:
+        start, end = get_history_range()
+        aggregates = analysis_history.aggregate(
+            start,
+            end,
+            by=request.args.get('by', 'domain'),
+            domain=request.args.get('domain'),
+            kind=request.args.get('kind'))
+    except ValueError as e:
+        return jsonify({"success": False, "analysis": f"Error: {str(e)}"})
+    return jsonify({
+        "success": True,
+        "summary": [aggregate.to_dict() for aggregate in aggregates]
+    })
+
+@app.route('/page-text', methods=['GET'])
+def page_text():
+    """
+    The text of ?url= sent by this client as of ?at= (the latest text by
+    default), with the times of the snapshots kept for the page.
+    """
+    url = request.args.get('url')
+    if not url:
+        return jsonify({"success": False, "analysis": "Error: No URL provided"})
+    try:
+        timestamp = get_time_argument('at', None)
+    except ValueError as e:
+        return jsonify({"success": False, "analysis": f"Error: {str(e)}"})
+    key = (get_client_id(), get_cache_key(url))
+    text = page_text_history.text_at(key, timestamp)
+    if text is None:
+        return jsonify({"success": False, "analysis": f"Error: No text of {url} recorded by then"})
+    return jsonify({
+        "success": True,
+        "text": text,
+        "snapshots": page_text_history.timeline(key),
+        "history": page_text_history.report()
+    })
+
+@app.route('/screenshots', methods=['GET'])
+def screenshots():
+    """Recently archived screenshots, newest first, optionally for one ?url="""
+    if screenshot_archive is None:
+        return jsonify({"success": False, "analysis": "Error: Screenshot archive is not enabled"})
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    return jsonify({
+        "success": True,
+        "captures": [
+            capture.to_dict()
+            for capture in screenshot_archive.captures(request.args.get('url'), limit)],
+        "archive": screenshot_archive.report()
+    })
+
+@app.route('/screenshots/<digest>', methods=['GET'])
+def screenshot_frame(digest):
+    """An archived screenshot by the digest its captures refer to"""
+    path = screenshot_archive.frame_path(digest) if screenshot_archive else None
+    if path is None or not path.exists():
+        return jsonify({"success": False, "analysis": "Error: No such screenshot"}), 404
+    return send_file(path)
+
+@app.route('/screenshots/<digest>/thumbnail', methods=['GET'])
+def screenshot_thumbnail(digest):
+    path = screenshot_archive.thumbnail_path(digest) if screenshot_archive else None
+    if path is None:
+        return jsonify({"success": False, "analysis": "Error: No such thumbnail"}), 404
+    return send_file(path, mimetype='image/jpeg')
+
+@app.route('/similar-entities', methods=['GET'])
+def similar_entities():
+    """
+    Cached research analyses most similar to the one of ?url=, or to the
+    free text ?q=, best first.
+    """
+    url = request.args.get('url')
+    query = request.args.get('q')
+    k = request.args.get('k', 5, type=int)
+    cache_key = get_cache_key(url) if url else None
+    if cache_key:
+        vector = analysis_vectors.get(cache_key)
+        if vector is None:
+            return jsonify({"success": False, "analysis": f"Error: No cached analysis for {cache_key}"})
+    elif query:
+        vector = analysis_embedder.embed([query])[0]
+    else:
+        return jsonify({"success": False, "analysis": "Error: Provide url or q"})
     
+    entities = []
+    for match in analysis_vectors.search(vector, k=k, exclude_keys=(cache_key,) if cache_key else ()):
+        value = analysis_cache.get(match.key)
+        entities.append({
+            "url": match.key,
+            "score": round(match.score, 3),
+            "entity": value.get("entity") if isinstance(value, dict) else None
+        })
+    return jsonify({
+        "success": True,
+        "entities": entities,
+        "index": analysis_vectors.report()
+    })
+
+@app.route('/analysis-cache', methods=['GET'])
+def analysis_cache_report():
+    """Report the size and compression of the research and page analysis caches"""
+    return jsonify({
+        "success": True,
+        "research": analysis_cache.report(),
+        "pages": page_analysis_cache.report()
+    })
+
+@app.route('/failures', methods=['GET'])
+def failures():
+    """Report failed analyses remembered by error class"""
     return jsonify({
         "success": True,
-        "analysis": mock_response
+        "failures": failure_cache.report()
+    })
+
+@app.route('/completion-cache', methods=['GET'])
+def completion_cache():
+    """Report hits and misses of the completion cache, if enabled"""
+    if groq_api_wrapper is None or groq_api_wrapper.completion_cache is None:
+        return jsonify({"success": False, "analysis": "Error: Completion cache is not enabled"})
+    return jsonify({
+        "success": True,
+        "completion_cache": groq_api_wrapper.completion_cache.report()
+    })
+
+@app.route('/backends', methods=['GET'])
+def backends():
+    """Report registered model backends with measured latency and cost"""
+    return jsonify({
+        "success": True,
+        "backends": model_registry.report()
     })
 
 
 # Try to load previous cache on startup
 try:
-    if Path('url_analysis_cache.json').exists():
-        with open('url_analysis_cache.json', 'r') as f:
-            analyzed_urls = json.load(f)
-            print(f"Loaded {len(analyzed_urls)} cached URL analyses")
+    if analysis_cache.load():
+        print(f"Loaded {len(analysis_cache)} cached URL analyses")
+        items = analysis_cache.items()
+        vectors = analysis_embedder.embed(
+            [describe_analysis(key, value) for key, value in items])
+        for (key, _), vector in zip(items, vectors):
+            analysis_vectors.add(key, vector)
+    if search_index.load():
+        print(f"Loaded {len(search_index)} searchable documents")
+    # Analyses cached before the search index existed
+    for key, value in analysis_cache.items():
+        if f"research:{key}" not in search_index:
+            index_research_text(key, value)
 except Exception as e:
     print(f"Error loading URL cache: {str(e)}")
 
+try:
+    if screenshot_archive is not None:
+        print(f"Archive holds {screenshot_archive.load()} screenshots")
+except Exception as e:
+    print(f"Error loading screenshot archive: {str(e)}")
+
+try:
+    history_events = analysis_history.load()
+    if history_events:
+        print(f"Reopened {history_events} history events of today")
+except Exception as e:
+    print(f"Error loading analysis history: {str(e)}")
+
+try:
+    print(f"Loaded {domain_entities.load()} known entities")
+except Exception as e:
+    print(f"Error loading entity table: {str(e)}")
+
+try:
+    if page_analysis_cache.load():
+        print(f"Loaded {len(page_analysis_cache)} cached page analyses")
+    if page_fingerprints.load():
+        print(f"Loaded {len(page_fingerprints)} page fingerprints")
+    if page_vectors.load():
+        print(f"Loaded {len(page_vectors)} page text embeddings")
+except Exception as e:
+    print(f"Error loading page analysis cache: {str(e)}")
+
 if __name__ == '__main__':
     print(f"Repository root path: {repo_root}")
     print("Starting mock analysis server on http://localhost:5000")